@@ -10,12 +10,62 @@
 # ************************************************************************/
 
 
-import random, os, tempfile, textwrap, codecs, re, locale, sys, os.path, time, re
+import random, os, textwrap, codecs, re, locale, sys, os.path, time, re
+import itertools, contextlib, mmap, struct, array, importlib, collections, math, io, bisect, operator
 from xml.sax.handler import ContentHandler
-import xml.sax
-import spss, spssaux
-from spssaux import _smartquote as sq
-from extension import Template, Syntax, processcmd
+import xml.sax, xml.parsers.expat
+
+class LazyModule(object):
+    """Stand-in for a module that is imported when it is first used
+    
+    The Statistics modules are not needed to generate syntax or sav files,
+    so they are only imported by the functions that talk to Statistics.
+    Other modules that only some options use are loaded the same way to
+    keep startup fast."""
+    
+    def __init__(self, name):
+        self._name = name
+    
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._name.rpartition(".")[2]] = module
+        return getattr(module, attr)
+
+spss = LazyModule("spss")
+spssaux = LazyModule("spssaux")
+# modules only some of the options need
+tempfile = LazyModule("tempfile")
+shutil = LazyModule("shutil")
+hashlib = LazyModule("hashlib")
+pickle = LazyModule("pickle")
+glob = LazyModule("glob")
+csv = LazyModule("csv")
+json = LazyModule("json")
+tracemalloc = LazyModule("tracemalloc")
+zipfile = LazyModule("zipfile")
+copy = LazyModule("copy")
+datetime = LazyModule("datetime")
+saxutils = LazyModule("xml.sax.saxutils")
+# optional: the validator uses it for fixed format data if it is installed
+numpy = LazyModule("numpy")
+
+def sq(s):
+    """Return s quoted for syntax
+    
+    Inside Statistics this is spssaux._smartquote.  Otherwise s is enclosed
+    in double quotes with any double quotes in it doubled."""
+    
+    global sq
+    if "spss" in sys.modules:
+        from spssaux import _smartquote as sq
+    else:
+        sq = smartquote
+    return sq(s)
+
+def smartquote(s):
+    """Return s in double quotes with internal double quotes doubled"""
+    
+    return '"' + s.replace('"', '""') + '"'
 
 """STATS GET TRIPLES extension command"""
 
@@ -25,14 +75,52 @@ __version__=  '1.1.1'
 # history
 # 31-jan-2014 Original version
 # 26-mar-2014 Add option for automatic score recode
+# 18-oct-2026 Add LOADER=NATIVE for reading the data in Python
+# 18-oct-2026 Add MREXPAND option for csv multiple response sets
+# 18-oct-2026 Add PARSECACHE option to reuse parsed metadata
+# 18-oct-2026 Add CACHE option to reuse datasets saved from earlier runs
+# 18-oct-2026 Generate, write and submit syntax as a stream
+# 18-oct-2026 Add COALESCE option to combine dictionary commands
+# 18-oct-2026 Support hierarchy files as linked or flattened datasets
+# 18-oct-2026 Convert a directory or wildcard set of studies in parallel
+# 18-oct-2026 Add TIMING option to report time and memory by phase
+# 18-oct-2026 Add MAXDATALENGTH=AUTO to measure the record length
+# 18-oct-2026 Add VALIDATE option to check the data against the metadata
+# 18-oct-2026 Add SAVFILE to write a sav file directly without Statistics
+# 18-oct-2026 Add COLUMNCACHE to keep decoded data in memory mapped column files
+# 18-oct-2026 Add PARSER=EXPAT for a faster metadata parser
+# 18-oct-2026 Compact variable model with shared value tables
+# 18-oct-2026 Add a command line entry point and import Statistics modules lazily
+# 18-oct-2026 Decode large data files in parallel shards
+# 18-oct-2026 Add CHECKPOINT to load only records appended since the last run
+# 18-oct-2026 Add VARIABLES to read only selected variables
+# 18-oct-2026 Add CASES and SAMPLE to read the first or a random sample of records
+# 18-oct-2026 Read gzip, bzip2, xz and zip compressed metadata and data files
+# 18-oct-2026 Add DATAENCODING=AUTO and named encodings, converting the data for syntax
+# 18-oct-2026 Add PROFILE and PROFILEFILE for frequencies and statistics computed during the load
+# 18-oct-2026 Add EXPORT to write the active dataset as Triple-S metadata and data
 
 helptext = """STATS GET TRIPLES METADATA="filespec DATA="filespec"
 SYNTAX = "syntaxfilespec" FILE=LOCALE or UTF8
+SAVFILE = "savfilespec"
 EXECUTE=YES or NO
 STRMVCODE = "string missing value code"
-MAXDATALENGTH = number
+MAXDATALENGTH = number or AUTO
+LOADER = SYNTAX or NATIVE
+CACHE = "directory" CACHESIZE = number CACHEAGE = number
+COLUMNCACHE = "directory"
+CHECKPOINT = "file"
+VARIABLES = variable list
+CASES = number SAMPLE = fraction or number SEED = number
+HIERARCHY = LINKED or FLAT WORKERS = number
 /OPTIONS MDVALLABELS = 'label for 0' 'label for 1'
 FULLLABELATTR= YES or NO REMOVEHTML=YES or NO SCORERECODE=YES or NO
+MREXPAND = IF or LOOP PARSER = SAX or EXPAT
+PARSECACHE = YES or NO PARSECACHESIZE = number
+COALESCE = YES or NO TIMING = YES or NO VALIDATE = YES or NO
+PROFILE = YES or NO PROFILEFILE = "file"
+/EXPORT METADATA = "file" DATA = "file" FORMAT = FIXED or CSV
+VARIABLES = variable list
 /HELP
 
 METADATA is the only required keyword.
@@ -47,29 +135,183 @@ the file, or both.
 
 Triple-S format requires two files.  METADATA specifies the
 xml metadata data that defines the formatting and any multiple
-response information.  HIERARCHY files are not supported.
+response information.  It may also be a hierarchy file.
+
+METADATA may also be a directory or a wildcard specification such
+as "c:/deliveries/*.sss" to convert several studies in one command.
+All the sss and xml files in a directory are converted.  The metadata
+is parsed and the syntax is generated for several studies at once in
+separate processes.  SYNTAX, if given, is then a directory where a
+syntax file named for each study is written.  With EXECUTE=YES, the
+datasets are created one at a time and each is named for its metadata
+file.  A study that fails does not stop the others, and a table
+summarizes the results.  DATA, CACHE and hierarchy files cannot be
+used in this mode.  WORKERS is the number of processes to use.  The
+default is the number of processors.  WORKERS also sets the number of processes that
+decode the data with LOADER=NATIVE or SAVFILE.  The data file is
+split into parts at record boundaries, and the parts are decoded in
+parallel and combined in record order.  By default, data files of
+64 MB or more use all the processors and smaller files are decoded
+in one process.
 
 DATA specifies the data file described by the format.  By
 default, the data file is assumed to have the same name and
 location as the metadata file and extension "txt".
 
+The metadata and data files may be compressed with gzip, bzip2
+or xz, with extension gz, bz2 or xz, and they are decompressed as they
+are read.  They may also be in a zip archive.  Specify a file in an
+archive as "c:/deliveries/survey.zip/survey.sss", or just the archive
+if it holds only one sss or xml file.  For a compressed metadata file,
+the default data file is compressed the same way if there is one, as
+in survey.txt.gz for survey.sss.gz, and in a zip archive the default is
+the txt file of the same name or the only other file in the archive.
+Syntax can only read a plain data file, so for SYNTAX and
+LOADER=SYNTAX a compressed data file is decompressed into a directory
+under the system temporary directory, where it is kept for reuse.  At
+most 2000 MB are kept, and the least recently used files are removed
+first.  The native loader, SAVFILE and VALIDATE read the compressed
+file directly, but the data are decoded in a single process, and
+CHECKPOINT cannot be used.
+
 DATAENCODING specifies that the data are encoded in UTF8 or LOCALE.
 The Triple-S standard expects cp 1252 or equivalent, but other
 encodings might be encountered in the wild.  The metadata file
-is expected to be in utf8.
+is expected to be in utf8.  DATAENCODING may also name an encoding
+such as CP1252 or ISO8859_15, or be AUTO to detect it.  AUTO reads
+a sample from the start of the data file.  If it is valid UTF-8,
+the data are taken as UTF8.  Otherwise the encoding in the xml
+declaration of the metadata file is used, and failing that cp 1252.
+For SYNTAX and LOADER=SYNTAX, data in an encoding other than the
+session encoding are converted a block at a time into a directory
+under the system temporary directory, as for compressed files.  In
+fixed format, character fields are widened where their text could
+take more bytes in the session encoding, so every field keeps its
+position.  The native loader, SAVFILE and VALIDATE decode the data
+directly.
 
 If the record length is greater than 50000, use
 MAXRECORDLENGTH = number.  Otherwise, bytes beyond that value
 are lost.  It does not matter if the stated length is greater
 than the actual.
 
+MAXDATALENGTH=AUTO reads the data file once to find the longest
+record and uses that length.  For fixed format data, a warning is
+given if any records are longer than the widest variable position
+in the metadata.
+
 SYNTAX optionally specifies the name of a syntax file that will
 contain the syntax to read the data file.
 
+SAVFILE specifies a sav file to be written directly from the
+metadata and data without using Statistics, so conversions can run
+where Statistics is not running.  The cases are compressed and the
+file includes the variable and value labels, missing values, custom
+attributes, documents, weight and multiple response sets that the
+syntax would create.  Filters that are not simple comparisons, and
+filters on multiple response sets, cannot be computed this way, and
+a warning lists them.  SAVFILE cannot be used with hierarchy files
+or batch mode.
+
 EXECUTE specifies whether the syntax (saved or not) should
 be executed.
 
-At least one of SYNTAX and EXECUTE=YES must be specified.
+At least one of SYNTAX, SAVFILE and EXECUTE=YES must be specified.
+
+LOADER specifies how the data are read when EXECUTE=YES.  SYNTAX,
+the default, submits the generated DATA LIST or GET DATA syntax.
+NATIVE reads and decodes the records in Python and creates a new
+dataset directly.  Multiple response set members, filter missing
+values and score recodes are computed as each record is read, so
+no transformation passes over the data are needed.  Filters that
+are not simple comparisons are still applied with syntax.
+MAXDATALENGTH is ignored with LOADER=NATIVE.
+
+CACHE specifies a directory for saving the datasets created with
+EXECUTE=YES.  Each dataset is saved as a compressed sav file named
+by a hash of the metadata and data file contents and all the
+settings that affect the result.  If the same files are read again
+with the same settings, the saved file is opened with GET FILE
+instead of reading the data.  CACHESIZE is the maximum total size
+of the cached files in megabytes, and CACHEAGE is the number of
+days an unused file is kept.  The defaults are 2000 and 30.  The
+least recently used files are removed first.
+
+COLUMNCACHE specifies a directory for keeping the decoded data when
+they are read with LOADER=NATIVE or written with SAVFILE.  Each
+variable is stored in its own binary file in NumPy .npy format with
+a manifest.json file describing the variables, and the files for a
+study are in a directory named by a hash of the metadata and data
+file contents and the settings.  If the same files are read again,
+the column files are memory mapped and no text is parsed.  Numeric
+columns hold 8 byte floating point values with NaN for sysmis, and
+string columns hold UTF-8 text.  The files can also be read directly
+with numpy.load.  With VARIABLES, only the selected columns are read
+from the files stored by a run of all the variables, and a study that
+is not cached yet is read from the data file without being stored.
+CACHESIZE and CACHEAGE apply to this cache too.
+
+CHECKPOINT specifies a file that records how much of the data file
+has been loaded, so that a data file that grows by having records
+added to the end can be loaded again quickly.  The file holds the byte
+offset and number of records read, a hash of the data just before the
+offset and a key for the metadata and settings.  When the command is
+run again with the same file, only the records after the offset are
+read and they are added to the SAVFILE or, without SAVFILE, to the
+dataset created by the previous run with EXECUTE=YES and
+LOADER=NATIVE if it is still open.  If the metadata or settings have
+changed, the data file has been rewritten rather than added to, or
+the sav file or dataset does not match, everything is loaded again
+and a note says why.  With both SAVFILE and EXECUTE=YES, the sav file
+is opened when it has been updated.  The dataset cache and column cache
+are not used with CHECKPOINT.
+
+VARIABLES lists the variables to read, so that memory use and
+load time depend on the variables needed rather than on the size of
+the study.  Give variable names, idents, or ranges of either written
+as first TO last, for example VARIABLES = RESPID Q5 TO Q9 200 TO 250.
+A range of names includes the variables between them in metadata
+order, and a range of numbers also selects every variable with a
+numeric ident in that range.  A multiple response variable, or any of
+its set member names such as Q3_2, selects the whole set.  Variables
+named in the filter of a selected variable are added with a note.
+Only the selected variables are defined and read: other columns of
+fixed format records are skipped, and other csv fields are read as
+placeholders that are deleted at once or, with LOADER=NATIVE and
+SAVFILE, are not decoded.  Include the weight variable to keep the
+weight.  VARIABLES cannot be used with hierarchy files or batch mode.
+
+CASES is the number of records to read from the start of the data
+file.  With the native loader and SAVFILE, reading stops after that
+many records.  The generated syntax uses N OF CASES.
+
+SAMPLE reads a random sample of the records.  A value less than 1 is
+the fraction of records to keep, each record being kept with that
+probability, and a whole number is the exact number of records to
+choose.  With CASES, the sample is taken from the first CASES records.
+SEED is the random number seed, so the same seed chooses the same
+records again.  The default is 2000000.  With the native loader and
+SAVFILE, the sample is chosen as the file is read: the records that
+are not chosen are skipped by the file or csv reader without being
+decoded, so a small sample of a large file takes a fraction of the
+time of a full read.  The cases stay in file order.  The generated
+syntax uses SET SEED and SAMPLE, so Statistics reads all the
+records and chooses its own sample, which differs from the native
+one.  CASES and SAMPLE cannot be used with CHECKPOINT, hierarchy
+files or batch mode, and the column cache is not used with them.
+
+HIERARCHY specifies how a hierarchy file is read.  A hierarchy
+file lists the metadata files of the levels of a hierarchical survey
+and the link variables that connect each level to its parent.  The
+data file of each level is given by its record href or has the same
+name as its metadata file with extension txt.  DATA cannot be used
+with a hierarchy file.  LINKED, the default, creates a dataset for
+each level named by the level id.  FLAT creates a single dataset for
+the lowest level named by its id with "_flat" appended that also
+holds the variables of all the parent levels matched on the link
+variables.  FLAT requires a single chain of levels.  With
+LOADER=NATIVE and levels marked as ordered, the levels are merged as
+they are read without sorting.
 
 STRMVCODE optionally specifies the code to be used for
 string variable missing values.  The default action is
@@ -98,6 +340,105 @@ Multiple response variables are not recoded.
 The scores must be consistent with the variable type: a numeric
 variable cannot have string score values.
 
+MREXPAND specifies how the members of multiple response sets are
+created from the csv field that holds the whole set.  IF, the
+default, generates one IF command for each set member.  LOOP
+generates a VECTOR and LOOP structure for each set, so the number
+of transformation commands does not depend on the number of
+members.  The set members are created with format F.0 of the
+subfield width.  This option has no effect for fixed format files
+or with LOADER=NATIVE.
+
+PARSER specifies how the metadata file is read.  SAX, the default,
+uses the standard SAX parser.  EXPAT uses the expat parser directly
+with less work for each element and attribute, which is noticeably
+faster for very large metadata files.  The file is read in blocks,
+so memory use does not grow with its size, and a DTD reference is
+not read.  Both produce the same result.
+
+PARSECACHE=YES saves the parsed metadata in a cache directory
+under the system temporary directory and reuses it when the same
+metadata file is read again with the same REMOVEHTML and LANGUAGE
+settings.  The file size, modification time and content are all
+checked, so a changed file is always parsed again.  PARSECACHESIZE
+is the maximum total size of the cache in megabytes.  The default
+is 200.  The least recently used entries are removed first.
+
+COALESCE=YES combines the dictionary syntax for all the variables
+into a few multi-variable commands.  Variables with identical value
+labels, scores, text, missing value codes or recodes share one
+specification.  This greatly reduces the number of commands for
+surveys with many grid questions.  If filters are computed with
+syntax, the filter and recode commands stay in variable order.
+
+TIMING=YES displays a table of the time taken by each phase of
+the command: resolving file handles, parsing the metadata,
+detecting the data encoding, converting or decompressing the data
+file, measuring the record length, generating, writing and
+submitting the syntax, loading the data and using the dataset cache.  The table also shows the peak memory
+allocated by Python in each phase and counts of the variables, sets,
+syntax lines and commands, bytes written and cases.  Memory tracing
+slows the command somewhat.  The table can be captured with OMS.
+
+VALIDATE=YES checks the data file against the metadata before the
+dataset is created and displays a table of the problems found:
+codes that are not defined, values out of range or not numeric,
+multiple dichotomy fields that are not bitstrings of the defined
+length, spread codes that are not defined, csv records with the
+wrong number of fields, and fixed format records too short for the
+variable positions.  For each problem the number of records and the
+first few record numbers are shown.  The data are still read.
+VALIDATE does not apply to hierarchy files or batch mode.
+The data are checked a chunk of records at a time, one variable at
+a time, and each distinct value in a chunk is tested only once.  If
+NumPy is installed, an uncompressed fixed format file is memory mapped
+and checked with array operations at about seven million variable
+values a second, so 10 million records of 100 variables take two to
+three minutes.  Otherwise, and for csv or compressed files, fixed format
+data are checked at about two million values a second and csv data at
+about half that, so the same file takes roughly ten minutes.
+
+PROFILE=YES displays tables describing the data, and PROFILEFILE
+writes the same information to a json file, so FREQUENCIES and
+DESCRIPTIVES are not needed after the data are loaded.  There are
+frequencies of the single and logical variables; the count, missing
+count, minimum, maximum, sum and mean of the quantity variables; the
+responses and responding cases of the multiple response sets; and the
+number of cases each filter sets to missing.  The statistics are
+accumulated while the native loader or SAVFILE reads the data, so no
+extra pass is made.  With LOADER=SYNTAX the data file is read once in
+Python for the profile.  At most 1000 distinct values are counted for
+each variable or spread set, and any further values are counted as other.
+Filters that only syntax can compute are not applied to the profile.
+PROFILE does not apply to hierarchy files, batch mode or CHECKPOINT.
+
+EXPORT writes the active dataset as a Triple-S study, the reverse of
+the import.  METADATA and DATA specify the xml file and the data file;
+if DATA is omitted, the data file is named from the metadata file in the
+same way as on import.  FORMAT=FIXED, the default, writes fixed width
+records, and FORMAT=CSV writes comma separated records.  VARIABLES
+limits the export to a list of variables, and TO and ALL may be used.
+EXPORT cannot be combined with METADATA on the main subcommand, and
+nothing is loaded.  DATAENCODING sets the encoding of the data file;
+UTF8 or AUTO write utf-8.  The metadata file is always utf-8.
+String variables with value labels are exported as single variables
+with literal codes, and other strings as character.  Date and time
+formats are exported as date and time variables.  Numeric variables
+with integer value labels and no decimals are exported as single, and
+other numeric variables as quantity.  Multiple dichotomy sets are
+exported as multiple variables, including the unlabelled members of a
+NAME_1 to NAME_n run, and multiple category sets as spread variables.
+Sets that are not numeric, not fully selected or that overlap another
+set are skipped with a note, and their members are exported separately.
+Labels are taken from the FullLabelText attribute when it is present,
+and the score and Text attributes written on import are restored.
+The cases are read through a cursor in batches and written as they are
+read, so memory use does not depend on the number of cases.  The
+metadata are written after the data, because the ranges of the
+quantity variables are taken from the data.  A value that does not fit
+the width of its format is an error.  Filters are not exported; the
+data already hold the missing codes.
+
 /HELP displays this help and does nothing else.
 
 This command assumes that the xml file conforms to the
@@ -137,11 +478,27 @@ where comma is the decimal character, you may have to change your
 Statistics locale in order to read the file.
 
 Language tagged strings are not currently supported.
+
+Syntax and sav files can also be created without Statistics by
+running the module from the command line, for example
+    python -m STATS_GET_TRIPLES c:/data/mysurvey.sss --syntax c:/data/mysurvey.sps --spssver 25
+--spssver is the Statistics version the syntax is for, and --unicode=no
+writes the syntax in the current locale encoding instead of UTF-8.
+The other options correspond to the keywords above.  Use --help for
+the list.  Hierarchy files and directories of studies are not
+supported from the command line.
 """
 
-def dotriples(metadatafile, syntax=None, data=None, language=None, 
+def dotriples(metadatafile=None, syntax=None, data=None, language=None, 
         execute=False, dataencoding="locale", strmvcode = "", maxdatalength=50000,
-        removehtml=False, fulllabelattr=True, mdvallabels=["No", "Yes"], scorerecode=False):
+        loader="syntax",
+        removehtml=False, fulllabelattr=True, mdvallabels=["No", "Yes"], scorerecode=False,
+        mrexpand="if", parsecache=False, parsecachesize=200,
+        cache=None, cachesize=2000, cacheage=30, coalesce=False, hierarchy="linked",
+        workers=None, timing=False, validate=False, savfile=None, columncache=None,
+        parser="sax", checkpoint=None, variables=None, cases=None, sample=None, seed=None,
+        profile=False, profilefile=None, exportmetadata=None, exportdata=None, exportformat="fixed",
+        exportvariables=None):
     """Execute STATS GET TRIPLES"""
     
 # debugging
@@ -160,38 +517,637 @@ def dotriples(metadatafile, syntax=None, data=None, language=None,
     #except:
         #pass
 
-    if syntax is None and not execute:
-        raise ValueError(_("""Neither a syntax file output nor execution was specified: there is nothing to do."""))
-    fh = FileHandles()
-    metadatafile = fh.resolve(metadatafile)
-    if not syntax is None:
-        syntax = fh.resolve(syntax)
-    if data is not None:
-        data = fh.resolve(data)       
-    strmvcode = sq(strmvcode)  # default string missing code if values not supplied
-    if len(mdvallabels) != 2:
-        raise ValueError(_("""Exactly two labels must be supplied for multiple dichotomy set values"""))
-    mdsetvallabels = {0 : sq(mdvallabels[0]), 1: sq(mdvallabels[1])}
-    
-    # handler will hold the parsed information
-    handler = metadataHandler(removehtml=removehtml)
-
-    # Retrieve and parse the metadata
-    xml.sax.parse(metadatafile, handler)
+    if exportmetadata is not None:
+        if metadatafile is not None:
+            raise ValueError(_("""METADATA cannot be specified with EXPORT.  EXPORT writes the active dataset."""))
+        timer = PhaseTimer(timing)
+        try:
+            fh = FileHandles()
+            if exportdata is not None:
+                exportdata = fh.resolve(exportdata)
+            doexport(fh.resolve(exportmetadata), exportdata, exportformat, exportvariables,
+                dataencoding, timer)
+        finally:
+            timer.stop()
+            timer.display()
+        return
+    if metadatafile is None:
+        raise ValueError(_("""METADATA must be specified unless EXPORT is used"""))
+    if syntax is None and not execute and savfile is None:
+        raise ValueError(_("""Neither a syntax file output, a sav file nor execution was specified: there is nothing to do."""))
+    timer = PhaseTimer(timing)
+    try:
+        with timer.phase(_("Resolve file handles")):
+            fh = FileHandles()
+            metadatafile = fh.resolve(metadatafile)
+            if not syntax is None:
+                syntax = fh.resolve(syntax)
+            if data is not None:
+                data = fh.resolve(data)
+            if savfile is not None:
+                savfile = fh.resolve(savfile)
+            if checkpoint is not None:
+                checkpoint = fh.resolve(checkpoint)
+            if profilefile is not None:
+                profilefile = fh.resolve(profilefile)
+        strmvcode = sq(strmvcode)  # default string missing code if values not supplied
+        maxdatalength = getmaxdatalength(maxdatalength)
+        if len(mdvallabels) != 2:
+            raise ValueError(_("""Exactly two labels must be supplied for multiple dichotomy set values"""))
+        mdsetvallabels = {0 : sq(mdvallabels[0]), 1: sq(mdvallabels[1])}
+        if dataencoding.lower() not in ["utf8", "locale", "auto"]:
+            try:
+                codecs.lookup(dataencoding)
+            except LookupError:
+                raise ValueError(_("""The data encoding is not known: %s""") % dataencoding)
+        casesel = None
+        if cases is not None or sample is not None:
+            casesel = CaseSelection(cases, sample, seed)
+            if checkpoint is not None:
+                raise ValueError(_("""CHECKPOINT cannot be used with CASES or SAMPLE"""))
+        profiling = profile or profilefile is not None
+        if profiling and checkpoint is not None:
+            raise ValueError(_("""CHECKPOINT cannot be used with PROFILE or PROFILEFILE"""))
+    
+        # a directory or wildcard specification converts each study found
+        studies = findstudies(metadatafile)
+        if studies is not None:
+            if data is not None or savfile is not None or checkpoint is not None or variables is not None \
+                    or casesel is not None or profiling:
+                raise ValueError(_("""DATA, SAVFILE, CHECKPOINT, VARIABLES, CASES, SAMPLE and PROFILE cannot be specified when METADATA is a directory or wildcard specification"""))
+            with timer.phase(_("Batch conversion")):
+                timer.count(_("Batch conversion"), _("Studies"), len(studies))
+                dobatch(studies, syntax, execute, workers, loader, dict(language=language,
+                    removehtml=removehtml, parser=parser, parsecache=parsecache,
+                    parsecachesize=parsecachesize,
+                    strmvcode=strmvcode, dataencoding=dataencoding, maxdatalength=maxdatalength,
+                    fulllabelattr=fulllabelattr, mdsetvallabels=mdsetvallabels,
+                    scorerecode=scorerecode, mrexpand=mrexpand, coalesce=coalesce))
+            return
+        metadatafile = zipinput(metadatafile, True)
+        if data is not None:
+            data = zipinput(data, False)
+    
+        # a cached dataset makes parsing unnecessary unless syntax is wanted
+        dscache = None
+        cached = None
+        if execute and cache is not None and checkpoint is None:
+            dscache = DatasetCache(fh.resolve(cache), maxbytes=cachesize * 1024 * 1024,
+                maxage=cacheage * 86400)
+            if data is None:
+                datafile = defaultdatafile(metadatafile)
+            else:
+                datafile = data
+            # a hierarchy file has no data file of its own and is not cached
+            try:
+                with timer.phase(_("Dataset cache lookup")):
+                    dskey = dscache.makekey(metadatafile, datafile, (language, dataencoding,
+                        strmvcode, maxdatalength, loader, removehtml, fulllabelattr,
+                        mdsetvallabels, scorerecode, mrexpand, coalesce, variables,
+                        casesel and casesel.key()))
+                    cached = dscache.get(dskey)
+            except (IOError, OSError):
+                dscache = None
+        if cached is not None and syntax is None and not profiling:
+            with timer.phase(_("Open cached dataset")):
+                dscache.open(cached)
+            return
+    
+        # handler will hold the parsed information
+        if parsecache:
+            pcache = ParseCache(maxbytes=parsecachesize * 1024 * 1024)
+        else:
+            pcache = None
+        with timer.phase(_("Parse metadata")):
+            handler = parsemetadata(metadatafile, removehtml, language, pcache, parser)
+            if variables is not None and handler.hierarchy is None:
+                selectvariables(handler, variables)
+        timer.count(_("Parse metadata"), _("Variables"), len(handler.variables))
+        timer.count(_("Parse metadata"), _("Sets"),
+            sum(1 for var in handler.variables if var.type == "multiple"))
+        if dataencoding.lower() == "auto" and handler.hierarchy is None:
+            with timer.phase(_("Detect data encoding")):
+                dataencoding = resolveencoding(dataencoding, data or defaultdatafile(metadatafile),
+                    metadatafile)
+            print(_("""The data encoding was detected as %s""") % dataencoding)
+        if validate and handler.hierarchy is None:
+            if data is None:
+                datafile = defaultdatafile(metadatafile)
+            else:
+                datafile = data
+            with timer.phase(_("Validate data")):
+                validator = DataValidator(handler, dataencoding)
+                validator.run(datafile)
+            timer.count(_("Validate data"), _("Cases"), validator.nrecords)
+            validator.display(datafile)
+        if handler.hierarchy is not None:
+            if data is not None or savfile is not None or checkpoint is not None or variables is not None \
+                    or casesel is not None or profiling:
+                raise ValueError(_("""DATA, SAVFILE, CHECKPOINT, VARIABLES, CASES, SAMPLE and PROFILE cannot be specified with a hierarchy file.  Each level names its own data file."""))
+            try:
+                dohierarchy(handler.hierarchy, metadatafile, syntax, execute, hierarchy, loader,
+                    pcache, removehtml, language, strmvcode, dataencoding, maxdatalength,
+                    fulllabelattr, mdsetvallabels, scorerecode, mrexpand, coalesce, timer, parser)
+            except UnicodeEncodeError:
+                raise ValueError(_("""The metadata contains text invalid in the current character set.
+The dataset cannot be created.  Running Statistics in Unicode mode might resolve this problem."""))
+            if not syntax is None:
+                print(_("""Syntax file created: %s""") % syntax)
+            return
     
-    # Generate syntax
-    cmds = gensyntax(handler, metadatafile, data, syntax, strmvcode, 
-        dataencoding, maxdatalength, fulllabelattr, mdsetvallabels, scorerecode)
-    if not syntax is None:
-        writesyntax(cmds, syntax)
-        print(_("""Syntax file created: %s""") % syntax)
-    if execute:
+        # decoded data are cached by column for the native loader and sav files
+        # when all the records are read
+        colcache = None
+        if columncache is not None and casesel is None \
+                and (savfile is not None or (execute and loader == "native")):
+            colcache = ColumnCache(fh.resolve(columncache), maxbytes=cachesize * 1024 * 1024,
+                maxage=cacheage * 86400, settings=(strmvcode, scorerecode))
+        # the profile is accumulated by the first pass over the data
+        reader = None
+        profiler = None
+        if profiling:
+            reader = NativeReader(handler, strmvcode, dataencoding, scorerecode)
+            profiler = Profile(handler, reader)
+        if checkpoint is not None:
+            if savfile is None and not (execute and loader == "native"):
+                raise ValueError(_("""CHECKPOINT requires SAVFILE or EXECUTE=YES with LOADER=NATIVE"""))
+            checkpointload(handler, metadatafile, data, checkpoint, savfile, execute, strmvcode,
+                dataencoding, fulllabelattr, mdvallabels, mdsetvallabels, scorerecode, coalesce, timer)
+        elif savfile is not None:
+            writesav(handler, metadatafile, data, savfile, strmvcode, dataencoding,
+                fulllabelattr, mdvallabels, scorerecode, timer=timer, colcache=colcache,
+                workers=workers, reader=reader, casesel=casesel, profile=profiler)
+            print(_("""Data file created: %s""") % savfile)
+        
+        # Generate syntax.  It is written and submitted as it is generated
+        cmds = gensyntax(handler, metadatafile, data, syntax, strmvcode, 
+            dataencoding, maxdatalength, fulllabelattr, mdsetvallabels, scorerecode, mrexpand,
+            coalesce, casesel=casesel, timer=timer)
+        submit = execute and cached is None and loader != "native" and checkpoint is None
         try:
-            spss.Submit(cmds)
+            if syntax is not None or submit:
+                processsyntax(cmds, syntax, submit, timer=timer)
+            if not syntax is None:
+                print(_("""Syntax file created: %s""") % syntax)
+            if cached is not None:
+                with timer.phase(_("Open cached dataset")):
+                    dscache.open(cached)
+            elif execute and loader == "native" and checkpoint is None:
+                nativeload(handler, metadatafile, data, strmvcode, dataencoding,
+                    fulllabelattr, mdsetvallabels, scorerecode, coalesce=coalesce, timer=timer,
+                    colcache=colcache, workers=workers, reader=reader, casesel=casesel,
+                    profile=profiler if profiler is not None and not profiler.complete else None)
         except UnicodeEncodeError:
             raise ValueError(_("""The metadata contains text invalid in the current character set.
 The dataset cannot be created.  Running Statistics in Unicode mode might resolve this problem."""))
+        if profiler is not None:
+            if data is None:
+                datafile = defaultdatafile(metadatafile)
+            else:
+                datafile = data
+            with timer.phase(_("Profile data")):
+                if not profiler.complete:
+                    profiler.run(reader, datafile, workers=workers, casesel=casesel)
+            timer.count(_("Profile data"), _("Cases"), profiler.ncases)
+            if profilefile is not None:
+                profiler.save(profilefile, metadatafile, datafile)
+                print(_("""Profile file created: %s""") % profilefile)
+            if profile:
+                profiler.display(metadatafile, datafile)
+        if execute and cached is None and dscache is not None:
+            with timer.phase(_("Save dataset cache")):
+                dscache.save(dskey)
+    finally:
+        timer.stop()
+        timer.display()
+
+
+def getmaxdatalength(maxdatalength):
+    """Return maxdatalength as a positive integer or "auto"
+    
+    maxdatalength is a number, "auto", or a list holding one of these"""
+    
+    if isinstance(maxdatalength, (list, tuple)):
+        if len(maxdatalength) != 1:
+            raise ValueError(_("""MAXDATALENGTH must be a single number or AUTO"""))
+        maxdatalength = maxdatalength[0]
+    if str(maxdatalength).lower() == "auto":
+        return "auto"
+    try:
+        maxdatalength = int(maxdatalength)
+    except ValueError:
+        maxdatalength = 0
+    if maxdatalength <= 0:
+        raise ValueError(_("""MAXDATALENGTH must be a positive integer or AUTO"""))
+    return maxdatalength
+
+def dohierarchy(hier, metadatafile, syntax, execute, mode, loader, pcache, removehtml,
+        language, strmvcode, dataencoding, maxdatalength, fulllabelattr, mdsetvallabels,
+        scorerecode, mrexpand, coalesce, timer=None, parser="sax"):
+    """Read all the levels of a hierarchical survey
+    
+    hier is the Hierarchy object from the hierarchy file metadatafile
+    mode is "linked" for a dataset for each level named by its level id or
+    "flat" for a single dataset for the lowest level that also has the
+    variables of all its parent levels.  It is named by the level id with "_flat" appended.
+    timer is a PhaseTimer or None
+    The other parameters are as for dotriples"""
+    
+    if timer is None:
+        timer = PhaseTimer(False)
+    if mode == "flat":
+        levels = hier.chain(metadatafile)
+    else:
+        levels = hier.ordered(metadatafile)
+    with timer.phase(_("Parse metadata")):
+        pars = [parsemetadata(level.metadatafile, removehtml, language, pcache, parser)
+            for level in levels]
+    timer.count(_("Parse metadata"), _("Levels"), len(levels))
+    timer.count(_("Parse metadata"), _("Variables"), sum(len(par.variables) for par in pars))
+    
+    def levelsyntax():
+        for level, par in zip(levels, pars):
+            for block in gensyntax(par, level.metadatafile, leveldatafile(par, level.metadatafile),
+                    syntax, strmvcode, dataencoding, maxdatalength, fulllabelattr,
+                    mdsetvallabels, scorerecode, mrexpand, coalesce, timer=timer):
+                yield block
+            yield ["DATASET NAME %s." % level.ident]
+        if mode == "flat":
+            for block in flattensyntax(levels):
+                yield block
+    
+    submit = execute and loader != "native"
+    if syntax is not None or submit:
+        processsyntax(levelsyntax(), syntax, submit, timer=timer)
+    if not (execute and loader == "native"):
+        return
+    # a flattened hierarchy whose levels are all in the same order is merged as it is read
+    if mode == "flat" and all(level.parents[0].ordered for level in levels[1:]):
+        join = HierarchyJoin(levels, pars, strmvcode, dataencoding, scorerecode)
+        with timer.phase(_("Load data")):
+            dsname = createdataset(join.columns,
+                timer.counted(join.batches(NATIVEBATCHSIZE), _("Load data"), _("Cases")))
+        tw = textwrap.TextWrapper(width=100, break_long_words=False, break_on_hyphens=False)
+        if coalesce:
+            metadata = gencoalesced
+        else:
+            metadata = genmetadata
+        blocks = [[["DATASET ACTIVATE %s." % dsname]]]
+        # the lowest level definitions are applied last so that they take precedence
+        for reader, par in reversed(list(zip(join.readers, pars[::-1]))):
+            blocks.append([par.datafile.get()])
+            blocks.append(metadata(par, strmvcode, fulllabelattr, mdsetvallabels, scorerecode,
+                tw, reader.transformed))
+        blocks.append([["DATASET NAME %s_flat." % levels[-1].ident]])
+        processsyntax(itertools.chain(*blocks), execute=True, timer=timer)
+        return
+    for level, par in zip(levels, pars):
+        dsname = nativeload(par, level.metadatafile, leveldatafile(par, level.metadatafile),
+            strmvcode, dataencoding, fulllabelattr, mdsetvallabels, scorerecode, coalesce=coalesce,
+            timer=timer)
+        spss.Submit(["DATASET ACTIVATE %s." % dsname, "DATASET NAME %s." % level.ident])
+    if mode == "flat":
+        processsyntax(flattensyntax(levels), execute=True, timer=timer)
+
+def leveldatafile(par, metadatafile):
+    """Return the data file for a metadata file
+    
+    par is the metadata handler for metadatafile
+    The record href, if any, is relative to the metadata file location"""
+    
+    if par.record is not None and par.record.href:
+        return os.path.join(os.path.dirname(metadatafile), par.record.href)
+    return defaultdatafile(metadatafile)
+
+def flattensyntax(levels):
+    """Generator for the syntax to match the lowest level dataset to its parent levels
+    
+    levels is the list of Level objects from the root to the lowest level, each
+    loaded as a dataset named by the level id"""
+    
+    leaf = levels[-1].ident
+    current = leaf
+    for k in range(len(levels) - 1, 0, -1):
+        parent = levels[k-1].ident
+        linkvar = levels[k].parents[0].linkvar
+        yield ["DATASET ACTIVATE %s." % parent, "SORT CASES BY %s." % linkvar,
+            "DATASET ACTIVATE %s." % current, "SORT CASES BY %s." % linkvar,
+            "MATCH FILES /FILE=* /TABLE=%s /BY %s." % (parent, linkvar),
+            "DATASET NAME %s_flat." % leaf]
+        current = leaf + "_flat"
+
+def findstudies(metadatafile):
+    """Return the sorted list of metadata files for a batch or None for a single file
+    
+    metadatafile is a metadata file, a directory, or a wildcard specification.
+    All the sss and xml files in a directory are included."""
+    
+    if os.path.isdir(metadatafile):
+        studies = glob.glob(os.path.join(metadatafile, "*.sss")) + \
+            glob.glob(os.path.join(metadatafile, "*.xml"))
+    elif re.search(r"[*?[]", metadatafile):
+        studies = glob.glob(metadatafile)
+    else:
+        return None
+    if not studies:
+        raise ValueError(_("""No metadata files were found for: %s""") % metadatafile)
+    return sorted(studies)
+
+def dobatch(studies, syntax, execute, workers, loader, options):
+    """Convert a list of studies, parsing and generating syntax in parallel
+    
+    studies is the list of metadata files
+    syntax is the directory for the syntax files or None
+    execute indicates whether to create the datasets.  Each dataset is named by its
+    metadata file name.  Execution is serial, as Statistics has only one backend.
+    workers is the number of processes or None for the number of processors
+    loader is "syntax" or "native"
+    options is a dictionary of the parsing and syntax settings
+    A failure in one study does not stop the others.  A summary table is produced."""
+    
+    if syntax is not None:
+        if not os.path.isdir(syntax):
+            os.makedirs(syntax)
+        syntaxdir = syntax
+    elif loader != "native":
+        syntaxdir = tempfile.mkdtemp(prefix="STATS_GET_TRIPLES")
+    else:
+        syntaxdir = None
+    options["spssver"] = spss.GetDefaultPlugInVersion()
+    options["unicodemode"] = spss.PyInvokeSpss.IsUTF8mode()
+    jobs = []
+    for study in studies:
+        if syntaxdir is None:
+            syntaxfile = None
+        else:
+            syntaxfile = os.path.join(syntaxdir, os.path.splitext(os.path.basename(study))[0] + ".sps")
+        jobs.append((study, syntaxfile, options))
+    results = None
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if workers > 1:
+        import concurrent.futures.process
+        try:
+            with concurrent.futures.ProcessPoolExecutor(workers, initializer=installtranslation) as pool:
+                results = list(pool.map(batchstudy, jobs))
+        except (OSError, concurrent.futures.process.BrokenProcessPool):
+            # process creation may not be possible in every Statistics environment
+            results = None
+    if results is None:
+        results = [batchstudy(job) for job in jobs]
+    
+    # Statistics work is done one study at a time in order
+    dsnames = set()
+    summary = []
+    for (study, syntaxfile, opts), (model, nvars, error) in zip(jobs, results):
+        dsname = None
+        if error is not None:
+            syntaxfile = None
+        elif execute:
+            dsname = datasetname(study, dsnames)
+            try:
+                if loader == "native":
+                    handler = metadataHandler(removehtml=options["removehtml"])
+                    handler.datafile, handler.record, handler.variables, handler.hierarchy = model
+                    loaded = nativeload(handler, study, None, options["strmvcode"],
+                        options["dataencoding"], options["fulllabelattr"], options["mdsetvallabels"],
+                        options["scorerecode"], coalesce=options["coalesce"])
+                    spss.Submit(["DATASET ACTIVATE %s." % loaded, "DATASET NAME %s." % dsname])
+                else:
+                    spss.Submit(["INSERT FILE=%s." % sq(syntaxfile), "DATASET NAME %s." % dsname])
+            except Exception as e:
+                error = str(e)
+                dsname = None
+        if syntax is None:
+            syntaxfile = None
+        summary.append((study, nvars, syntaxfile, dsname, error))
+    if syntax is None and syntaxdir is not None:
+        shutil.rmtree(syntaxdir, ignore_errors=True)
+    batchsummary(summary)
+
+def batchstudy(job):
+    """Parse one study and write its syntax file in a worker process
+    
+    job is a (metadatafile, syntaxfile, options) tuple.  syntaxfile may be None.
+    The return is (parsed model, number of variables, error message or None).
+    Statistics is not used here."""
+    
+    metadatafile, syntaxfile, options = job
+    try:
+        if options["parsecache"]:
+            pcache = ParseCache(maxbytes=options["parsecachesize"] * 1024 * 1024)
+        else:
+            pcache = None
+        handler = parsemetadata(metadatafile, options["removehtml"], options["language"], pcache,
+            options["parser"])
+        if handler.hierarchy is not None:
+            raise ValueError(_("""Hierarchy files cannot be converted in batch mode"""))
+        if syntaxfile is not None:
+            processsyntax(gensyntax(handler, metadatafile, None, syntaxfile, options["strmvcode"],
+                options["dataencoding"], options["maxdatalength"], options["fulllabelattr"],
+                options["mdsetvallabels"], options["scorerecode"], options["mrexpand"],
+                options["coalesce"], options["spssver"], unicodemode=options["unicodemode"]), syntaxfile,
+                unicodemode=options["unicodemode"])
+        return ((handler.datafile, handler.record, handler.variables, handler.hierarchy),
+            len(handler.variables), None)
+    except Exception as e:
+        return (None, None, str(e) or e.__class__.__name__)
+
+def installtranslation():
+    """Define the translation function _ if Statistics has not supplied it
+    
+    Run and main define it, but a worker process started by spawn only
+    imports this module, so the pools call this as their initializer."""
+    
+    global _
+    try:
+        _("---")
+    except NameError:
+        def _(msg):
+            return msg
+
+def datasetname(metadatafile, used):
+    """Return a unique dataset name derived from the metadata file name
+    
+    used is the set of names already assigned.  It is updated."""
+    
+    base = re.sub(r"\W", "_", os.path.splitext(os.path.basename(metadatafile))[0])
+    if not base or not base[0].isalpha():
+        base = "D" + base
+    name = base
+    i = 1
+    while name.lower() in used:
+        i += 1
+        name = "%s_%s" % (base, i)
+    used.add(name.lower())
+    return name
 
+def batchsummary(summary):
+    """Display a table summarizing a batch conversion
+    
+    summary is a list of (metadatafile, number of variables, syntax file, dataset, error)"""
+    
+    StartProcedure(_("Get Triple-S Batch"), "STATSGETTRIPLESBATCH")
+    try:
+        pt = spss.BasePivotTable(_("Batch Conversion Summary"), "STATSGETTRIPLESBATCHSUMMARY")
+        cells = []
+        for study, nvars, syntaxfile, dsname, error in summary:
+            if error is None:
+                status = _("Converted")
+            else:
+                status = _("Failed")
+            cells.extend([status, "." if nvars is None else nvars, syntaxfile or "",
+                dsname or "", error or ""])
+        pt.SimplePivotTable(rowdim=_("Metadata File"),
+            rowlabels=[study for study, nvars, syntaxfile, dsname, error in summary],
+            collabels=[_("Status"), _("Variables"), _("Syntax File"), _("Dataset"), _("Message")],
+            cells=cells)
+        failures = sum(1 for item in summary if item[4] is not None)
+        spss.TextBlock(_("Batch Conversion"), _("""%s studies converted, %s failed""")\
+            % (len(summary) - failures, failures))
+    finally:
+        spss.EndProcedure()
+
+def parsemetadata(metadatafile, removehtml, language=None, cache=None, parser="sax"):
+    """Return a metadata handler object holding the parsed metadata
+    
+    metadatafile is the xml file with the definitions
+    removehtml and language are the options affecting the parse
+    cache is a ParseCache object or None.  On a cache hit the file is not parsed.
+    parser is "sax" or "expat".  Both produce the same model."""
+    
+    handler = metadataHandler(removehtml=removehtml)
+    if cache is not None:
+        key = cache.makekey(metadatafile, removehtml, language)
+        model = cache.get(key)
+        if model is not None:
+            handler.datafile, handler.record, handler.variables, handler.hierarchy = model
+            return handler
+    if parser == "expat":
+        expatparse(metadatafile, handler)
+    elif compression(metadatafile) is not None:
+        with openinput(metadatafile) as f:
+            xml.sax.parse(f, handler)
+    else:
+        xml.sax.parse(metadatafile, handler)
+    if cache is not None:
+        cache.put(key, (handler.datafile, handler.record, handler.variables, handler.hierarchy))
+    return handler
+
+def selectvariables(par, selection):
+    """Restrict the variables of parsed metadata to a selection
+    
+    par is a metadata handler object.  Its variable list is replaced.
+    selection is a list of variable names and idents, and ranges of either
+    written as first TO last.  The name of a multiple response set member
+    selects the whole set.  Variables named in the filter of a selected
+    variable are also selected.  Variables stay in metadata order."""
+    
+    names = dict((var.name.lower(), i) for i, var in enumerate(par.variables))
+    idents = dict((var.ident, i) for i, var in enumerate(par.variables))
+    def find(token):
+        i = names.get(token.lower(), idents.get(token))
+        if i is None:
+            m = membername.match(token)
+            if m is not None:
+                i = names.get(m.group(1).lower())
+                if i is not None and par.variables[i].type != "multiple":
+                    i = None
+        return i
+    
+    selected = set()
+    unknown = []
+    tokens = list(selection)
+    while tokens:
+        first = tokens.pop(0)
+        if tokens[:1] and tokens[0].lower() == "to":
+            if len(tokens) < 2:
+                raise ValueError(_("""A variable range is incomplete: %s TO""") % first)
+            last = tokens[1]
+            del tokens[:2]
+            start, end = find(first), find(last)
+            if start is not None and end is not None:
+                selected.update(range(min(start, end), max(start, end) + 1))
+                continue
+            # idents that are numbers select by value even if the ends are not idents
+            try:
+                low, high = float(first), float(last)
+            except ValueError:
+                unknown.append("%s TO %s" % (first, last))
+                continue
+            for ident, i in idents.items():
+                try:
+                    if low <= float(ident) <= high:
+                        selected.add(i)
+                except (TypeError, ValueError):
+                    pass
+        else:
+            i = find(first)
+            if i is None:
+                unknown.append(first)
+            else:
+                selected.add(i)
+    if unknown:
+        raise ValueError(_("""These variables were not found in the metadata: %s""") % ", ".join(unknown))
+    if not selected:
+        raise ValueError(_("""No variables were selected"""))
+    
+    # filters may refer to variables that were not selected
+    added = []
+    pending = list(selected)
+    while pending:
+        var = par.variables[pending.pop()]
+        if var.filter is None:
+            continue
+        for m in filtertoken.finditer(var.filter):
+            i = m.lastgroup == "name" and names.get(m.group("name").lower())
+            if i is not None and i is not False and i not in selected:
+                selected.add(i)
+                pending.append(i)
+                added.append(par.variables[i].name)
+    if added:
+        print(_("""These variables were added because filters of selected variables refer to them: %s""")\
+            % ", ".join(added))
+    # the records still hold the fields of the variables that are dropped
+    par.extent = recordextent(par.variables, par.record.format)
+    par.variables = [var for i, var in enumerate(par.variables) if i in selected]
+    par.selection = [var.name for var in par.variables]
+
+def recordextent(variables, recordformat):
+    """Return the record length fixed format variables need or the number of csv fields"""
+    
+    if recordformat == "fixed":
+        return max([var.getFinish() for var in variables] + [0])
+    else:
+        return max([var.position[0] for var in variables] + [0])
+
+# name of a multiple response set member
+membername = re.compile(r"(.+)_\d+$")
+
+# block size for feeding the expat parser.  It matches the SAX reader so text is
+# split into the same chunks.
+EXPATBLOCKSIZE = 2 ** 16
+
+def expatparse(metadatafile, handler, blocksize=EXPATBLOCKSIZE):
+    """Parse metadatafile with expat directly, calling the methods of handler
+    
+    handler is a metadataHandler.  The SAX layer is bypassed: attributes are
+    passed as plain dictionaries, and the file is read in blocks, so memory
+    use does not depend on the file size.  External entities, including a
+    DTD reference, are not read."""
+    
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = handler.startElement
+    parser.EndElementHandler = handler.endElement
+    parser.CharacterDataHandler = handler.characters
+    try:
+        with openinput(metadatafile) as f:
+            for block in iter(lambda: f.read(blocksize), b""):
+                parser.Parse(block, False)
+            parser.Parse(b"", True)
+    except xml.parsers.expat.ExpatError as e:
+        raise ValueError(_("""The metadata file is not valid XML: %s.  %s""") % (metadatafile, e))
 
 class metadataHandler(ContentHandler):
     
@@ -208,41 +1164,56 @@ class metadataHandler(ContentHandler):
         self.contentstack = []
         self.intext = False
         self.textstack = []
+        self.hierarchy = None
+        # names of the variables kept by selectvariables or None for all
+        self.selection = None
+        # record extent of all the variables when there is a selection
+        self.extent = None
+        # value and score tables shared by variables with identical tables
+        self.tables = {}
 
     # callbacks from parser    
     def startElement(self, name, attr):
+        """Callback for the start of an element
+        
+        attr is a SAX attributes object or a dictionary"""
+        
         if name == 'sss':
-            self.datafile = Datafile(getValue(attr, 'version'), getValue(attr, 'languages'),
-                getValue(attr, 'modes'))
+            self.datafile = Datafile(attr.get('version'), attr.get('languages'),
+                attr.get('modes'))
         elif name == 'survey':
             self.state = 'survey'
         elif name == 'record':
             self.state = 'record'
-            self.record = Record(getValue(attr, 'ident'), getValue(attr, 'format'),
-                getValue(attr, 'skip'), getValue(attr, 'href'))
+            self.record = Record(attr.get('ident'), attr.get('format'),
+                attr.get('skip'), attr.get('href'))
             if self.record.format is None:
                 self.record.format = "fixed"  #3/26/14
         elif name == 'variable':
-            self.variables.append(Variable(**dict(list(zip(['ident','type','use','format'], 
-                [getValue(attr, item) for item in ['ident','type','use','format']])))))
+            self.variables.append(Variable(attr.get('ident'), attr.get('type'), attr.get('use'),
+                attr.get('format')))
         elif name == 'position':
-            self.variables[-1].position = [getValue(attr, 'start'),
-                getValue(attr, 'finish')]
+            self.variables[-1].position = self.getPosition(attr)
         elif name == "spread":
-            self.variables[-1].spreadsubfields = getValue(attr, 'subfields')
-            self.variables[-1].spreadwidth = getValue(attr, 'width')
+            self.variables[-1].spreadsubfields = attr.get('subfields')
+            self.variables[-1].spreadwidth = attr.get('width')
         elif name == 'range':
-            self.variables[-1].rangefrom = getValue(attr, 'from')
-            self.variables[-1].rangeto = getValue(attr, 'to')
+            self.variables[-1].rangefrom = attr.get('from')
+            self.variables[-1].rangeto = attr.get('to')
         elif name == 'value':
-            self.code = getValue(attr, 'code')
+            self.code = attr.get('code')
             ###self.variables[-1]. = self.code
-            self.variables[-1].scores[self.code] = getValue(attr, 'score')
+            self.variables[-1].scores[self.code] = attr.get('score')
         elif name == "text":
-            self.variables[-1].mode = getValue(attr, "mode")
+            self.variables[-1].mode = attr.get("mode")
             self.intext = True
         elif name == 'hierarchy':
-            raise ValueError(_("""Hierarchy files are not supported by this procedure"""))
+            self.hierarchy = Hierarchy()
+        elif name == 'level':
+            self.hierarchy.levels.append(Level(attr.get('ident'), attr.get('href')))
+        elif name == 'parent':
+            self.hierarchy.levels[-1].parents.append(Parent(attr.get('parlev'),
+                attr.get('linkvar'), attr.get('ordered') == "yes"))
             
     def endElement(self, name):
         if name == "br":
@@ -263,6 +1234,8 @@ class metadataHandler(ContentHandler):
         elif name == "size":
             self.variables[-1].size = self.contentstack[0]
             self.contentstack = []
+        elif name == "variable":
+            self.compact(self.variables[-1])
         elif name == "text":
             if self.variables[-1].mode:
                 ###self.variables[-1].text.append("Mode: %s.  %s" % (self.variables[-1].mode, "\n".join(self.textstack)))
@@ -274,12 +1247,43 @@ class metadataHandler(ContentHandler):
             self.textstack = []
             
         if name == 'sss':
+            self.tables = {}     # sharing is complete
             return   'all done'
             
+    def getPosition(self, attr):
+        """Return the position attributes as a (start, finish) pair of integers
+        
+        finish is None if it is omitted"""
+        
+        try:
+            start = int(attr.get('start'))
+            finish = attr.get('finish')
+            if finish is not None:
+                finish = int(finish)
+        except (TypeError, ValueError):
+            raise ValueError(_("""The position of variable %s is not valid: start=%s finish=%s""")\
+                % (self.variables[-1].ident, attr.get('start'), attr.get('finish')))
+        return (start, finish)
+    
+    def compact(self, var):
+        """Reduce the memory used by a completely parsed variable
+        
+        Identical value and score tables are shared between variables,
+        so they must not be changed after parsing."""
+        
+        var.values = self.share(var.values)
+        var.scores = self.share(var.scores)
+        var.text = tuple(var.text)
+    
+    def share(self, table):
+        """Return the shared dictionary equal to table"""
+        
+        return self.tables.setdefault(tuple(itertools.chain.from_iterable(table.items())), table)
+    
     def characters(self, content):
             """Callback for text content in element"""
             
-            if content.rstrip() != "":
+            if content and not content.isspace():
                 if self.intext:
                     self.textstack.append(content)
                 else:
@@ -311,20 +1315,27 @@ class metadataHandler(ContentHandler):
         
         stack is the list of lines to process"""
         
-        text = re.sub(metadataHandler.brRegex, r" - ", "".join(stack))
+        text = "".join(stack)
+        if "<" not in text:
+            return text
+        text = metadataHandler.brRegex.sub(r" - ", text)
         if self.removehtml:
-            text = re.sub(metadataHandler.htmlelt, "", text)
+            text = metadataHandler.htmlelt.sub("", text)
         return text
         
-def getValue(attr, name):
-    """Return attribute value or None"""
-    
-    try:
-        return attr.getValue(name)
-    except:
-        return None
-
 class Variable(object):
+    """Definition of a Triple-S variable
+    
+    Slots are used because surveys can have a very large number of variables.
+    position is a (start, finish) pair of integers, with finish None if it
+    is not given.  The values and scores
+    dictionaries may be shared with other variables and are not changed
+    after parsing."""
+    
+    __slots__ = ("ident", "type", "use", "format", "position", "values", "label", "filter",
+        "scores", "spreadsubfields", "spreadwidth", "size", "rangefrom", "rangeto", "text",
+        "vardeflist", "name", "mode", "vardef", "multtype", "mdwidth", "mdsetvars", "mvcode")
+    
     formatdict = {
         "single" : "F",   # numeric: integers, strings any. Width determined by mandatory value element
         "multiple" : "F",      # mandatory values; optional spread
@@ -347,7 +1358,7 @@ class Variable(object):
         #time Optional values element        
         #fixed format: starting and ending columns, 1 based
         #csv format: field number, 1 based
-        self.position = [None, None]
+        self.position = (None, None)
         self.values={}
         self.label = None
         self.filter = None
@@ -358,7 +1369,7 @@ class Variable(object):
         self.rangefrom = None
         self.rangeto = None
         self.text = []
-        self.vardeflist = []
+        self.vardeflist = ()
         
         #special use types can be serial or weight
         
@@ -370,6 +1381,139 @@ class Variable(object):
         else:
             return []
 
+    def getFinish(self):
+        """Return the last column of the variable in a fixed format record"""
+
+        start = self.position[0]
+        if self.position[1] is not None:
+            return self.position[1]
+        if self.type == "multiple":
+            if self.spreadsubfields is not None:
+                return start + int(self.spreadsubfields) * int(self.spreadwidth or 1) - 1
+            if self.values:
+                return max(int(k) for k in self.values) + start - 1
+        return start
+
+    def getSavFormat(self, recordformat):
+        """Return the (width, decimals) of the F format for numeric variables in a sav file
+        
+        getDataList must have been called first"""
+        
+        decimals = 0
+        for bound in (self.rangefrom, self.rangeto):
+            if bound is not None and "." in bound:
+                decimals = max(decimals, len(bound.split(".")[1]))
+        if recordformat != "fixed":
+            width = 8
+        elif self.multtype is not None:
+            width = int(self.spreadwidth or 1)
+        else:
+            width = self.calcwidthfixed(self.position, self.format, self.size, self.values, None)
+        return (max(width, decimals + 2 if decimals else 1), decimals)
+
+    def getValidator(self, recordformat, arrays=False):
+        """Return (start, end, check) for checking this variable or None if nothing is checked
+        
+        For fixed format the field of a record, a line of bytes, is record[start:end].
+        For csv it is field start of the list of fields and end is None.
+        check takes the list of the fields of a chunk of records and returns a list
+        of (index, problem) pairs.  getDataList must have been called first
+        arrays indicates that check takes a NumPy array of fixed format fields
+        with a row of bytes for each record instead of a list"""
+        
+        fixed = recordformat == "fixed"
+        test = self.getValueTest()
+        bounds = self.getValueBounds()
+        valid = bounds is not None and numbersvalid(bounds, fixed) or None
+        start = self.position[0] - 1
+        if test is not None:
+            def fieldtest(text):
+                text = text.strip()
+                return text and test(text) or None
+        if self.multtype is None:
+            if test is None:
+                return None
+            if fixed:
+                end = start + self.calcwidthfixed(self.position, self.format, self.size, self.values, None)
+            else:
+                end = None
+            if arrays:
+                return (start, end, arraycheck(fieldtest, bounds is not None and numberspassed(bounds) or None))
+            return (start, end, columncheck(fieldtest, fixed, valid))
+        
+        if fixed:
+            width = int(self.spreadwidth or 1)
+            end = start + width * len(self.vardeflist)
+        else:
+            width = self.mdwidth
+            end = None
+        if self.multtype == "MD":
+            if arrays:
+                return (start, end, arraycheck(bitstringtest(len(self.vardeflist), fixed), bitspassed))
+            return (start, end, bitstringcheck(len(self.vardeflist), fixed))
+        # MC set: each subfield is a code or blank
+        if test is None:
+            return None
+        if arrays:
+            return (start, end, arrayspreadcheck(fieldtest, len(self.vardeflist),
+                bounds is not None and numberspassed(bounds) or None))
+        return (start, end, spreadcheck(fieldtest, fixed, width, len(self.vardeflist), valid))
+    
+    def getValueTest(self):
+        """Return a function that checks a nonblank value or None if values are unrestricted
+        
+        The function returns None if the value is valid or a description of the problem"""
+        
+        if self.type == "character":
+            return None
+        undefined = _("Undefined code")
+        if self.format == "literal":
+            codes = frozenset(k.strip() for k in self.values)
+            if not codes:
+                return None
+            return lambda text: None if text in codes else undefined
+        notnumber = _("Not a number")
+        outofrange = _("Out of range")
+        if self.type == "logical":
+            codes = frozenset([0., 1.])
+        else:
+            try:
+                codes = frozenset(float(k) for k in self.values)
+            except ValueError:
+                codes = frozenset()
+        low = tonumber(self.rangefrom) if self.rangefrom is not None else None
+        high = tonumber(self.rangeto) if self.rangeto is not None else None
+        hasrange = low is not None or high is not None
+        if not codes and not hasrange:
+            return lambda text: None if tonumber(text) is not None else notnumber
+        def test(text):
+            value = tonumber(text)
+            if value is None:
+                return notnumber
+            if value in codes:
+                return None
+            if hasrange:
+                if (low is None or value >= low) and (high is None or value <= high):
+                    return None
+                return outofrange
+            return undefined
+        return test
+
+    def getValueBounds(self):
+        """Return (low, high) such that every number in the range is a valid value or None
+        
+        None means that values must be tested one by one against the codes."""
+        
+        if self.type == "character" or self.format == "literal":
+            return None
+        low = tonumber(self.rangefrom) if self.rangefrom is not None else None
+        high = tonumber(self.rangeto) if self.rangeto is not None else None
+        if low is None and high is None:
+            if self.type == "logical" or self.values:
+                return None
+            return (-math.inf, math.inf)
+        return (-math.inf if low is None else low, math.inf if high is None else high)
+
     def getDataList(self, recordformat):
         """Return data list or get data variable definition syntax for one variable or MR set"""
         
@@ -395,10 +1539,10 @@ class Variable(object):
             else: #MD set (bitstring format)
                 self.multtype = "MD"
                 if self.position[1] is None:
-                    endloc = max((int(k) for k in list(self.values.keys()))) + int(self.position[0]) - 1
+                    endloc = max((int(k) for k in list(self.values.keys()))) + self.position[0] - 1
                 else:
-                    endloc = int(self.position[1])
-                varcount = (endloc - int(self.position[0]) + 1) // width
+                    endloc = self.position[1]
+                varcount = (endloc - self.position[0] + 1) // width
             self.vardef = self.name + "_1 TO " + self.name + "_" + str(varcount)
             self.vardeflist = [self.name + "_" + str(i+1) for i in range(int(varcount))]
 
@@ -407,37 +1551,47 @@ class Variable(object):
             else:  # csv, and md values are not comma separated!
                 if self.multtype == "MD":
                     self.mdwidth = width
-                    return [int(self.position[0]), "%s A" % self.name]
+                    return [self.position[0], "%s A" % self.name]
                 else:
                     vlist = ["%s %s" % (name, format) for name in self.vardeflist]
-                    ###return [int(self.position[0]), " ".join(vlist)]
+                    ###return [self.position[0], " ".join(vlist)]
                     self.mdwidth = width  # required field if csv
-                    return [int(self.position[0]), "%s A" %self.name]  # just the main variable name for now
+                    return [self.position[0], "%s A" %self.name]  # just the main variable name for now
         if recordformat == "fixed":
             if self.position[1] is not None:
-                width = int(self.position[1]) - int(self.position[0]) + 1
+                width = self.position[1] - self.position[0] + 1
             # second position element can be omitted if width is 1
             else:
                 width = 1            
-            return "%s %s-%d (%s)" % (self.vardef, self.position[0], int(self.position[0]) + width - 1, format)
+            return "%s %d-%d (%s)" % (self.vardef, self.position[0], self.position[0] + width - 1, format)
         else: 
             # return csv specs as a duple of position (order) and spec repeated
             # for each variable if multiple
             
             if self.type != "multiple":
-                return [int(self.position[0]), "%s %s" % (self.vardef, format)]
+                return [self.position[0], "%s %s" % (self.vardef, format)]
             else:
                 # position indicates field order in csv format
                 vlist = ["%s %s" % (name, format) for name in self.vardeflist]
-                return [int(self.position[0]), " ".join(vlist)]
+                return [self.position[0], " ".join(vlist)]
             
-    def fixupCsv(self, recordformat):
+    def fixupCsv(self, recordformat, mrexpand="if"):
         """Create set member variables for MR sets from a single string variable
         
-        recordformat is csv or fixed"""
+        recordformat is csv or fixed
+        mrexpand is "if" for one command per member or "loop" for one
+        vector loop per set"""
         
         if recordformat == "fixed" or self.multtype is None:
             return []
+        if mrexpand == "loop":
+            # VECTOR Q_(n) creates the members Q_1 to Q_n
+            count = len(self.vardeflist)
+            return ["""VECTOR %(name)s_(%(count)s, F%(width)s.0).
+LOOP #i = 1 TO %(count)s.
+IF (CHAR.LENGTH(CHAR.SUBSTR(%(name)s, #i * %(width)s - %(width)s + 1, %(width)s)) > 0) %(name)s_(#i) =
+    NUMBER(CHAR.SUBSTR(%(name)s, #i * %(width)s - %(width)s + 1, %(width)s), F%(width)s.0).
+END LOOP.""" % {"name": self.name, "count": count, "width": self.mdwidth}]
         cmds = []
         position = 1
         ###if self.multtype == "MD":
@@ -453,12 +1607,69 @@ class Variable(object):
             position += self.mdwidth
         return cmds
     
+    def getNativeVars(self, recordformat):
+        """Return list of (name, type) pairs for the variables created by the native loader
+        
+        type is 0 for numeric or the string width.
+        getDataList must have been called first"""
+        
+        if self.multtype is not None:
+            return [(name, 0) for name in self.vardeflist]
+        if self.format != "literal" and Variable.formatdict[self.type] == "F":
+            return [(self.name, 0)]
+        if recordformat == "fixed":
+            width = self.calcwidthfixed(self.position, self.format, self.size, self.values, None)
+        elif self.type == "date":
+            width = 8
+        elif self.type == "time":
+            width = 6
+        elif self.size is not None:
+            width = int(self.size)
+        elif self.values:
+            width = max(len(k) for k in self.values)
+        else:
+            width = 255
+        return [(self.name, width)]
+    
+    def getDecoder(self, recordformat, encoding):
+        """Return a function that extracts the values of this variable from a record
+        
+        For fixed format the record is a line of bytes and for csv the list of fields.
+        The function returns a list with one value for each variable created.
+        Numeric values that are blank or invalid are returned as None.
+        getDataList must have been called first"""
+        
+        isstring = self.getNativeVars(recordformat)[0][1] > 0
+        start = self.position[0] - 1
+        if recordformat == "fixed":
+            if self.multtype is None:
+                end = start + self.calcwidthfixed(self.position, self.format, self.size, self.values, None)
+                if isstring:
+                    return lambda rec: [rec[start:end].decode(encoding, "replace").rstrip()]
+                return lambda rec: [tonumber(rec[start:end])]
+            width = int(self.spreadwidth or 1)
+        else:
+            if self.multtype is None:
+                if isstring:
+                    return lambda rec: [getfield(rec, start).rstrip()]
+                return lambda rec: [tonumber(getfield(rec, start))]
+            width = self.mdwidth
+            fieldnum, start = start, 0
+        # set members are consecutive subfields of equal width
+        bounds = [(start + i * width, start + (i + 1) * width) for i in range(len(self.vardeflist))]
+        if recordformat == "fixed":
+            return lambda rec: [tonumber(rec[b:e]) for b, e in bounds]
+        def decodeset(rec):
+            field = getfield(rec, fieldnum)
+            return [tonumber(field[b:e]) for b, e in bounds]
+        return decodeset
+    
     @staticmethod
     def calcwidthfixed(position, format, size, values, spread):
         """Return width of the variable for fixed width format"""
         
         if position[1] is not None:
-            return int(position[1]) - int(position[0]) + 1
+            return position[1] - position[0] + 1
         # second position element can be omitted if width is 1
         else:
             return 1
@@ -469,37 +1680,42 @@ class Variable(object):
         val is the value label dictionary
         tw is a text wrapper object"""
         
+        cmds = []
+        for name, label in self.getLabelPairs():
+            cmds.append("VARIABLE LABELS %s %s." % (name, sq(label)))
+            cmds.extend(self.getFullLabelAttr(name, label, fulllabelattr, tw))
+        if self.vardeflist and not self.spreadsubfields:  # MD set
+            wrapped = "\n".join(tw.wrap(" ".join(self.vardeflist)))
+            cmds.append("""VALUE LABELS %s
+0 %s 1 %s.""" % (wrapped, val[0], val[1]))
+        return cmds
+    
+    def getLabelPairs(self):
+        """Return list of (variable name, label) for the labelled variables
+        
+        MC set members get the set label.  MD set members get the label of the
+        corresponding value, and the list of labelled members is saved for the
+        set definition"""
+        
         if self.vardeflist:  # mult response
             if self.spreadsubfields: #MC set
                 if self.label:
-                    cmds = []
-                    for name in self.vardeflist:
-                        cmds.append("VARIABLE LABELS %s %s." % (name, sq(self.label)))
-                        cmds.extend(self.getFullLabelAttr(name, self.label, fulllabelattr, tw))
-                    return cmds
+                    return [(name, self.label) for name in self.vardeflist]
                 else:
                     return []
-            else: # MD set.  return value labels where available
-                cmds = []
+            else: # MD set.  use value labels where available
+                pairs = []
                 self.mdsetvars = []
                 for vnum in range(len(self.vardeflist)):
                     vnum1 = vnum + 1
                     vname = self.name + "_" + str(vnum1)
                     if str(vnum1) in self.values:
                         self.mdsetvars.append(vname)  # building list of names for set definition
-                        ###cmds.append("VARIABLE LABELS %s %s." % (vname, sq(" ".join(self.values[str(vnum1)]))))
-                        cmds.append("VARIABLE LABELS %s %s." % (vname, sq("".join(self.values[str(vnum1)]))))
-                        cmds.extend(self.getFullLabelAttr(vname, "".join(self.values[str(vnum1)]),
-                            fulllabelattr, tw))
-                wrapped = "\n".join(tw.wrap(" ".join(self.vardeflist)))
-                cmds.append("""VALUE LABELS %s
-0 %s 1 %s.""" % (wrapped, val[0], val[1]))
-                return cmds
+                        pairs.append((vname, "".join(self.values[str(vnum1)])))
+                return pairs
         else:
             if self.label is not None:
-                cmds = ["VARIABLE LABELS %s %s." % (self.name, sq(self.label))]
-                cmds.extend(self.getFullLabelAttr(self.name, self.label, fulllabelattr, tw))
-                return cmds
+                return [(self.name, self.label)]
             else:
                 return []
     
@@ -509,6 +1725,16 @@ class Variable(object):
         scorerecode indicates whether labels are for values or scores.
         It is ignored if there are no scores"""
         
+        lines = self.getValueLabelLines(scorerecode)
+        if not lines:
+            return []
+        result = ["VALUE LABELS %s" % self.vardef] + lines
+        result[-1] = result[-1] + "."
+        return result
+    
+    def getValueLabelLines(self, scorerecode):
+        """Return the value label specifications as a list of lines or empty list"""
+        
         if self.vardeflist and self.spreadsubfields is None:  #MD sets get labels elsewhere
             return []
         
@@ -518,7 +1744,7 @@ class Variable(object):
         if not self.values:
             return []
         else:
-            result = ["VALUE LABELS %s" % self.vardef]
+            result = []
             try:
                 for k,v in sorted(self.values.items()):
                     if scorerecode:
@@ -530,7 +1756,6 @@ class Variable(object):
             except:
                 raise ValueError(_("""Variable %s has a value, %s for which there is no score""")\
                     % (self.vardef, k))
-            result[-1] = result[-1] + "."
             return result
         
     def getScores(self):
@@ -540,26 +1765,45 @@ class Variable(object):
         # value|score
         # In the unlike event that the value contains "|" it is escaped as "\|"
         
+        lines = self.getScoreLines()
+        if not lines:
+            return []
+        namelist = "\n".join(self.vardeflist) or self.name
+        result = ["VARIABLE ATTRIBUTE VARIABLES = %s ATTRIBUTE=" % namelist] + lines
+        result[-1] = result[-1] + "."
+        return result
+    
+    def getScoreLines(self):
+        """Return the score attribute array elements as a list of lines or empty list"""
+        
         if (self.vardeflist and self.spreadsubfields is None)\
            or not any(self.scores.values()):
             return []
         else:
-            namelist = "\n".join(self.vardeflist) or self.name
-            result = ["VARIABLE ATTRIBUTE VARIABLES = %s ATTRIBUTE=" % namelist]
+            result = []
             itemnum = 1
             for k, v in sorted(self.scores.items()):
                 if v is not None:
                     result.append("""score[%s](%s)""" % (itemnum, sq(k.replace("|", "\|") + " | " + v)))
                     itemnum += 1
-            result[-1] = result[-1] + "."
             return result
             
     def getRecode(self):
         """Return recode for variable into itself or empty"""
         
+        lines = self.getRecodeLines()
+        if not lines:
+            return []
+        result = ["RECODE  %s" % self.vardef] + lines
+        result[-1] = result[-1] + "."
+        return result
+    
+    def getRecodeLines(self):
+        """Return the recode specifications as a list of lines or empty list"""
+        
         if not any(self.scores.values()):
             return []
-        result = ["RECODE  %s" % self.vardef]
+        result = []
         isstring = self.format == "literal"  # (default is numeric)
         for k,v in sorted(self.scores.items()):
             kk = k
@@ -568,43 +1812,55 @@ class Variable(object):
                     k = sq(k)
                     v = sq(v)
                 result.append("(%s=%s)" % (k, v))
-        result[-1] = result[-1] + "."
         return result
         
         
-    def getMissing(self, strmvcode):
-        """Return missing value computation and syntax"""
+    def getMissing(self, strmvcode, transform=True):
+        """Return missing value computation and syntax
+        
+        transform indicates whether the filter computation is included
+        or only the missing value declaration"""
         
         if self.filter is None:
             return []                # no missing values defined
         self.mvcode = self.makemvcode(strmvcode)   # will be quoted if string type
-        return ["""IF (NOT %(filter)s) %(name)s = %(mvcode)s.
-MISSING VALUES %(name)s (%(mvcode)s).""" % self.__dict__]
+        if not transform:
+            return ["""MISSING VALUES %s (%s).""" % (self.name, self.mvcode)]
+        return ["""IF (NOT %s) %s = %s.
+MISSING VALUES %s (%s).""" % (self.filter, self.name, self.mvcode, self.name, self.mvcode)]
     
     def getText(self):
         """Return custom attribute array syntax as a list"""
         
         if not self.text:
             return []
-        attrdef = ["Text[%s](%s)" % (i+1, sq(item)) for i, item in enumerate(self.text)]
-        return ["VARIABLE ATTRIBUTE VARIABLES=%s ATTRIBUTE=%s." % (self.name, "\n".join(attrdef))]
+        return ["VARIABLE ATTRIBUTE VARIABLES=%s ATTRIBUTE=%s." % (self.name, self.getTextSpec())]
+    
+    def getTextSpec(self):
+        """Return the Text attribute array specification"""
+        
+        return "\n".join(["Text[%s](%s)" % (i+1, sq(item)) for i, item in enumerate(self.text)])
 
     def getMRset(self):
         """Return MD or MR set syntax"""
         
         if self.type != "multiple":
             return []
+        return ["MRSETS %s." % self.getMRsetSpec()]
+    
+    def getMRsetSpec(self):
+        """Return the MRSETS subcommand defining the set"""
+        
         if self.spreadsubfields:
         # spread format = MC group
-            cmd = """MRSETS /MCGROUP NAME=$%s LABEL=%s 
-VARIABLES=%s.""" % (self.name, 
+            return """/MCGROUP NAME=$%s LABEL=%s 
+VARIABLES=%s""" % (self.name, 
                 sq(self.label), self.vardef)
         else:  #MD group
-            cmd = """MRSETS /MDGROUP name=$%s LABEL=%s 
+            return """/MDGROUP name=$%s LABEL=%s 
 VARIABLES=%s 
-VALUE=1.""" % (self.name, 
+VALUE=1""" % (self.name, 
                 sq(self.label), " ".join(self.mdsetvars))
-        return [cmd]
         
     def getFullLabelAttr(self, varname, label, fulllabelattr, tw):
         """Return custom attribute syntax as a list for label if fulllabelattr or empty list
@@ -617,16 +1873,9 @@ VALUE=1.""" % (self.name,
         if not fulllabelattr:
             return []
         
-        wrapped = tw.wrap(label)
-        lines = [sq(item + " ") for item in wrapped]
-        lastline = len(lines) - 1
-        
         cmd = ["VARIABLE ATTRIBUTE VARIABLES = %s ATTRIBUTE = FullLabelText(" % varname]
-        for linenumber, line in enumerate(lines):
-            if linenumber < lastline:
-                cmd.append(line + "+")
-            else:
-                cmd.append(line + ").")
+        cmd.extend(fulllabellines(label, tw))
+        cmd[-1] = cmd[-1] + "."
         return cmd
         
     def makemvcode(self, strmvcode):
@@ -640,14 +1889,81 @@ VALUE=1.""" % (self.name,
         if self.rangeto is not None:   # not allowed for literals
             return str(float(self.rangeto) * 100 + 1)  # add 1 in case rangeto is 0
         else:
-            biggest = max(self.values.keys())
             if self.format != "literal":
-                return biggest * 10 + 1   # add 1 in case biggest is 0
+                biggest = max(self.values, key=float)
+                try:    # keep integer codes integer
+                    return str(int(biggest) * 10 + 1)   # add 1 in case biggest is 0
+                except ValueError:
+                    return str(float(biggest) * 10 + 1)
             else:
+                biggest = max(self.values.keys())
                 # use the next character code after the code of the last character
                 # and hope that it is defined as an actual character
                 biggest = biggest[:-1] + chr(ord(biggest[-1])+1)
                 return sq(biggest)
+    
+    def getXml(self, recordformat):
+        """Return the Triple-S variable element as a list of lines
+        
+        This is the reverse of parsing: each attribute is written as the
+        element that sets it.  Text items made from a text element with a
+        mode get the mode back."""
+        
+        escape, quoteattr = saxutils.escape, saxutils.quoteattr
+        attrs = " ident=%s type=%s" % (quoteattr(str(self.ident)), quoteattr(self.type))
+        if self.use not in [None, "regular"]:
+            attrs += " use=%s" % quoteattr(self.use)
+        if self.format == "literal":
+            attrs += ' format="literal"'
+        lines = ["<variable%s>" % attrs, "  <name>%s</name>" % escape(self.name)]
+        if self.label:
+            lines.append("  <label>%s</label>" % escape(self.label))
+        if recordformat == "fixed" and self.position[1] is not None:
+            lines.append('  <position start="%d" finish="%d"/>' % self.position)
+        else:
+            lines.append('  <position start="%d"/>' % self.position[0])
+        if self.spreadsubfields is not None:
+            if self.spreadwidth is None:
+                lines.append('  <spread subfields="%s"/>' % self.spreadsubfields)
+            else:
+                lines.append('  <spread subfields="%s" width="%s"/>' % (self.spreadsubfields, self.spreadwidth))
+        if self.values or self.rangefrom is not None:
+            lines.append("  <values>")
+            if self.rangefrom is not None:
+                lines.append("    <range from=%s to=%s/>" % (quoteattr(self.rangefrom), quoteattr(self.rangeto)))
+            for code, label in self.values.items():
+                score = self.scores.get(code)
+                score = "" if score is None else " score=%s" % quoteattr(score)
+                lines.append("    <value code=%s%s>%s</value>" % (quoteattr(code), score, escape(label)))
+            lines.append("  </values>")
+        if self.size is not None:
+            lines.append("  <size>%s</size>" % self.size)
+        if self.filter:
+            lines.append("  <filter>%s</filter>" % escape(self.filter))
+        for text in self.text:
+            m = re.match(r"Mode: (.*?)\.  (.*)", text, flags=re.S)
+            if m:
+                lines.append("  <text mode=%s>%s</text>" % (quoteattr(m.group(1)), escape(m.group(2))))
+            else:
+                lines.append("  <text>%s</text>" % escape(text))
+        lines.append("</variable>")
+        return lines
+        
+def fulllabellines(label, tw):
+    """Return the FullLabelText attribute value as a list of lines ending with ")"
+    
+    tw is a text wrapper"""
+    
+    wrapped = tw.wrap(label)
+    lines = [sq(item + " ") for item in wrapped]
+    lastline = len(lines) - 1
+    result = []
+    for linenumber, line in enumerate(lines):
+        if linenumber < lastline:
+            result.append(line + "+")
+        else:
+            result.append(line + ")")
+    return result
         
 class Datafile(object):
     def __init__(self, version, languages, mode):
@@ -660,15 +1976,41 @@ class Datafile(object):
         # attributes in alpha order
         
         doc = ['ADD DOCUMENT ']
+        doc.extend(sq(line) for line in self.getLines())
+        doc[-1] = doc[-1] + "."
+        return doc
+    
+    def getXml(self):
+        """Return the sss and survey elements that precede the record as a list of lines"""
+        
+        escape = saxutils.escape
+        attrs = " version=%s" % saxutils.quoteattr(self.version or "2.0")
+        if self.languages:
+            attrs += " languages=%s" % saxutils.quoteattr(self.languages)
+        if self.mode:
+            attrs += " modes=%s" % saxutils.quoteattr(self.mode)
+        lines = ["<sss%s>" % attrs]
+        for item in ["date", "time", "origin", "user"]:
+            if getattr(self, item, None):
+                lines.append("  <%s>%s</%s>" % (item, escape(getattr(self, item)), item))
+        lines.append("  <survey>")
+        for item in ["name", "title"]:
+            if getattr(self, item, None):
+                lines.append("    <%s>%s</%s>" % (item, escape(getattr(self, item)), item))
+        return lines
+    
+    def getLines(self):
+        "Return the attributes as a list of document lines"
+        
+        lines = []
         priority = ['title', 'name','version', 'date']
         for item in priority:
             if hasattr(self, item):
-                doc.extend(quoteprefixandlist(item + ": ", getattr(self,item)))
+                lines.extend(prefixandlist(item + ": ", getattr(self,item)))
         for k, v in sorted(self.__dict__.items()):
             if k not in priority and v is not None :
-                doc.extend(quoteprefixandlist(k + ": ", v))
-        doc[-1] = doc[-1] + "."
-        return doc
+                lines.extend(prefixandlist(k + ": ", v))
+        return lines
         
 def quoteprefixandlist(prefix, items):
     """Return list with prefix and first item on one line plus others all smartquoted
@@ -676,7 +2018,15 @@ def quoteprefixandlist(prefix, items):
     prefix is the prefix for the first line - can be None
     items is a string or list of items that may contain newlines"""
     
-    if not spssaux._isseq(items):
+    return [sq(item) for item in prefixandlist(prefix, items)]
+
+def prefixandlist(prefix, items):
+    """Return list with prefix and first item on one line plus the other lines
+    
+    prefix is the prefix for the first line - can be None
+    items is a string or list of items that may contain newlines"""
+    
+    if not isinstance(items, (list, tuple)):
         items = [items]
     # Make each line a separate list member
     items = [jitem for jitem in flatten([item.split("\n") for item in items])]
@@ -685,13 +2035,13 @@ def quoteprefixandlist(prefix, items):
         result.extend(items[1:])
     else:
         result = items
-    return [sq(item) for item in result]
+    return result
 
 def flatten(seq):
     "generator for a flattened version of seq, which must be a sequence"
     
     for item in seq:
-        if spssaux._isseq(item):
+        if isinstance(item, (list, tuple)):
             for subitem in flatten(item):
                 yield subitem
         else:
@@ -701,9 +2051,74 @@ class Record(object):
     def __init__(self, ident, format, skip, href):
         attributesFromDict(locals())
 
+class Hierarchy(object):
+    """Levels of a hierarchical survey, each with its own metadata and data file"""
+    
+    def __init__(self):
+        self.levels = []
+    
+    def ordered(self, metadatafile):
+        """Return the levels with parents before children
+        
+        metadatafile is the hierarchy file.  Level hrefs are resolved relative to it."""
+        
+        levels = dict((level.ident, level) for level in self.levels)
+        for level in self.levels:
+            level.metadatafile = os.path.join(os.path.dirname(metadatafile), level.href)
+            for parent in level.parents:
+                if parent.parlev not in levels:
+                    raise ValueError(_("""Hierarchy level %s refers to an undefined parent level: %s""")\
+                        % (level.ident, parent.parlev))
+        result = []
+        done = set()
+        def visit(level, path):
+            if level.ident in done:
+                return
+            if level.ident in path:
+                raise ValueError(_("""The hierarchy levels have a circular list of parents: %s""")\
+                    % " ".join(path + [level.ident]))
+            for parent in level.parents:
+                visit(levels[parent.parlev], path + [level.ident])
+            done.add(level.ident)
+            result.append(level)
+        for level in self.levels:
+            visit(level, [])
+        return result
+    
+    def chain(self, metadatafile):
+        """Return the levels from the root to the lowest level for flattening
+        
+        Flattening requires each level to have at most one parent and one child"""
+        
+        levels = self.ordered(metadatafile)
+        children = {}
+        for level in levels:
+            if len(level.parents) > 1:
+                raise ValueError(_("""Level %s has more than one parent.  The hierarchy cannot be flattened""")\
+                    % level.ident)
+            for parent in level.parents:
+                children.setdefault(parent.parlev, []).append(level)
+        roots = [level for level in levels if not level.parents]
+        if len(roots) != 1 or any(len(c) > 1 for c in children.values()):
+            raise ValueError(_("""The hierarchy has more than one branch.  It cannot be flattened"""))
+        chain = roots
+        while chain[-1].ident in children:
+            chain.append(children[chain[-1].ident][0])
+        return chain
+
+class Level(object):
+    def __init__(self, ident, href):
+        attributesFromDict(locals())
+        self.parents = []
+
+class Parent(object):
+    def __init__(self, parlev, linkvar, ordered):
+        attributesFromDict(locals())
+
 def gensyntax(par, metadatafile, data, syntax, strmvcode, dataencoding, 
-        maxdatalength, fulllabelattr, mdsetvallabels, scorerecode):
-    """Return syntax as list of lines
+        maxdatalength, fulllabelattr, mdsetvallabels, scorerecode, mrexpand="if",
+        coalesce=False, spssver=None, casesel=None, unicodemode=None, timer=None):
+    """Generator for syntax as lists of lines, each list ending with a complete command
     
     par is a metadata handler object
     metadatafile is the name of the xml file with the definitions
@@ -711,26 +2126,51 @@ def gensyntax(par, metadatafile, data, syntax, strmvcode, dataencoding,
     If data is None, the name is derived from the metadatafile name
     syntax is the filename to write to or None
     strmvcode is the code to be used for missing data in strings
-    dataencoding is the encoding to be assumed for the data
-    maxdatalength is >= the maximum record length
+    dataencoding is the encoding to be assumed for the data: utf8, locale, auto or a codec name.
+    Data in other encodings are converted to the session encoding.
+    maxdatalength is >= the maximum record length or "auto" to measure it
     fulllabelattr is flag for whether to generate full label attribute
-    mdsetvallabels is a two-element dictionary for MD set value labels"""
+    mdsetvallabels is a two-element dictionary for MD set value labels
+    mrexpand is "if" or "loop" for creating csv MR set members
+    coalesce indicates whether dictionary commands are combined across variables
+    spssver is the plugin version or None to get it from Statistics
+    casesel is a CaseSelection or None to read all the records
+    unicodemode is the Statistics unicode setting or None to get it from Statistics
+    timer is a PhaseTimer or None.  Preparing the data file is timed in its own phases."""
     
-    spssver = spss.GetDefaultPlugInVersion()
+    if timer is None:
+        timer = PhaseTimer(False)
+    if spssver is None:
+        spssver = spss.GetDefaultPlugInVersion()
     encodingkwdok = int(spssver[4:]) >= 210
     tw = textwrap.TextWrapper(width=100, break_long_words=False, break_on_hyphens=False)
     if data is None:
-        data = os.path.splitext(metadatafile)[0] + "." + "txt"    
-    cmds = []
-    cmds.append(["""* Syntax created by STATS GET TRIPLES on %s.""" % time.asctime()])
-    cmds.append(["""* Metadata file: %s.""" % metadatafile])
+        data = defaultdatafile(metadatafile)
+    # the data must be a plain file in the session encoding for Statistics
+    if dataencoding.lower() == "auto":
+        with timer.phase(_("Detect data encoding")):
+            dataencoding = resolveencoding(dataencoding, data, metadatafile)
+    if dataencoding.lower() not in ["utf8", "locale"]:
+        if unicodemode is None:
+            unicodemode = spss.PyInvokeSpss.IsUTF8mode()
+        with timer.phase(_("Convert data encoding")):
+            par, data, dataencoding = sessiondata(par, data, dataencoding, unicodemode)
+    elif compression(data) is not None:
+        with timer.phase(_("Extract data file")):
+            data = ExtractCache().extract(data)
+    if maxdatalength == "auto":
+        with timer.phase(_("Measure record length")):
+            maxdatalength = autorecordlength(par, data)
+    yield ["""* Syntax created by STATS GET TRIPLES on %s.""" % time.asctime(),
+        """* Metadata file: %s.""" % metadatafile]
 
     handle = "D" + str(random.uniform(.1, 1))
-    cmds.append("""FILE HANDLE %s /NAME ="%s" /LRECL=%s.""" % (handle, data, maxdatalength))
+    yield ["""FILE HANDLE %s /NAME ="%s" /LRECL=%s.""" % (handle, data, maxdatalength)]
    
+    skipped = []
     if par.record.format == "fixed":
-        cmds.append(["""DATA LIST FIXED FILE="%s" ENCODING=%s/""" % (handle, dataencoding)])
-        cmds.extend((var.getDataList(par.record.format) for var in par.variables))
+        datalist = ["""DATA LIST FIXED FILE="%s" ENCODING=%s/""" % (handle, dataencoding)]
+        datalist.extend(var.getDataList(par.record.format) for var in par.variables)
     else:
         firstcase = par.record.skip
         if firstcase is None:
@@ -741,63 +2181,3638 @@ def gensyntax(par, metadatafile, data, syntax, strmvcode, dataencoding,
             enc = "/ENCODING= %s" % dataencoding
         else:
             enc = ""
-        cmds.append(["""GET DATA /TYPE = TXT /FILE="%s" %s
-    /FIRSTCASE=%s /DELIMITERS="," /QUALIFIER='"'/VARIABLES = """ % (handle, enc, firstcase)])
+        datalist = ["""GET DATA /TYPE = TXT /FILE="%s" %s
+    /FIRSTCASE=%s /DELIMITERS="," /QUALIFIER='"'/VARIABLES = """ % (handle, enc, firstcase)]
         items = sorted((var.getDataList(par.record.format) for var in par.variables))
-        cmds.extend([item[1] for item in items])
-    cmds[-1] = cmds[-1] + "."
+        # fields without a variable are read into placeholders that are deleted
+        skipped = sorted(set(range(1, items[-1][0])) - set(item[0] for item in items))
+        items.extend([field, "@skip%d A1" % field] for field in skipped)
+        datalist.extend(item[1] for item in sorted(items))
+    datalist[-1] = datalist[-1] + "."
+    yield datalist
+    if skipped:
+        delete = prefixandlist("DELETE VARIABLES ", tw.wrap(" ".join("@skip%d" % field for field in skipped)))
+        delete[-1] = delete[-1] + "."
+        yield delete
+    if casesel is not None:
+        yield casesel.getSyntax(par, data)
     # For MD set variables and csv format, need to break out the component variables
     for var in par.variables:
-        cmds.extend(var.fixupCsv(par.record.format))
+        yield var.fixupCsv(par.record.format, mrexpand)
 
     # add document - data file must be defined first
     # items are assumed to fit SPSS line length limits from here on
-    cmds.extend(par.datafile.get())
-    metadata = []
+    yield par.datafile.get()
+    if coalesce:
+        metadata = gencoalesced
+    else:
+        metadata = genmetadata
+    for block in metadata(par, strmvcode, fulllabelattr, mdsetvallabels, scorerecode, tw):
+        yield block
+
+def autorecordlength(par, data):
+    """Return the record length to use for a data file, warning about records that are too long
+    
+    par is the metadata handler
+    data is the data file.  It is scanned once.
+    For fixed format, the records are checked against the widest variable position"""
+    
+    # with a variable selection the other columns are ignored anyway
+    if par.record.format == "fixed" and par.selection is None:
+        limit = max([var.getFinish() for var in par.variables] + [1])
+    else:
+        limit = None
+    try:
+        longest, nrecords, nlonger = recordlengths(data, limit)
+    except (IOError, OSError) as e:
+        raise ValueError(_("""The record length cannot be determined for data file %s: %s""") % (data, e))
+    if nlonger:
+        print(_("""Warning: %s of %s records in %s are longer than the %s bytes described by the metadata.
+The longest is %s bytes.  The extra bytes are ignored.""") % (nlonger, nrecords, data, limit, longest))
+    return max(longest, limit or 1)
+
+def recordlengths(datafile, limit=None):
+    """Return the longest record length in bytes, the number of records and the number longer than limit
+    
+    datafile is memory mapped and scanned in a single pass.  Line ends are not counted.
+    limit is None or the expected maximum length"""
+    
+    longest = nrecords = nlonger = 0
+    with open(datafile, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return longest, nrecords, nlonger
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            find = mm.find
+            pos = 0
+            while pos < size:
+                end = find(b"\n", pos)
+                if end < 0:
+                    end = size
+                length = end - pos
+                if length and mm[end - 1] == 13:   # carriage return
+                    length -= 1
+                nrecords += 1
+                if length > longest:
+                    longest = length
+                if limit is not None and length > limit:
+                    nlonger += 1
+                pos = end + 1
+    return longest, nrecords, nlonger
+
+def genmetadata(par, strmvcode, fulllabelattr, mdsetvallabels, scorerecode, tw,
+        transformed=frozenset()):
+    """Generator for dictionary syntax as a list of lines for each variable
+    
+    par is a metadata handler object whose variable definitions have been generated
+    tw is a text wrapper object
+    transformed is the set of variable names whose filter and score recode
+    have already been applied to the data, so only the declarations are needed
+    The other parameters are as for gensyntax"""
+    
     for var in par.variables:
-        metadata.extend(var.getVarLabel(mdsetvallabels, fulllabelattr, tw))
+        done = var.name in transformed
+        metadata = var.getVarLabel(mdsetvallabels, fulllabelattr, tw)
         metadata.extend(var.getValueLabels(scorerecode))
         metadata.extend(var.getScores())
-        metadata.extend(var.getMissing(strmvcode))
+        metadata.extend(var.getMissing(strmvcode, transform=not done))
         metadata.extend(var.getText())
         metadata.extend(var.getMRset())
         metadata.extend(var.getWeight())
-        if scorerecode:
+        if scorerecode and not done:
             metadata.extend(var.getRecode())
     
-    # clear out empty syntax and replace quote escape with SPSS convention
-    metadata = [item.replace("&quot;", '""') for item in metadata if item]
-    cmds.extend(metadata)
-    for i in range(len(cmds)):
-        if isinstance(cmds[i], list):
-            cmds[i] = cmds[i][0]
-        
-    return cmds
+        # clear out empty syntax and replace quote escape with SPSS convention
+        yield [item.replace("&quot;", '""') for item in metadata if item]
+
+# maximum number of variables or groups combined in one command
+COALESCECHUNK = 500
+
+def gencoalesced(par, strmvcode, fulllabelattr, mdsetvallabels, scorerecode, tw,
+        transformed=frozenset(), chunksize=COALESCECHUNK):
+    """Generator for dictionary syntax with the definitions of all variables combined
+    
+    Variables with identical value labels, scores, text attributes, missing
+    value codes or recodes share a single specification, and labels and
+    MRSETS are merged into multi-variable commands.  The arguments are as
+    for genmetadata.  chunksize limits the number of specifications per command.
+    
+    Filter computations and missing value declarations stay in variable order
+    if any filters are computed here, since a filter may refer to an earlier
+    variable that has been recoded or has missing values"""
+    
+    pending = any(var.filter is not None and var.name not in transformed for var in par.variables)
+    labels = []
+    fulllabels = {}
+    valuelabels = {}
+    scores = {}
+    texts = {}
+    missing = {}
+    recodes = {}
+    mrsets = []
+    transforms = []
+    weight = []
+    for var in par.variables:
+        done = var.name in transformed
+        for name, label in var.getLabelPairs():
+            labels.append("%s %s" % (name, sq(label)))
+            if fulllabelattr:
+                fulllabels.setdefault(label, []).append(name)
+        if var.vardeflist and not var.spreadsubfields:  # MD set
+            valuelabels.setdefault(("0 %s 1 %s" % (mdsetvallabels[0], mdsetvallabels[1]),),
+                []).extend(var.vardeflist)
+        lines = var.getValueLabelLines(scorerecode)
+        if lines:
+            valuelabels.setdefault(tuple(lines), []).append(var.vardef)
+        lines = var.getScoreLines()
+        if lines:
+            scores.setdefault(tuple(lines), []).extend(var.vardeflist or [var.name])
+        if var.text:
+            texts.setdefault(var.getTextSpec(), []).append(var.name)
+        if pending:
+            transforms.extend(var.getMissing(strmvcode, transform=not done))
+            if scorerecode and not done:
+                transforms.extend(var.getRecode())
+        else:
+            if var.filter is not None:
+                missing.setdefault(var.makemvcode(strmvcode), []).append(var.name)
+            if scorerecode and not done:
+                lines = var.getRecodeLines()
+                if lines:
+                    recodes.setdefault(tuple(lines), []).append(var.vardef)
+        if var.type == "multiple":
+            mrsets.append(var.getMRsetSpec())
+        weight.extend(var.getWeight())
+    
+    def names(varlist):
+        return "\n".join(tw.wrap(" ".join(varlist)))
+    
+    def commands(head, specs, sep=""):
+        """Generator for commands made of head and up to chunksize specs, each a list of lines"""
+        
+        for i in range(0, len(specs), chunksize):
+            cmd = [head]
+            for j, spec in enumerate(specs[i:i + chunksize]):
+                if j > 0 and sep:
+                    spec = [sep + spec[0]] + spec[1:]
+                cmd.extend(spec)
+            cmd[-1] = cmd[-1] + "."
+            yield cmd
+    
+    blocks = []
+    blocks.extend(commands("VARIABLE LABELS", [[item] for item in labels], "/"))
+    blocks.extend(commands("VARIABLE ATTRIBUTE",
+        [["VARIABLES = %s ATTRIBUTE = FullLabelText(" % names(v)] + fulllabellines(k, tw)
+        for k, v in fulllabels.items()], "/"))
+    blocks.extend(commands("VALUE LABELS", [[names(v)] + list(k) for k, v in valuelabels.items()], "/"))
+    blocks.extend(commands("VARIABLE ATTRIBUTE",
+        [["VARIABLES = %s ATTRIBUTE=" % names(v)] + list(k) for k, v in scores.items()], "/"))
+    blocks.extend(commands("VARIABLE ATTRIBUTE",
+        [["VARIABLES=%s ATTRIBUTE=%s" % (names(v), k)] for k, v in texts.items()], "/"))
+    if pending:
+        blocks.append(transforms)
+    else:
+        blocks.extend(commands("MISSING VALUES", [["%s (%s)" % (names(v), k)] for k, v in missing.items()], "/"))
+    blocks.extend(commands("MRSETS", [[item] for item in mrsets]))
+    if not pending:
+        blocks.extend(commands("RECODE", [[names(v)] + list(k) for k, v in recodes.items()], "/"))
+    blocks.append(weight)
+    for block in blocks:
+        # clear out empty syntax and replace quote escape with SPSS convention
+        block = [item.replace("&quot;", '""') for item in block if item]
+        if block:
+            yield block
+
+# number of syntax lines accumulated before they are submitted
+SUBMITBATCHSIZE = 5000
+
+def processsyntax(syntax, syntaxfile=None, execute=False, batchsize=SUBMITBATCHSIZE,
+        unicodemode=None, timer=None):
+    """Write and/or submit syntax in a single pass
+    
+    syntax is an iterable of lists of lines, each list ending with a complete command
+    syntaxfile is the file to write to with file handles resolved or None
+    execute indicates whether to submit the syntax.  Lines are submitted
+    in batches of about batchsize lines ending with a complete command.
+    unicodemode is the Statistics unicode setting or None to get it from Statistics
+    timer is a PhaseTimer or None"""
+    
+    if timer is None:
+        timer = PhaseTimer(False)
+    f = None
+    if syntaxfile is not None:
+        f = opensyntaxfile(syntaxfile, unicodemode)
+    try:
+        batch = []
+        for block in timer.timediter(syntax, _("Generate syntax")):
+            if f is not None:
+                try:
+                    with timer.phase(_("Write syntax file")):
+                        for line in block:
+                            f.write(line + "\n")
+                except UnicodeEncodeError:
+                    raise ValueError(_("""The metadata contains text invalid in the current character set.
+The syntax file cannot be written in that character set.
+Running Statistics in Unicode mode might resolve this problem."""))
+            if execute:
+                batch.extend(block)
+                if len(batch) >= batchsize:
+                    submitbatch(batch, timer)
+                    batch = []
+        if batch:
+            submitbatch(batch, timer)
+    finally:
+        if f is not None:
+            f.close()
+            timer.count(_("Write syntax file"), _("Bytes"), os.path.getsize(syntaxfile))
+
+def submitbatch(batch, timer):
+    """Submit a list of syntax lines, recording the time taken"""
+    
+    with timer.phase(_("Submit syntax")):
+        spss.Submit(batch)
+    timer.count(_("Submit syntax"), _("Lines"), len(batch))
+    timer.count(_("Submit syntax"), _("Batches"))
+
+def opensyntaxfile(syntaxfile, unicodemode=None):
+    """Return syntaxfile opened for writing in the proper encoding"""
+    
+    if unicodemode is None:
+        unicodemode = spss.PyInvokeSpss.IsUTF8mode()
+    if unicodemode:
+        outputencoding = "utf_8_sig"
+    else:
+        outputencoding = locale.getlocale()[1]
+    return open(syntaxfile, "w", encoding=outputencoding, newline="")
 
 def writesyntax(syntax, syntaxfile):
     """Write syntax to file in proper encoding
     
-    syntax is the list of commands to write
-    syntaxfile is the file to write to with file handles resolved"""
+    syntax is an iterable of lists of lines
+    syntaxfile is the file to write to with file handles resolved"""
+    
+    processsyntax(syntax, syntaxfile)
+
+class PhaseTimer(object):
+    """Accumulate wall time, peak Python memory and item counts by phase
+    
+    When not enabled nothing is measured, and the methods cost very little.
+    The time of a phase measured inside another phase is charged only to the
+    inner one."""
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = {}
+        self.order = []
+        self.items = []
+        self.nested = []    # time of the inner phases of each phase being measured
+        self.tracing = enabled and not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+    
+    def getphase(self, name):
+        """Return the [seconds, peak bytes, counts] list for phase name"""
+        
+        if name not in self.phases:
+            self.phases[name] = [0., 0, {}]
+            self.order.append(name)
+        return self.phases[name]
+    
+    def phase(self, name):
+        """Return a context manager that times the code it encloses as phase name"""
+        
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.measure(name)
+    
+    @contextlib.contextmanager
+    def measure(self, name):
+        stats = self.getphase(name)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        self.nested.append(0.)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stats[0] += elapsed - self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+            if tracemalloc.is_tracing():
+                stats[1] = max(stats[1], tracemalloc.get_traced_memory()[1])
+    
+    def count(self, name, item, n=1):
+        """Add n to the count of item for phase name"""
+        
+        if self.enabled:
+            counts = self.getphase(name)[2]
+            counts[item] = counts.get(item, 0) + n
+            if item not in self.items:
+                self.items.append(item)
+    
+    def timediter(self, items, name):
+        """Return an iterator over items with the time to produce them charged to phase name
+        
+        items must be lists of syntax lines.  The lines and commands are counted."""
+        
+        if not self.enabled:
+            return items
+        return self.timedgen(iter(items), name)
+    
+    def timedgen(self, items, name):
+        while True:
+            with self.measure(name):
+                block = next(items, None)
+            if block is None:
+                return
+            self.count(name, _("Lines"), len(block))
+            self.count(name, _("Commands"), sum(1 for line in block if line.rstrip().endswith(".")))
+            yield block
+    
+    def counted(self, batches, name, item):
+        """Return an iterator over lists counting their lengths as item for phase name"""
+        
+        if not self.enabled:
+            return batches
+        return self.countedgen(batches, name, item)
+    
+    def countedgen(self, batches, name, item):
+        for batch in batches:
+            self.count(name, item, len(batch))
+            yield batch
+    
+    def stop(self):
+        """Stop measuring memory"""
+        
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+    
+    def display(self):
+        """Display the measurements as a pivot table if enabled"""
+        
+        if not self.enabled or not self.order:
+            return
+        StartProcedure(_("Get Triple-S"), "STATSGETTRIPLES")
+        try:
+            pt = spss.BasePivotTable(_("Timing and Memory by Phase"), "STATSGETTRIPLESTIMING")
+            cells = []
+            for name in self.order:
+                seconds, peak, counts = self.phases[name]
+                cells.append(round(seconds, 3))
+                cells.append(round(peak / 1024., 1))
+                cells.extend(counts.get(item, "") for item in self.items)
+            pt.SimplePivotTable(rowdim=_("Phase"), rowlabels=self.order,
+                coldim=_("Statistics"),
+                collabels=[_("Seconds"), _("Peak Memory (KB)")] + self.items,
+                cells=cells)
+            spss.TextBlock(_("Timing"), _("""Total seconds: %.3f.  Peak memory is the largest amount of memory allocated by Python during each phase.""")\
+                % sum(stats[0] for stats in self.phases.values()))
+        finally:
+            spss.EndProcedure()
+
+class DiskCache(object):
+    """Directory of cache files bounded by total size and age
+    
+    Files are named by key.  The file modification time records the last use.
+    The least recently used files are removed when the total size exceeds the
+    limit, and files not used within the age limit are removed.  An entry may
+    also be a directory of files."""
+    
+    suffix = ""
+    
+    def __init__(self, cachedir, maxbytes, maxage=None):
+        """cachedir is the directory for the cache files.  It is created if necessary.
+        maxbytes is the maximum total size of the cache files
+        maxage is the number of seconds an unused file is kept or None"""
+        
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        self.maxage = maxage
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+    
+    def entry(self, key):
+        """Return the file specification for key"""
+        
+        return os.path.join(self.cachedir, key + self.suffix)
+    
+    def touch(self, key):
+        """Return the file for key marked as recently used or None if there is none"""
+        
+        entry = self.entry(key)
+        try:
+            os.utime(entry, None)
+        except OSError:
+            return None
+        return entry
+    
+    def evict(self):
+        """Remove files until the cache fits the size and age limits"""
+        
+        entries = []
+        for name in os.listdir(self.cachedir):
+            if name.endswith(self.suffix) and not name.endswith(".tmp" + self.suffix):
+                try:
+                    st = os.stat(os.path.join(self.cachedir, name))
+                    size = entrysize(os.path.join(self.cachedir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, size, name))
+        total = sum(item[1] for item in entries)
+        if self.maxage is not None:
+            oldest = time.time() - self.maxage
+        else:
+            oldest = None
+        for mtime, size, name in sorted(entries):
+            if total <= self.maxbytes and (oldest is None or mtime >= oldest):
+                break
+            try:
+                if os.path.isdir(os.path.join(self.cachedir, name)):
+                    shutil.rmtree(os.path.join(self.cachedir, name))
+                else:
+                    os.remove(os.path.join(self.cachedir, name))
+                total -= size
+            except OSError:
+                pass
+
+def entrysize(path):
+    """Return the size of a file or the total size of the files in a directory"""
+    
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+class ParseCache(DiskCache):
+    """Size-bounded disk cache of parsed metadata models
+    
+    Entries are pickled (datafile, record, variables, hierarchy) tuples."""
+    
+    suffix = ".pickle"
+    # change when the pickled model changes incompatibly
+    modelversion = 3
+    
+    def __init__(self, cachedir=None, maxbytes=200 * 1024 * 1024):
+        if cachedir is None:
+            cachedir = os.path.join(tempfile.gettempdir(), "STATS_GET_TRIPLES_cache", "parse")
+        super(ParseCache, self).__init__(cachedir, maxbytes)
+    
+    def makekey(self, metadatafile, removehtml, language):
+        """Return the cache key for a metadata file and parse options
+        
+        The key covers the path, size, modification time and content hash of the file"""
+        
+        st = os.stat(storedfile(metadatafile))
+        key = hashlib.sha256()
+        key.update(repr((os.path.abspath(metadatafile), st.st_size, st.st_mtime_ns,
+            bool(removehtml), language, ParseCache.modelversion)).encode("utf_8"))
+        key.update(filehash(metadatafile).encode("ascii"))
+        return key.hexdigest()
+    
+    def get(self, key):
+        """Return the cached model for key or None"""
+        
+        entry = self.entry(key)
+        try:
+            with open(entry, "rb") as f:
+                model = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        self.touch(key)
+        return model
+    
+    def put(self, key, model):
+        """Save model under key and enforce the size limit"""
+        
+        fd, temp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp" + self.suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self.entry(key))
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+            return
+        self.evict()
+
+class DatasetCache(DiskCache):
+    """Disk cache of sav files created from Triple-S files
+    
+    The key is built from the contents of the metadata and data files
+    and the settings, so unchanged inputs map to the same sav file."""
+    
+    suffix = ".sav"
+    
+    def makekey(self, metadatafile, datafile, settings):
+        """Return the cache key for the input files and settings
+        
+        settings is a tuple of all the values that affect the dataset"""
+        
+        key = hashlib.sha256()
+        key.update(filehash(metadatafile).encode("ascii"))
+        key.update(filehash(datafile).encode("ascii"))
+        key.update(repr(settings).encode("utf_8"))
+        return key.hexdigest()
+    
+    def get(self, key):
+        """Return the cached sav file for key or None"""
+        
+        return self.touch(key)
+    
+    def open(self, entry):
+        """Make the cached sav file the active dataset"""
+        
+        spss.Submit("""GET FILE="%s".""" % entry)
+        print(_("""Dataset read from cache: %s""") % entry)
+    
+    def save(self, key):
+        """Save the active dataset under key and enforce the limits"""
+        
+        temp = os.path.join(self.cachedir, key + ".tmp" + self.suffix)
+        spss.Submit("""SAVE OUTFILE="%s" /COMPRESSED.""" % temp)
+        try:
+            os.replace(temp, self.entry(key))
+        except OSError:
+            return
+        self.evict()
+
+class ExtractCache(DiskCache):
+    """Disk cache of decompressed or converted data files for syntax, which can only read
+    plain files in the session encoding
+    
+    Entries are named by a hash of the original file and the conversion."""
+    
+    suffix = ".txt"
+    
+    def __init__(self, cachedir=None, maxbytes=2000 * 1024 * 1024):
+        if cachedir is None:
+            cachedir = os.path.join(tempfile.gettempdir(), "STATS_GET_TRIPLES_cache", "extract")
+        super(ExtractCache, self).__init__(cachedir, maxbytes)
+    
+    def extract(self, datafile, transcoder=None):
+        """Return a plain copy of a compressed data file, decompressing it if it is not cached
+        
+        transcoder is a Transcoder to convert the data to another encoding or None"""
+        
+        key = filehash(datafile)
+        if transcoder is not None:
+            key = hashlib.sha256((key + transcoder.key()).encode("utf_8")).hexdigest()
+        entry = self.touch(key)
+        if entry is not None:
+            return entry
+        fd, temp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp" + self.suffix)
+        try:
+            with os.fdopen(fd, "wb") as f, openinput(datafile) as source:
+                if transcoder is None:
+                    shutil.copyfileobj(source, f, 1024 * 1024)
+                else:
+                    transcoder.convert(source, f)
+            os.replace(temp, self.entry(key))
+        except:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self.evict()
+        if transcoder is None:
+            print(_("""The compressed data file %s was extracted to %s for the syntax""")\
+                % (datafile, self.entry(key)))
+        else:
+            print(_("""The data file %s was converted from %s to %s in %s for the syntax""")\
+                % (datafile, transcoder.source, transcoder.target, self.entry(key)))
+        return self.entry(key)
+
+# bytes at the start of a data file examined to detect its encoding
+ENCODINGSAMPLESIZE = 1024 * 1024
+# size of the blocks of csv data converted at a time
+TRANSCODECHUNKSIZE = 1024 * 1024
+
+# encoding in an xml declaration
+xmlencoding = re.compile(rb"""<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._:-]+)["']""")
+
+def localeencoding():
+    """Return the codec name of the current locale"""
+    
+    return locale.getlocale()[1] or locale.getpreferredencoding(False)
+
+def detectencoding(datafile, metadatafile):
+    """Return the codec name for the encoding of a data file
+    
+    A sample from the start of the file is examined.  If it is valid UTF-8,
+    which includes plain ASCII, the encoding is UTF-8.  Otherwise it is the
+    encoding in the xml declaration of the metadata file unless that is a
+    Unicode encoding, and failing that cp1252, which the standard expects."""
+    
+    with openinput(datafile) as f:
+        sample = f.read(ENCODINGSAMPLESIZE)
+    try:
+        # the last character may be cut off by the end of the sample
+        codecs.getincrementaldecoder("utf_8")().decode(sample, final=False)
+        return "utf_8"
+    except UnicodeDecodeError:
+        pass
+    with openinput(metadatafile) as f:
+        m = xmlencoding.search(f.read(1024))
+    if m is not None:
+        try:
+            name = codecs.lookup(m.group(1).decode("ascii")).name
+            if not name.startswith("utf"):
+                return name
+        except LookupError:
+            pass
+    return "cp1252"
+
+def resolveencoding(dataencoding, datafile, metadatafile):
+    """Return dataencoding with AUTO replaced by the detected encoding of datafile"""
+    
+    if dataencoding.lower() == "auto":
+        return detectencoding(datafile, metadatafile)
+    return dataencoding
+
+def sessiondata(par, data, dataencoding, unicodemode):
+    """Return (par, data file, DATA LIST encoding) for syntax reading data in a named encoding
+    
+    Statistics reads the data in the session encoding, so they are converted
+    unless they are in it already.  For fixed format data par is replaced by
+    a copy with the positions of the converted file."""
+    
+    if unicodemode:
+        target, keyword = "utf_8", "UTF8"
+    else:
+        target, keyword = localeencoding(), "LOCALE"
+    if codecs.lookup(dataencoding).name == codecs.lookup(target).name:
+        if compression(data) is not None:
+            data = ExtractCache().extract(data)
+        return par, data, keyword
+    transcoder = Transcoder(par, dataencoding, target)
+    return transcoder.relocate(par), ExtractCache().extract(data, transcoder), keyword
+
+class Transcoder(object):
+    """Conversion of a data file to another encoding without reading it all into memory
+    
+    Csv data are converted in blocks of TRANSCODECHUNKSIZE bytes with an
+    incremental decoder.  Fixed format records are converted one at a time,
+    field by field, so that every field keeps its position.  Character
+    fields are widened if their text can take more bytes in the new
+    encoding, and relocate gives the variables the new positions."""
+    
+    version = 1
+    
+    def __init__(self, par, source, target):
+        """par is the metadata handler object
+        source and target are codec names"""
+        
+        self.source = codecs.lookup(source).name
+        self.target = codecs.lookup(target).name
+        self.recordformat = par.record.format
+        # regions of the record as [start, end, new start, new end, widened] with ends exclusive
+        self.regions = []
+        if self.recordformat == "fixed":
+            self.layout(par)
+    
+    def key(self):
+        """Return a string identifying the conversion for cache keys"""
+        
+        return repr((self.source, self.target, self.regions, Transcoder.version))
+    
+    def growth(self):
+        """Return the most bytes that the character for one source byte takes in the target"""
+        
+        return max(len(bytes([b]).decode(self.source, errors="ignore").encode(self.target,
+            errors="replace")) for b in range(256))
+    
+    def layout(self, par):
+        """Compute the regions of fixed format records
+        
+        Variables whose columns overlap share a region, which can only be
+        widened if it holds a single variable."""
+        
+        growth = self.growth()
+        spans = sorted((var.position[0] - 1, var.getFinish(),
+            var.type == "character" or (var.format == "literal" and var.type != "multiple"))
+            for var in par.variables)
+        shift = 0
+        for start, end, isstring in spans:
+            if self.regions and start < self.regions[-1][1]:
+                region = self.regions[-1]
+                if growth > 1 and (region[4] or isstring):
+                    raise ValueError(_("""The data cannot be converted from %s to %s because the columns of character variables overlap other variables""")\
+                        % (self.source, self.target))
+                if end > region[1]:
+                    region[3] += end - region[1]
+                    shift += end - region[1]
+                    region[1] = end
+                continue
+            widened = isstring and growth > 1
+            width = (end - start) * (growth if widened else 1)
+            self.regions.append([start, end, start + shift, start + shift + width, widened])
+            shift += width - (end - start)
+    
+    def relocate(self, par):
+        """Return a shallow copy of par whose variables have the positions in the converted file"""
+        
+        if self.recordformat != "fixed":
+            return par
+        starts = [region[0] for region in self.regions]
+        moved = copy.copy(par)
+        moved.variables = []
+        for var in par.variables:
+            start = var.position[0] - 1
+            region = self.regions[bisect.bisect_right(starts, start) - 1]
+            var = copy.copy(var)
+            newstart = region[2] + start - region[0] + 1
+            if region[4]:
+                var.position = (newstart, region[3])
+            elif var.position[1] is None:
+                var.position = (newstart, None)
+            else:
+                var.position = (newstart, newstart + var.position[1] - var.position[0])
+            moved.variables.append(var)
+        return moved
+    
+    def convert(self, source, target):
+        """Convert the data from binary file source to binary file target"""
+        
+        if self.recordformat != "fixed":
+            decoder = codecs.getincrementaldecoder(self.source)(errors="replace")
+            encoder = codecs.getincrementalencoder(self.target)(errors="replace")
+            for block in iter(lambda: source.read(TRANSCODECHUNKSIZE), b""):
+                target.write(encoder.encode(decoder.decode(block)))
+            target.write(encoder.encode(decoder.decode(b"", final=True), final=True))
+            return
+        # ascii records only need padding of the widened fields
+        asciiplan = []
+        pos = 0
+        for start, end, newstart, newend, widened in self.regions:
+            if widened:
+                asciiplan.append((pos, end, newend - newstart - (end - start)))
+                pos = end
+        asciiplan.append((pos, None, 0))
+        recode = self.recode
+        write = target.write
+        for line in source:
+            record = line.rstrip(b"\r\n")
+            if record.isascii():
+                for start, end, pad in asciiplan:
+                    field = record[start:end]
+                    write(field)
+                    if pad:
+                        write(b" " * (pad + (end - start) - len(field)))
+            else:
+                write(recode(record))
+            write(b"\n")
+    
+    def recode(self, record):
+        """Return a fixed format record with each region converted and padded to its new width"""
+        
+        parts = []
+        pos = 0
+        for start, end, newstart, newend, widened in self.regions:
+            if start > pos:
+                parts.append(b" " * (start - pos))
+            text = record[start:end].decode(self.source, errors="replace")
+            field = text.encode(self.target, errors="replace")
+            while len(field) > newend - newstart:
+                text = text[:-1]
+                field = text.encode(self.target, errors="replace")
+            parts.append(field.ljust(newend - newstart))
+            pos = end
+        return b"".join(parts)
+
+class ColumnCache(DiskCache):
+    """Disk cache of decoded data stored as one column file per variable
+    
+    Each entry is a directory with a .npy file for each variable and a
+    manifest.json describing the columns and the Triple-S variables they
+    come from.  Numeric columns are float64 with NaN for sysmis, and string
+    columns are fixed width UTF-8 bytes, so the files can also be opened by
+    numpy with mmap_mode.  Reading maps the files into memory, so no text
+    is parsed, and only the columns wanted are touched."""
+    
+    suffix = ".columns"
+    # change when the stored format changes incompatibly
+    formatversion = 1
+    
+    def __init__(self, cachedir, maxbytes, maxage=None, settings=()):
+        """settings is a tuple of the values that affect the decoded data
+        The other parameters are as for DiskCache"""
+        
+        super(ColumnCache, self).__init__(cachedir, maxbytes, maxage)
+        self.settings = settings
+    
+    def makekey(self, metadatafile, datafile, encoding):
+        """Return the cache key for the input files read with encoding"""
+        
+        key = hashlib.sha256()
+        key.update(filehash(metadatafile).encode("ascii"))
+        key.update(filehash(datafile).encode("ascii"))
+        key.update(repr((self.settings, encoding, ColumnCache.formatversion)).encode("utf_8"))
+        return key.hexdigest()
+    
+    def batches(self, reader, par, metadatafile, datafile, batchsize, workers=1):
+        """Generator for lists of up to batchsize cases, from the cache if possible
+        
+        reader is the NativeReader for the data.  If the data are not cached,
+        the cases are decoded by reader using workers processes and saved as
+        they are produced.  The key is for the whole study, so a selection of
+        variables reads only its columns from the entry for all of them.  A
+        selection that is not cached is decoded but not saved."""
+        
+        key = self.makekey(metadatafile, datafile, reader.encoding)
+        entry = self.touch(key)
+        if entry is not None:
+            try:
+                store = ColumnStore(entry)
+            except (OSError, ValueError, KeyError):
+                store = None
+            stored = store is not None and dict((name.lower(), vartype) for name, vartype in store.columns)
+            if stored and all(stored.get(name.lower()) == vartype for name, vartype in reader.columns):
+                print(_("""Data read from column cache: %s""") % entry)
+                for batch in store.batches(batchsize, names=[name for name, vartype in reader.columns]):
+                    yield batch
+                return
+        if par.selection is not None:
+            for batch in reader.batches(datafile, batchsize, workers):
+                yield batch
+            return
+        tempdir = tempfile.mkdtemp(dir=self.cachedir, suffix=".tmp" + self.suffix)
+        try:
+            writer = ColumnWriter(tempdir, reader.columns, par.variables, reader.recordformat)
+            for batch in reader.batches(datafile, batchsize, workers):
+                writer.append(batch)
+                yield batch
+            writer.close()
+            if os.path.isdir(self.entry(key)):
+                shutil.rmtree(self.entry(key), ignore_errors=True)
+            os.replace(tempdir, self.entry(key))
+        finally:
+            if os.path.isdir(tempdir):
+                shutil.rmtree(tempdir, ignore_errors=True)
+        self.evict()
+
+# size of the .npy headers written.  It leaves room for any case count.
+NPYHEADERSIZE = 128
+
+def npyheader(descr, count):
+    """Return a version 1.0 .npy header for a one dimensional array"""
+    
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, count)
+    header = header + " " * (NPYHEADERSIZE - 10 - len(header) - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin_1")
+
+class ColumnWriter(object):
+    """Write decoded cases as a column store directory"""
+    
+    def __init__(self, directory, columns, variables, recordformat):
+        """directory is the empty directory for the store
+        columns is the list of (name, type) pairs for the cases
+        variables is the list of Variable objects the columns come from
+        recordformat is fixed or csv"""
+        
+        attributesFromDict(locals())
+        self.ncases = 0
+        self.files = []
+        self.descrs = []
+        for i, (name, vartype) in enumerate(columns):
+            if vartype == 0:
+                descr = sys.byteorder == "little" and "<f8" or ">f8"
+            else:
+                descr = "|S%d" % vartype
+            self.descrs.append(descr)
+            self.files.append(os.path.join(directory, "c%05d.npy" % i))
+            with open(self.files[-1], "wb") as f:
+                f.write(npyheader(descr, 0))
+    
+    def append(self, cases):
+        """Add a list of cases to the column files"""
+        
+        nan = float("nan")
+        for i, (name, vartype) in enumerate(self.columns):
+            if vartype == 0:
+                values = array.array("d", (nan if case[i] is None else case[i] for case in cases))
+                data = values.tobytes()
+            else:
+                data = b"".join(SavWriter.text(case[i], vartype).ljust(vartype, b"\0") for case in cases)
+            with open(self.files[i], "ab") as f:
+                f.write(data)
+        self.ncases += len(cases)
+    
+    def close(self):
+        """Record the number of cases and write the manifest"""
+        
+        for path, descr in zip(self.files, self.descrs):
+            with open(path, "r+b") as f:
+                f.write(npyheader(descr, self.ncases))
+        variables = []
+        for var in self.variables:
+            variables.append({"name": var.name, "ident": var.ident, "type": var.type,
+                "label": var.label, "filter": var.filter,
+                "columns": [name for name, vartype in var.getNativeVars(self.recordformat)]})
+        manifest = {"version": ColumnCache.formatversion, "ncases": self.ncases,
+            "columns": [{"name": name, "width": vartype, "file": os.path.basename(path), "dtype": descr}
+                for (name, vartype), path, descr in zip(self.columns, self.files, self.descrs)],
+            "variables": variables}
+        with open(os.path.join(self.directory, "manifest.json"), "w", encoding="utf_8") as f:
+            json.dump(manifest, f, indent=1)
+
+class ColumnBatch(object):
+    """A batch of cases from a ColumnStore held as views of the mapped column files
+    
+    Nothing is copied until the batch is iterated, which is where the cases
+    are added to the dataset or written to a sav file.  spss.Dataset needs
+    each case as a list of Python values, so iterating converts each column
+    to floats, with None for sysmis, or strings.  That is the only copy.
+    The views are released when the store produces the next batch, so the
+    cases must be taken before then."""
+    
+    def __init__(self, columns, ncases):
+        """columns is a list of (width, view) pairs with width 0 for numeric
+        ncases is the number of cases in the views"""
+        
+        self.columns = columns
+        self.ncases = ncases
+    
+    def __len__(self):
+        return self.ncases
+    
+    def __iter__(self):
+        values = []
+        for width, view in self.columns:
+            if width == 0:
+                values.append([None if v != v else v for v in view.tolist()])
+            else:
+                values.append([view[i:i + width].tobytes().rstrip(b"\0").decode("utf_8", "replace")
+                    for i in range(0, len(view), width)])
+        for case in zip(*values):
+            yield list(case)
+    
+    def release(self):
+        """Release the views"""
+        
+        for width, view in self.columns:
+            view.release()
+
+class ColumnStore(object):
+    """Read a column store directory written by ColumnWriter
+    
+    The column files are memory mapped when read, so only the columns used
+    are read from disk, and the batches are views of the files that are not
+    copied until their cases are taken."""
+    
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json"), encoding="utf_8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != ColumnCache.formatversion:
+            raise ValueError(_("""The column store format is not supported: %s""") % directory)
+        self.ncases = self.manifest["ncases"]
+        self.columns = [(col["name"], col["width"]) for col in self.manifest["columns"]]
+    
+    def batches(self, batchsize, names=None):
+        """Generator for ColumnBatch objects of up to batchsize cases
+        
+        names is a list of the columns wanted or None for all of them.
+        Each batch is valid until the next one is requested."""
+        
+        bycolumn = dict((col["name"].lower(), col) for col in self.manifest["columns"])
+        if names is None:
+            wanted = self.manifest["columns"]
+        else:
+            wanted = [bycolumn[name.lower()] for name in names]
+        maps = []
+        views = []
+        batch = None
+        try:
+            for col in wanted:
+                with open(os.path.join(self.directory, col["file"]), "rb") as f:
+                    if self.ncases == 0:
+                        mm = None
+                    else:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                maps.append(mm)
+                if mm is None:
+                    views.append(None)
+                elif col["width"] == 0:
+                    if col["dtype"][0] != (sys.byteorder == "little" and "<" or ">"):
+                        raise ValueError(_("""The column store was written on a machine with a different byte order"""))
+                    views.append(memoryview(mm)[NPYHEADERSIZE:].cast("d"))
+                else:
+                    views.append(memoryview(mm)[NPYHEADERSIZE:])
+            for start in range(0, self.ncases, batchsize):
+                stop = min(start + batchsize, self.ncases)
+                columns = []
+                for col, view in zip(wanted, views):
+                    width = col["width"]
+                    if width == 0:
+                        columns.append((0, view[start:stop]))
+                    else:
+                        columns.append((width, view[start * width:stop * width]))
+                batch = ColumnBatch(columns, stop - start)
+                yield batch
+                batch.release()
+                batch = None
+        finally:
+            if batch is not None:
+                batch.release()
+            for view in views:
+                if view is not None:
+                    view.release()
+            for mm in maps:
+                if mm is not None:
+                    mm.close()
+
+def filehash(filespec, blocksize=1024 * 1024):
+    """Return the sha256 hex digest of the contents of filespec
+    
+    For a member of a zip archive the archive and the member name are hashed"""
+    
+    h = hashlib.sha256()
+    parts = splitzip(filespec)
+    if parts is not None:
+        filespec = parts[0]
+        h.update((parts[1] or "").encode("utf_8"))
+    with open(filespec, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# modules that decompress input files by extension
+DECOMPRESSORS = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma"}
+# extensions of metadata files
+METADATAEXTENSIONS = (".sss", ".xml")
+
+# archive and optional member of an input file in a zip archive
+zippath = re.compile(r"(.+?\.zip)(?:[/\\](.+))?$", flags=re.I)
+
+def splitzip(path):
+    """Return the (archive, member) pair for a file in a zip archive or None
+    
+    path is archive.zip/member, or archive.zip, for which member is None"""
+    
+    m = zippath.match(path)
+    if m is None or not os.path.isfile(m.group(1)):
+        return None
+    return m.group(1), m.group(2)
+
+def compression(path):
+    """Return the compression of an input file as ".gz", ".bz2", ".xz" or ".zip" or None"""
+    
+    if splitzip(path) is not None:
+        return ".zip"
+    ext = os.path.splitext(path)[1].lower()
+    if ext in DECOMPRESSORS:
+        return ext
+    return None
+
+def storedfile(path):
+    """Return the file on disk that holds an input file, which is the archive for a zip member"""
+    
+    parts = splitzip(path)
+    if parts is not None:
+        return parts[0]
+    return path
+
+def zipinput(path, metadata):
+    """Return path with the member filled in if it is a zip archive without one
+    
+    metadata indicates whether the member is the metadata file, which must be the
+    only sss or xml file in the archive, or the data file, which must be the only other file"""
+    
+    parts = splitzip(path)
+    if parts is None or parts[1] is not None:
+        return path
+    with zipfile.ZipFile(parts[0]) as z:
+        members = [name for name in z.namelist() if not name.endswith("/")
+            and name.lower().endswith(METADATAEXTENSIONS) == metadata]
+    if len(members) != 1:
+        if metadata:
+            raise ValueError(_("""Zip archive %s must contain exactly one sss or xml file.  Otherwise specify the member as %s/member""")\
+                % (parts[0], parts[0]))
+        raise ValueError(_("""Zip archive %s must contain exactly one data file.  Otherwise specify the member as %s/member""")\
+            % (parts[0], parts[0]))
+    return parts[0] + "/" + members[0]
+
+def openinput(path, mode="rb", encoding=None, errors=None, newline=None):
+    """Return a file object reading an input file, which is decompressed as it is read
+    
+    path is a plain file, a gzip, bzip2 or xz file, or a member of a zip archive
+    mode is "rb" or "r".  The other parameters are as for open in text mode."""
+    
+    ext = compression(path)
+    if ext is None:
+        return open(path, mode, encoding=encoding, errors=errors, newline=newline)
+    if ext == ".zip":
+        archive, member = splitzip(zipinput(path, False))
+        with zipfile.ZipFile(archive) as z:
+            try:
+                f = z.open(member)
+            except KeyError:
+                raise ValueError(_("""%s is not in zip archive %s""") % (member, archive))
+    else:
+        f = importlib.import_module(DECOMPRESSORS[ext]).open(path, "rb")
+    if "b" in mode:
+        return f
+    return io.TextIOWrapper(f, encoding=encoding, errors=errors, newline=newline)
+
+def defaultdatafile(metadatafile):
+    """Return the default data file for a metadata file
+    
+    It has the same name with extension txt.  For a compressed metadata file,
+    a data file compressed the same way is used if there is one.  For a
+    metadata file in a zip archive, the data file is in the same archive
+    and is the only other file if there is no txt file of that name."""
+    
+    parts = splitzip(metadatafile)
+    if parts is not None:
+        name = os.path.splitext(parts[1])[0] + "." + "txt"
+        with zipfile.ZipFile(parts[0]) as z:
+            if name in z.namelist():
+                return parts[0] + "/" + name
+        return zipinput(parts[0], False)
+    ext = compression(metadatafile)
+    if ext is None:
+        return os.path.splitext(metadatafile)[0] + "." + "txt"
+    data = os.path.splitext(os.path.splitext(metadatafile)[0])[0] + "." + "txt"
+    if os.path.exists(data + ext) or not os.path.exists(data):
+        return data + ext
+    return data
+
+# number of cases decoded before they are added to the new dataset
+NATIVEBATCHSIZE = 10000
+
+def nativeload(par, metadatafile, data, strmvcode, dataencoding, fulllabelattr,
+        mdsetvallabels, scorerecode, batchsize=NATIVEBATCHSIZE, coalesce=False, timer=None,
+        colcache=None, workers=1, reader=None, datarange=None, appendto=None, casesel=None,
+        profile=None):
+    """Read the data in Python into a new dataset and apply the dictionary syntax
+    
+    par is a metadata handler object
+    batchsize is the number of cases decoded between additions to the dataset
+    coalesce indicates whether dictionary commands are combined across variables
+    timer is a PhaseTimer or None
+    colcache is a ColumnCache for the decoded data or None
+    workers is the number of processes decoding the data as for NativeReader.batches
+    reader is the NativeReader to use or None to create one
+    datarange is a (start, end) byte range of the data file to read or None for all of it
+    appendto is the name of an existing dataset to add the cases to or None.
+    Its dictionary is not changed.
+    casesel is a CaseSelection or None to read all the records
+    profile is a Profile to add the cases to or None
+    The other parameters are as for gensyntax"""
+    
+    if timer is None:
+        timer = PhaseTimer(False)
+    if data is None:
+        data = defaultdatafile(metadatafile)
+    if reader is None:
+        reader = NativeReader(par, strmvcode, resolveencoding(dataencoding, data, metadatafile),
+            scorerecode)
+    if colcache is None or datarange is not None or casesel is not None:
+        batches = reader.batches(data, batchsize, workers, datarange, casesel)
+    else:
+        batches = colcache.batches(reader, par, metadatafile, data, batchsize, workers)
+    if profile is not None:
+        batches = profile.counted(batches)
+    with timer.phase(_("Load data")):
+        if appendto is not None:
+            appenddataset(appendto, timer.counted(batches, _("Load data"), _("Cases")))
+            return appendto
+        dsname = createdataset(reader.columns,
+            timer.counted(batches, _("Load data"), _("Cases")))
+    tw = textwrap.TextWrapper(width=100, break_long_words=False, break_on_hyphens=False)
+    if coalesce:
+        metadata = gencoalesced
+    else:
+        metadata = genmetadata
+    processsyntax(itertools.chain([["DATASET ACTIVATE %s." % dsname], par.datafile.get()],
+        metadata(par, strmvcode, fulllabelattr, mdsetvallabels, scorerecode, tw,
+        reader.transformed)), execute=True, timer=timer)
+    return dsname
+
+def writesav(par, metadatafile, data, savfile, strmvcode, dataencoding, fulllabelattr,
+        mdvallabels, scorerecode, batchsize=NATIVEBATCHSIZE, timer=None, colcache=None, workers=1,
+        reader=None, datarange=None, append=False, casesel=None, profile=None):
+    """Read the data in Python and write a compressed sav file without using Statistics
+    
+    par is a metadata handler object
+    savfile is the file to write
+    mdvallabels is the pair of unquoted labels for multiple dichotomy set values
+    timer is a PhaseTimer or None
+    colcache is a ColumnCache for the decoded data or None
+    append indicates that the cases are added to savfile, which must have
+    been written by this function with the same metadata and settings
+    The other parameters are as for nativeload.  Filters that the native
+    loader cannot evaluate are not applied, and a warning lists them."""
+    
+    if timer is None:
+        timer = PhaseTimer(False)
+    if data is None:
+        data = defaultdatafile(metadatafile)
+    if reader is None:
+        reader = NativeReader(par, strmvcode, resolveencoding(dataencoding, data, metadatafile),
+            scorerecode)
+    skipped = [var.name for var in par.variables if var.name not in reader.transformed]
+    if skipped and not append:
+        print(_("""Warning: the filters for these variables cannot be computed without Statistics and were not applied: %s""")\
+            % " ".join(skipped))
+    variables, weight, mrsets = savdictionary(par, reader, strmvcode, fulllabelattr,
+        mdvallabels, scorerecode)
+    if colcache is None or datarange is not None or casesel is not None:
+        batches = reader.batches(data, batchsize, workers, datarange, casesel)
+    else:
+        batches = colcache.batches(reader, par, metadatafile, data, batchsize, workers)
+    if profile is not None:
+        batches = profile.counted(batches)
+    if append:
+        writer = SavWriter.reopen(savfile, variables)
+        try:
+            with timer.phase(_("Write sav file")):
+                for batch in timer.counted(batches, _("Write sav file"), _("Cases")):
+                    writer.writecases(batch)
+                writer.close()
+        except:
+            writer.abandon()
+            raise
+        timer.count(_("Write sav file"), _("Bytes"), os.path.getsize(savfile))
+        return
+    temp = savfile + ".tmp"
+    writer = SavWriter(temp, variables, weight, par.datafile.getLines(), mrsets)
+    try:
+        with timer.phase(_("Write sav file")):
+            for batch in timer.counted(batches, _("Write sav file"), _("Cases")):
+                writer.writecases(batch)
+            writer.close()
+        os.replace(temp, savfile)
+    except:
+        writer.close()
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    timer.count(_("Write sav file"), _("Bytes"), os.path.getsize(savfile))
+
+class Checkpoint(object):
+    """Record of the part of a growing data file that has been loaded
+    
+    The checkpoint file is json holding a key for the metadata contents and
+    settings, the byte offset and number of records loaded, a hash of the
+    bytes just before the offset, and the sav file or dataset loaded into."""
+    
+    version = 1
+    # bytes before the offset that are hashed to detect a rewritten file
+    tailsize = 65536
+    
+    def __init__(self, checkpointfile, metadatafile, datafile, settings):
+        """checkpointfile is the json file
+        settings is a tuple of all the values that affect the cases"""
+        
+        self.checkpointfile = checkpointfile
+        self.datafile = datafile
+        key = hashlib.sha256()
+        key.update(filehash(metadatafile).encode("ascii"))
+        key.update(repr((os.path.abspath(datafile), settings, Checkpoint.version)).encode("utf_8"))
+        self.key = key.hexdigest()
+    
+    def tail(self, offset):
+        """Return the bytes of the data file just before offset"""
+        
+        start = max(0, offset - Checkpoint.tailsize)
+        with open(self.datafile, "rb") as f:
+            f.seek(start)
+            return f.read(offset - start)
+    
+    def resume(self, size):
+        """Return the saved checkpoint as a dictionary if new records can be appended or None
+        
+        size is the current size of the data file.  If there is a checkpoint
+        that cannot be used, the reason is printed."""
+        
+        try:
+            with open(self.checkpointfile, encoding="utf_8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("key") != self.key:
+            reason = _("the metadata or settings have changed")
+        elif size < saved["offset"] or \
+                hashlib.sha256(self.tail(saved["offset"])).hexdigest() != saved["tailhash"]:
+            reason = _("the data file has been rewritten")
+        elif size > saved["offset"] and not saved["complete"]:
+            reason = _("the last record loaded had no line end")
+        else:
+            return saved
+        self.reload(reason)
+        return None
+    
+    def reload(self, reason):
+        print(_("""The data are loaded from the start because %s""") % reason)
+    
+    def save(self, offset, records, target):
+        """Record that the data file has been loaded up to offset
+        
+        records is the total number of records loaded
+        target is the sav file or dataset name"""
+        
+        tail = self.tail(offset)
+        saved = {"version": Checkpoint.version, "key": self.key, "datafile": self.datafile,
+            "offset": offset, "records": records, "tailhash": hashlib.sha256(tail).hexdigest(),
+            "complete": offset == 0 or tail.endswith(b"\n"), "target": target,
+            "time": time.asctime()}
+        temp = self.checkpointfile + ".tmp"
+        with open(temp, "w", encoding="utf_8") as f:
+            json.dump(saved, f, indent=1)
+        os.replace(temp, self.checkpointfile)
+
+def checkpointload(par, metadatafile, data, checkpointfile, savfile, execute, strmvcode,
+        dataencoding, fulllabelattr, mdvallabels, mdsetvallabels, scorerecode, coalesce=False,
+        timer=None):
+    """Load the records added to the data file since the last checkpoint and save a new checkpoint
+    
+    checkpointfile is the json checkpoint file
+    savfile is the sav file to add the cases to or None
+    execute indicates whether a dataset is wanted.  With savfile the sav file
+    is opened.  Otherwise the cases are added to the dataset created by the
+    previous load if it is still open.
+    Everything is loaded again if the checkpoint does not match the metadata,
+    settings, data file, sav file or dataset.
+    The other parameters are as for writesav and nativeload"""
+    
+    if timer is None:
+        timer = PhaseTimer(False)
+    if data is None:
+        data = defaultdatafile(metadatafile)
+    if compression(data) is not None:
+        raise ValueError(_("""CHECKPOINT cannot be used with a compressed data file"""))
+    reader = NativeReader(par, strmvcode, resolveencoding(dataencoding, data, metadatafile),
+        scorerecode)
+    checkpoint = Checkpoint(checkpointfile, metadatafile, data, (strmvcode, reader.encoding,
+        scorerecode, fulllabelattr, list(mdvallabels), mdsetvallabels, coalesce, savfile,
+        par.selection))
+    size = os.path.getsize(data)
+    saved = checkpoint.resume(size)
+    if saved is not None:
+        if savfile is not None and savcases(savfile) != saved["records"]:
+            checkpoint.reload(_("the sav file has changed"))
+            saved = None
+        elif savfile is None and datasetcolumns(saved["target"]) != reader.columns:
+            checkpoint.reload(_("the dataset is not open"))
+            saved = None
+    if saved is None:
+        start, records = 0, 0
+    else:
+        start, records = saved["offset"], saved["records"]
+    
+    if start == size and saved is not None:
+        print(_("""No records have been added to the data file since the last load"""))
+        target = saved["target"]
+    elif savfile is not None:
+        writesav(par, metadatafile, data, savfile, strmvcode, dataencoding, fulllabelattr,
+            mdvallabels, scorerecode, timer=timer, reader=reader, datarange=(start, size),
+            append=saved is not None)
+        target = savfile
+    else:
+        target = nativeload(par, metadatafile, data, strmvcode, dataencoding, fulllabelattr,
+            mdsetvallabels, scorerecode, coalesce=coalesce, timer=timer, reader=reader,
+            datarange=(start, size), appendto=saved and saved["target"])
+    checkpoint.save(size, records + reader.ncases, target)
+    if reader.ncases:
+        print(_("""%s records were loaded starting at byte %s of the data file.  %s records have been loaded in all.""")\
+            % (reader.ncases, start, records + reader.ncases))
+    if savfile is not None and execute:
+        spss.Submit("""GET FILE=%s.""" % sq(savfile))
+
+def savcases(savfile):
+    """Return the number of cases recorded in a sav file header or None if it cannot be read"""
+    
+    try:
+        with open(savfile, "rb") as f:
+            header = f.read(84)
+    except OSError:
+        return None
+    if len(header) < 84:
+        return None
+    return struct.unpack("<i", header[80:84])[0]
+
+def savdictionary(par, reader, strmvcode, fulllabelattr, mdvallabels, scorerecode):
+    """Return the SavVariable list, weight variable name and multiple response sets
+    
+    par is the metadata handler and reader the NativeReader for the data
+    The dictionary matches what the generated syntax would create.
+    The sets are (name, label, "C" or "D", variable names)"""
+    
+    tw = textwrap.TextWrapper(width=100, break_long_words=False, break_on_hyphens=False)
+    dequote = lambda text: text.replace("&quot;", '"')
+    variables = [SavVariable(name, width) for name, width in reader.columns]
+    byname = dict((v.name, v) for v in variables)
+    for var in par.variables:
+        format = var.getSavFormat(reader.recordformat)
+        for name in var.vardeflist or [var.name]:
+            if byname[name].width == 0:
+                byname[name].format = format
+    weight = None
+    mrsets = []
+    for var in par.variables:
+        names = var.vardeflist or [var.name]
+        userecode = scorerecode and any(var.scores.values())
+        for name, label in var.getLabelPairs():
+            byname[name].label = dequote(label)
+            if fulllabelattr:
+                byname[name].attributes.append(("FullLabelText",
+                    ["".join(item + " " for item in tw.wrap(label))]))
+        if var.vardeflist and not var.spreadsubfields:  # MD set
+            for name in var.vardeflist:
+                byname[name].valuelabels = [(0., mdvallabels[0]), (1., mdvallabels[1])]
+        elif var.values:
+            labels = []
+            for k, v in sorted(var.values.items()):
+                if userecode:
+                    if var.scores.get(k) is None:
+                        raise ValueError(_("""Variable %s has a value, %s for which there is no score""")\
+                            % (var.name, k))
+                    k = var.scores[k]
+                if var.format != "literal":
+                    k = float(k)
+                labels.append((k, dequote(v)))
+            for name in names:
+                byname[name].valuelabels = labels
+        if not (var.vardeflist and var.spreadsubfields is None) and any(var.scores.values()):
+            scores = ["%s | %s" % (k.replace("|", "\\|"), v) for k, v in sorted(var.scores.items())
+                if v is not None]
+            for name in names:
+                byname[name].attributes.append(("score", scores))
+        if var.filter is not None and var.multtype is None:
+            mvcode = unquote(var.makemvcode(strmvcode))
+            if byname[var.name].width == 0:
+                if mvcode != "$SYSMIS":
+                    byname[var.name].missing = float(mvcode)
+            else:
+                byname[var.name].missing = mvcode
+        if var.text and var.name in byname:
+            byname[var.name].attributes.append(("Text", [dequote(t) for t in var.text]))
+        if var.type == "multiple" and len(var.vardeflist) > 1:
+            if var.spreadsubfields:
+                mrsets.append((var.name, var.label or "", "C", var.vardeflist))
+            else:
+                mrsets.append((var.name, var.label or "", "D", var.mdsetvars))
+        if var.use == "weight":
+            weight = var.name
+    return variables, weight, mrsets
+
+class SavVariable(object):
+    """A variable for SavWriter
+    
+    width is 0 for numeric or the string width in bytes
+    valuelabels is a list of (value, label) pairs
+    missing is None or a single missing value code
+    attributes is a list of (name, list of values)"""
+    
+    def __init__(self, name, width, label=None, valuelabels=None, missing=None, format=None):
+        attributesFromDict(locals())
+        self.attributes = []
+        if self.valuelabels is None:
+            self.valuelabels = []
+
+SYSMIS = -sys.float_info.max
+
+class SavWriter(object):
+    """Write an SPSS Statistics data file directly
+    
+    Only what Triple-S data need is supported: numeric and string variables
+    up to 255 bytes, variable and value labels, a single missing value,
+    documents, variable attributes and multiple response sets.  Text is
+    written in UTF-8, and the cases are bytecode compressed as they are added."""
+    
+    def __init__(self, savfile, variables, weight=None, documents=(), mrsets=()):
+        """savfile is the file to create
+        variables is a list of SavVariable objects
+        weight is the name of the weight variable or None
+        documents is a list of document lines
+        mrsets is a list of (name, label, "C" or "D", variable names)"""
+        
+        self.f = open(savfile, "wb")
+        self.start = 0
+        self.setlayout(variables, True)
+        self.shortnames = self.makeshortnames()
+        self.writeheader(weight and self.index[weight.lower()] or 0)
+        self.writevariables()
+        self.writevaluelabels()
+        self.writedocuments(documents)
+        self.writeextensions(mrsets)
+    
+    @classmethod
+    def reopen(cls, savfile, variables):
+        """Return a SavWriter that adds cases to the end of a file it wrote earlier
+        
+        variables is the list of SavVariable objects the file was written with.
+        ValueError is raised if the file does not match them."""
+        
+        self = cls.__new__(cls)
+        self.setlayout(variables, False)
+        self.f = open(savfile, "r+b")
+        try:
+            header = self.f.read(84)
+            # the nominal case size and bytecode compression must match
+            if len(header) < 84 or header[:4] != b"$FL2" or \
+                    struct.unpack("<ii", header[68:76]) != (self.nominal, 1):
+                raise ValueError(_("""The sav file does not match the metadata: %s""") % savfile)
+            self.ncases = struct.unpack("<i", header[80:84])[0]
+            self.start = self.f.seek(0, 2)
+        except:
+            self.f.close()
+            raise
+        return self
+    
+    def setlayout(self, variables, warn):
+        """Compute the case layout of variables
+        
+        warn indicates whether truncated strings are reported"""
+        
+        self.variables = variables
+        self.ncases = 0
+        self.codes = bytearray()
+        self.pending = []
+        self.layout = []    # (width, number of 8 byte segments) for each variable
+        self.index = {}     # 1-based position of the first segment of each variable
+        self.order = dict((v.name.lower(), i) for i, v in enumerate(variables))
+        position = 1
+        for v in variables:
+            if v.width > 255:
+                if warn:
+                    print(_("""Warning: string variable %s is truncated to 255 bytes""") % v.name)
+                v.width = 255
+            nseg = max(1, (v.width + 7) // 8)
+            self.index[v.name.lower()] = position
+            self.layout.append((v.width, nseg))
+            position += nseg
+        self.nominal = position - 1
+    
+    def pack(self, fmt, *values):
+        self.f.write(struct.pack("<" + fmt, *values))
+    
+    @staticmethod
+    def text(value, maxbytes=None):
+        """Return value as UTF-8 bytes truncated to maxbytes without splitting a character"""
+        
+        value = value.encode("utf_8")
+        if maxbytes is not None and len(value) > maxbytes:
+            value = value[:maxbytes].decode("utf_8", "ignore").encode("utf_8")
+        return value
+    
+    @staticmethod
+    def padded(value, size):
+        return value + b" " * (size - len(value))
+    
+    def makeshortnames(self):
+        """Return unique upper case names of at most 8 bytes"""
+        
+        used = set()
+        result = []
+        for i, v in enumerate(self.variables):
+            name = self.text(v.name.upper(), 8).decode("utf_8")
+            if name in used:
+                name = "V%d" % (i + 1)
+            used.add(name)
+            result.append(name)
+        return result
+    
+    def writeheader(self, weightindex):
+        now = time.localtime()
+        months = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+        self.f.write(b"$FL2")
+        self.f.write(self.padded(b"@(#) SPSS DATA FILE STATS GET TRIPLES", 60))
+        self.pack("iiiii", 2, self.nominal, 1, weightindex, -1)
+        self.pack("d", 100.)
+        self.f.write(("%02d %s %02d" % (now.tm_mday, months[now.tm_mon - 1], now.tm_year % 100)).encode("ascii"))
+        self.f.write(time.strftime("%H:%M:%S", now).encode("ascii"))
+        self.f.write(b" " * 64 + b"\0" * 3)
+    
+    def format(self, v):
+        """Return the print and write format code"""
+        
+        if v.width:
+            return (1 << 16) | (v.width << 8)
+        width, decimals = v.format or (8, 2)
+        return (5 << 16) | (width << 8) | decimals
+    
+    def writevariables(self):
+        for v, shortname, (width, nseg) in zip(self.variables, self.shortnames, self.layout):
+            label = v.label and self.text(v.label, 255)
+            missing = []
+            if v.missing is not None:
+                if v.width == 0:
+                    missing = [struct.pack("<d", v.missing)]
+                elif v.width <= 8:
+                    missing = [self.padded(self.text(v.missing, 8), 8)]
+            self.pack("iiiiii", 2, width, label and 1 or 0, len(missing), self.format(v), self.format(v))
+            self.f.write(self.padded(shortname.encode("utf_8"), 8))
+            if label:
+                self.pack("i", len(label))
+                self.f.write(label + b"\0" * (-len(label) % 4))
+            for item in missing:
+                self.f.write(item)
+            for i in range(nseg - 1):
+                self.pack("iiiiii", 2, -1, 0, 0, 0, 0)
+                self.f.write(b" " * 8)
+    
+    def writevaluelabels(self):
+        """Write value labels for numeric and short string variables
+        
+        Variables with the same labels share one record"""
+        
+        groups = {}
+        order = []
+        for v in self.variables:
+            if v.valuelabels and v.width <= 8:
+                key = (v.width > 0, tuple(v.valuelabels))
+                if key not in groups:
+                    groups[key] = []
+                    order.append(key)
+                groups[key].append(self.index[v.name.lower()])
+        for key in order:
+            isstring, labels = key
+            self.pack("ii", 3, len(labels))
+            for value, label in labels:
+                if isstring:
+                    self.f.write(self.padded(self.text(value, 8), 8))
+                else:
+                    self.pack("d", value)
+                label = self.text(label, 120)
+                self.f.write(struct.pack("B", len(label)) + label + b" " * (-(len(label) + 1) % 8))
+            self.pack("ii", 4, len(groups[key]))
+            self.pack("%si" % len(groups[key]), *groups[key])
+    
+    def writedocuments(self, documents):
+        if documents:
+            lines = [self.padded(self.text(line, 80), 80) for line in documents]
+            self.pack("ii", 6, len(lines))
+            self.f.write(b"".join(lines))
+    
+    def writerecord(self, subtype, data, size=1):
+        self.pack("iiii", 7, subtype, size, len(data) // size)
+        self.f.write(data)
+    
+    def writeextensions(self, mrsets):
+        # machine integer and floating point information
+        self.writerecord(3, struct.pack("<8i", 20, 0, 0, -1, 1, 1, 2, 65001), 4)
+        self.writerecord(4, struct.pack("<3d", SYSMIS, sys.float_info.max, -sys.float_info.max), 8)
+        if mrsets:
+            sets = []
+            for name, label, kind, names in mrsets:
+                label = self.text(label)
+                if kind == "C":
+                    spec = b"C "
+                else:
+                    spec = b"D1 1 "
+                members = b" ".join(self.shortnames[self.order[n.lower()]].lower().encode("utf_8") for n in names)
+                sets.append(b"$" + self.text(name) + b"=" + spec + str(len(label)).encode("ascii") + b" "\
+                    + label + b" " + members + b"\n")
+            self.writerecord(7, b"".join(sets))
+        self.writerecord(13, b"\t".join(short.encode("utf_8") + b"=" + self.text(v.name)
+            for short, v in zip(self.shortnames, self.variables)))
+        attributes = []
+        for v in self.variables:
+            if v.attributes:
+                attributes.append(self.text(v.name) + b":" + b"".join(self.text(name) + b"("
+                    + b"".join(b"'" + self.text(value) + b"'\n" for value in values) + b")"
+                    for name, values in v.attributes))
+        if attributes:
+            self.writerecord(18, b"/".join(attributes))
+        self.writerecord(20, b"UTF-8")
+        # value labels and missing values for long strings
+        longlabels = []
+        longmissing = []
+        for v in self.variables:
+            name = self.text(v.name)
+            if v.width > 8 and v.valuelabels:
+                items = [struct.pack("<i", len(name)) + name + struct.pack("<ii", v.width, len(v.valuelabels))]
+                for value, label in v.valuelabels:
+                    value = self.padded(self.text(value, v.width), v.width)
+                    label = self.text(label, 120)
+                    items.append(struct.pack("<i", len(value)) + value + struct.pack("<i", len(label)) + label)
+                longlabels.append(b"".join(items))
+            if v.width > 8 and v.missing is not None:
+                longmissing.append(struct.pack("<i", len(name)) + name + struct.pack("<Bi", 1, 8)
+                    + self.padded(self.text(v.missing, 8), 8))
+        if longlabels:
+            self.writerecord(21, b"".join(longlabels))
+        if longmissing:
+            self.writerecord(22, b"".join(longmissing))
+        self.pack("ii", 999, 0)
+    
+    def putcode(self, code, data=None):
+        """Add one compression code and its uncompressed data, if any"""
+        
+        self.codes.append(code)
+        if data is not None:
+            self.pending.append(data)
+        if len(self.codes) == 8:
+            self.f.write(bytes(self.codes))
+            self.f.write(b"".join(self.pending))
+            self.codes = bytearray()
+            self.pending = []
+    
+    def writecases(self, cases):
+        """Add a list of cases, each a list of values with None for sysmis"""
+        
+        putcode = self.putcode
+        layout = self.layout
+        for case in cases:
+            for value, (width, nseg) in zip(case, layout):
+                if width == 0:
+                    if value is None:
+                        putcode(255)
+                    elif -99 <= value <= 151 and value == int(value):
+                        putcode(int(value) + 100)
+                    else:
+                        putcode(253, struct.pack("<d", value))
+                else:
+                    value = self.padded(self.text(value, width), nseg * 8)
+                    for i in range(0, nseg * 8, 8):
+                        segment = value[i:i+8]
+                        if segment == b"        ":
+                            putcode(254)
+                        else:
+                            putcode(253, segment)
+        self.ncases += len(cases)
+    
+    def close(self):
+        """Finish the file and record the number of cases"""
+        
+        if self.f.closed:
+            return
+        try:
+            if self.codes:
+                self.f.write(bytes(self.codes) + b"\0" * (8 - len(self.codes)))
+                self.f.write(b"".join(self.pending))
+            self.f.seek(80)
+            self.pack("i", self.ncases)
+        finally:
+            self.f.close()
+    
+    def abandon(self):
+        """Close the file without the cases added since it was opened or reopened"""
+        
+        if not self.f.closed:
+            self.f.truncate(self.start)
+            self.f.close()
+
+def createdataset(columns, batches):
+    """Create a new dataset and return its name
+    
+    columns is a list of (name, type) pairs with type 0 for numeric or the string width
+    batches is an iterable of lists of cases"""
+    
+    spss.StartDataStep()
+    try:
+        ds = spss.Dataset(name=None)
+        for name, vartype in columns:
+            ds.varlist.append(name, vartype)
+        for batch in batches:
+            for case in batch:
+                ds.cases.append(case)
+        return ds.name
+    finally:
+        spss.EndDataStep()
+
+def appenddataset(dsname, batches):
+    """Add cases to an existing dataset
+    
+    dsname is the name of the dataset
+    batches is an iterable of lists of cases"""
+    
+    spss.StartDataStep()
+    try:
+        ds = spss.Dataset(name=dsname)
+        for batch in batches:
+            for case in batch:
+                ds.cases.append(case)
+    finally:
+        spss.EndDataStep()
+
+def datasetcolumns(dsname):
+    """Return the list of (name, type) pairs of an open dataset or None if there is no such dataset"""
+    
+    spss.StartDataStep()
+    try:
+        try:
+            ds = spss.Dataset(name=dsname)
+        except Exception:
+            return None
+        return [(var.name, var.type) for var in ds.varlist]
+    finally:
+        spss.EndDataStep()
+
+# default random number seed for SAMPLE, which is the Statistics default
+SAMPLESEED = 2000000
+
+class CaseSelection(object):
+    """Limit on the records read and random sample of them
+    
+    cases is the number of records to read from the start of the file or None for all
+    sample is the fraction of the records to keep, each with that
+    probability, or a whole number of records to choose at random, or None
+    seed is the random number seed.  The same seed chooses the same records."""
+    
+    def __init__(self, cases=None, sample=None, seed=SAMPLESEED):
+        if cases is not None and cases < 1:
+            raise ValueError(_("""CASES must be at least 1"""))
+        if sample is not None:
+            if sample <= 0:
+                raise ValueError(_("""SAMPLE must be a fraction or a number of cases greater than 0"""))
+            if sample >= 1:
+                if sample != int(sample):
+                    raise ValueError(_("""SAMPLE must be a fraction less than 1 or a whole number of cases"""))
+                sample = int(sample)
+        if seed is None:
+            seed = SAMPLESEED
+        attributesFromDict(locals())
+    
+    def key(self):
+        """Return a tuple identifying the selection for cache keys"""
+        
+        return (self.cases, self.sample, self.seed)
+    
+    def records(self, records):
+        """Generator for the selected records in file order
+        
+        records is an iterator of raw records.  Records that are not chosen
+        are consumed with islice, so no Python code runs for them."""
+        
+        if self.cases is not None:
+            records = itertools.islice(records, self.cases)
+        if self.sample is None:
+            yield from records
+        elif isinstance(self.sample, float):
+            yield from self.bernoulli(records)
+        else:
+            yield from self.reservoir(records)
+    
+    def bernoulli(self, records):
+        """Generator for the records kept each with probability sample
+        
+        The gaps between kept records are drawn from the geometric distribution."""
+        
+        rng = random.Random(self.seed)
+        logq = math.log(1.0 - self.sample)
+        while True:
+            gap = int(math.log(1.0 - rng.random()) / logq)
+            record = next(itertools.islice(records, gap, None), None)
+            if record is None:
+                return
+            yield record
+    
+    def reservoir(self, records):
+        """Generator for sample records chosen uniformly with reservoir sampling
+        
+        The gaps between replacements are drawn directly (Li's algorithm L),
+        so the cost of skipped records does not depend on the sample size."""
+        
+        rng = random.Random(self.seed)
+        k = self.sample
+        reservoir = list(itertools.islice(enumerate(records), k))
+        index = len(reservoir) - 1
+        w = math.exp(math.log(openunit(rng)) / k)
+        while len(reservoir) == k:
+            gap = int(math.log(openunit(rng)) / math.log(1.0 - w))
+            record = next(itertools.islice(records, gap, None), None)
+            if record is None:
+                break
+            index += gap + 1
+            reservoir[rng.randrange(k)] = (index, record)
+            w *= math.exp(math.log(openunit(rng)) / k)
+        reservoir.sort(key=lambda item: item[0])
+        for index, record in reservoir:
+            yield record
+    
+    def getSyntax(self, par, data):
+        """Return a list of commands selecting the cases as the data are read
+        
+        par is the metadata handler object and data the data file.  Statistics
+        chooses its own sample, so the cases differ from the native loader's."""
+        
+        cmds = []
+        if self.cases is not None:
+            cmds.append("""N OF CASES %d.""" % self.cases)
+        if self.sample is not None:
+            cmds.append("""SET SEED=%d.""" % self.seed)
+            if isinstance(self.sample, float):
+                cmds.append("""SAMPLE %s.""" % self.sample)
+            else:
+                total = recordlengths(data)[1] - int(par.record.skip or 0)
+                if self.cases is not None:
+                    total = min(total, self.cases)
+                cmds.append("""SAMPLE %d FROM %d.""" % (self.sample, max(total, self.sample)))
+        return cmds
+
+def openunit(rng):
+    """Return a uniform random number strictly between 0 and 1"""
+    
+    while True:
+        u = rng.random()
+        if u > 0.0:
+            return u
+
+# data files at least this size are decoded in parallel by default
+SHARDMINSIZE = 64 * 1024 * 1024
+# approximate size of the part of a data file decoded by one task
+SHARDSIZE = 16 * 1024 * 1024
+
+class NativeReader(object):
+    """Decode Triple-S data records according to the parsed metadata"""
+    
+    def __init__(self, par, strmvcode, dataencoding, scorerecode):
+        """par is a metadata handler object
+        strmvcode is the code to be used for missing data in strings
+        dataencoding is utf8, locale or the name of a codec
+        scorerecode indicates whether values with scores are recoded
+        
+        Filters and score recodes are applied to each case in variable
+        order as the generated syntax would do.  Variables whose filter
+        cannot be evaluated here are left for syntax."""
+        
+        # what a worker process needs to build the same reader
+        self.model = (par.datafile, par.record, par.variables, par.hierarchy)
+        self.strmvcode = strmvcode
+        self.scorerecode = scorerecode
+        self.ncases = 0
+        self.recordformat = par.record.format
+        if self.recordformat == "fixed" or par.record.skip is None:
+            self.skip = 0
+        else:
+            self.skip = int(par.record.skip)
+        if dataencoding.lower() == "utf8":
+            self.encoding = "utf_8"
+        elif dataencoding.lower() == "locale":
+            self.encoding = localeencoding()
+        else:
+            self.encoding = dataencoding
+        self.columns = []     # (name, type) for each variable created
+        self.decoders = []
+        offsets = []
+        for var in par.variables:
+            var.getDataList(self.recordformat)   # establishes set member names
+            offsets.append(len(self.columns))
+            self.columns.extend(var.getNativeVars(self.recordformat))
+            self.decoders.append(var.getDecoder(self.recordformat, self.encoding))
+        index = dict((name.lower(), (i, vartype > 0)) for i, (name, vartype) in enumerate(self.columns))
+        
+        self.transformed = set()
+        self.steps = []
+        self.filters = []     # (variable name, filter, test) for the filters evaluated here
+        for var, offset in zip(par.variables, offsets):
+            isstring = self.columns[offset][1] > 0
+            if var.filter is not None:
+                test = None
+                if var.multtype is None:
+                    test = compilefilter(var.filter, index)
+                if test is None:
+                    continue    # filter and recode are done by syntax
+                self.filters.append((var.name, var.filter, test))
+                mvcode = unquote(var.makemvcode(strmvcode))
+                if not isstring:
+                    mvcode = None if mvcode == "$SYSMIS" else float(mvcode)
+                self.steps.append(filterstep(test, offset, mvcode))
+            self.transformed.add(var.name)
+            if scorerecode and any(var.scores.values()):
+                recodes = {}
+                for k, v in var.scores.items():
+                    if v is None:
+                        continue
+                    try:
+                        if isstring:
+                            recodes[k] = v
+                        else:
+                            recodes[float(k)] = float(v)
+                    except ValueError:
+                        raise ValueError(_("""Variable %s has a score, %s, that is not valid for its type""")\
+                            % (var.name, v))
+                ncols = len(var.getNativeVars(self.recordformat))
+                self.steps.append(recodestep(recodes, offset, offset + ncols))
+    
+    def records(self, datafile):
+        """Generator for the raw records of the data file
+        
+        Fixed format records are lines of bytes.  Csv records are lists of fields."""
+        
+        if self.recordformat == "fixed":
+            with openinput(datafile) as f:
+                for line in f:
+                    yield line.rstrip(b"\r\n")
+        else:
+            with openinput(datafile, "r", encoding=self.encoding, errors="replace", newline="") as f:
+                rdr = csv.reader(f)
+                for i in range(self.skip):
+                    next(rdr, None)
+                for fields in rdr:
+                    yield fields
+    
+    def decode(self, record):
+        """Return the case for one record as a list with None for sysmis"""
+        
+        case = []
+        for decoder in self.decoders:
+            case.extend(decoder(record))
+        for step in self.steps:
+            step(case)
+        return case
+    
+    def cases(self, datafile):
+        """Generator for the decoded cases of the data file"""
+        
+        decode = self.decode
+        for record in self.records(datafile):
+            yield decode(record)
     
-    unicodemode = spss.PyInvokeSpss.IsUTF8mode()
-    if unicodemode:
-        ###ec = codecs.getencoder("utf_8")   # must figure string length in bytes of utf-8    
-        inputencoding = "unicode_internal"
-        outputencoding = "utf_8_sig"
-        nl = "\n"
+    def batches(self, datafile, batchsize, workers=1, datarange=None, casesel=None):
+        """Generator for lists of up to batchsize decoded cases
+        
+        workers is the number of processes that decode shards of the file
+        in parallel or None to use all the processors for files of at
+        least SHARDMINSIZE bytes.  The cases are always in record order.
+        datarange is a (start, end) byte range to read in this process
+        or None for the whole file
+        casesel is a CaseSelection or None.  The selected records are
+        decoded in this process."""
+        
+        if casesel is not None:
+            return batched(self.selectedcases(datafile, casesel), batchsize)
+        if datarange is not None:
+            return batched(self.rangecases(datafile, datarange[0], datarange[1]), batchsize)
+        # a compressed file cannot be split
+        if compression(datafile) is not None:
+            workers = 1
+        elif workers is None:
+            if os.path.getsize(datafile) >= SHARDMINSIZE:
+                workers = os.cpu_count() or 1
+            else:
+                workers = 1
+        if workers > 1:
+            shards = self.shards(datafile)
+            if len(shards) > 1:
+                return self.parallelbatches(datafile, batchsize, workers, shards)
+        return batched(self.cases(datafile), batchsize)
+    
+    def selectedcases(self, datafile, casesel):
+        """Generator for the decoded cases of the records chosen by casesel
+        
+        The records that are not chosen are not decoded."""
+        
+        decode = self.decode
+        if self.recordformat == "fixed":
+            with openinput(datafile) as f:
+                for line in casesel.records(f):
+                    yield decode(line.rstrip(b"\r\n"))
+        else:
+            with openinput(datafile, "r", encoding=self.encoding, errors="replace", newline="") as f:
+                rdr = csv.reader(f)
+                for i in range(self.skip):
+                    next(rdr, None)
+                for fields in casesel.records(rdr):
+                    yield decode(fields)
+    
+    def shards(self, datafile, size=SHARDSIZE):
+        """Return a list of (start, end) byte ranges of about size bytes holding whole records
+        
+        Fixed format records end at a newline.  Csv records end at a newline
+        outside quotes, found by counting the quote characters before it."""
+        
+        filesize = os.path.getsize(datafile)
+        if filesize <= size:
+            return [(0, filesize)]
+        bounds = [0]
+        with open(datafile, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                quotes = 0      # quote characters before counted
+                counted = 0
+                while bounds[-1] + size < filesize:
+                    pos = mm.find(b"\n", bounds[-1] + size - 1)
+                    if self.recordformat != "fixed":
+                        while pos >= 0:
+                            quotes += mm[counted:pos].count(b'"')
+                            counted = pos
+                            if quotes % 2 == 0:
+                                break
+                            pos = mm.find(b"\n", pos + 1)
+                    if pos < 0 or pos + 1 >= filesize:
+                        break
+                    bounds.append(pos + 1)
+            finally:
+                mm.close()
+        return list(zip(bounds, bounds[1:] + [filesize]))
+    
+    def shardrecords(self, datafile, start, end, skip=0):
+        """Generator for the raw records in bytes start to end of the data file
+        
+        skip is the number of csv records to skip at the start"""
+        
+        with open(datafile, "rb") as f:
+            f.seek(start)
+            lines = readlines(f, end - start)
+            if self.recordformat == "fixed":
+                for line in lines:
+                    yield line.rstrip(b"\r\n")
+            else:
+                encoding = self.encoding
+                rdr = csv.reader(line.decode(encoding, "replace") for line in lines)
+                for i in range(skip):
+                    next(rdr, None)
+                for fields in rdr:
+                    yield fields
+    
+    def rangecases(self, datafile, start, end):
+        """Generator for the decoded cases in bytes start to end of the data file
+        
+        The number of cases produced is added to ncases."""
+        
+        decode = self.decode
+        for record in self.shardrecords(datafile, start, end, start == 0 and self.skip or 0):
+            self.ncases += 1
+            yield decode(record)
+    
+    def parallelbatches(self, datafile, batchsize, workers, shards):
+        """Generator for lists of decoded cases with shards decoded in worker processes
+        
+        shards is the list of byte ranges from the shards method.  If the
+        processes cannot be started, the file is decoded here."""
+        
+        import concurrent.futures.process
+        jobs = [(datafile, start, end, i == 0 and self.skip or 0) for i, (start, end) in enumerate(shards)]
+        pool = concurrent.futures.ProcessPoolExecutor(min(workers, len(jobs)), initializer=initshardreader,
+            initargs=(self.model, self.strmvcode, self.encoding, self.scorerecode))
+        with pool:
+            results = orderedmap(pool, decodeshard, jobs, 2 * workers)
+            try:
+                cases = next(results)
+            except (OSError, concurrent.futures.process.BrokenProcessPool):
+                # process creation may not be possible in every Statistics environment
+                results = None
+            if results is None:
+                for batch in batched(self.cases(datafile), batchsize):
+                    yield batch
+                return
+            for cases in itertools.chain([cases], results):
+                for batch in batched(cases, batchsize):
+                    yield batch
+
+# the NativeReader of a worker process decoding shards
+shardreader = None
+
+def initshardreader(model, strmvcode, encoding, scorerecode):
+    """Build the NativeReader for a worker process"""
+    
+    global shardreader
+    installtranslation()
+    handler = metadataHandler(removehtml=False)
+    handler.datafile, handler.record, handler.variables, handler.hierarchy = model
+    shardreader = NativeReader(handler, strmvcode, encoding, scorerecode)
+
+def decodeshard(job):
+    """Return the list of decoded cases for one shard of a data file
+    
+    job is a (datafile, start, end, skip) tuple"""
+    
+    datafile, start, end, skip = job
+    decode = shardreader.decode
+    return [decode(record) for record in shardreader.shardrecords(datafile, start, end, skip)]
+
+def readlines(f, size):
+    """Generator for the lines in the next size bytes of binary file f"""
+    
+    while size > 0:
+        line = f.readline()
+        if not line:
+            break
+        size -= len(line)
+        yield line
+
+def orderedmap(pool, fn, items, window):
+    """Generator for fn(item) for each item computed in pool in order
+    
+    At most window calls are pending, which bounds the results held in memory."""
+    
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def batched(items, size):
+    """Generator for lists of up to size consecutive items"""
+    
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+VALIDATEEXAMPLES = 5
+# records of csv data and bytes of fixed format data checked at a time
+VALIDATECHUNK = 10000
+VALIDATEBLOCK = 4 * 1024 * 1024
+# bytes of fixed format data checked at a time with NumPy
+VALIDATEARRAYBLOCK = 16 * 1024 * 1024
+# distinct fields whose result is remembered for each variable
+VALIDATECACHE = 100000
+# fields below which a column that has problems is tested field by field
+VALIDATELEAF = 64
+
+class DataValidator(object):
+    """Check a data file against the parsed metadata before anything is loaded
+    
+    Each variable is checked for undefined codes, values out of range, numbers
+    that are not valid and malformed multiple response fields.  Csv records are
+    checked for the number of fields and fixed format records for their length.
+    Only counts and the first few offending record numbers are kept.
+    
+    The records are checked a chunk at a time, one variable at a time.  Each
+    distinct field of a chunk is tested once, and bitstrings are checked by
+    translating the whole column, so columns of codes cost little more than
+    slicing the records.
+    
+    If NumPy is installed, plain fixed format files are memory mapped and each
+    chunk becomes an array with a row of bytes for each record.  The column of
+    a variable is then a slice of the array, numbers are converted and
+    compared with the range and bitstrings are checked for the whole column at
+    once, and the distinct fields are found by NumPy."""
+    
+    def __init__(self, par, dataencoding, maxexamples=VALIDATEEXAMPLES, arrays=None):
+        """par is the metadata handler
+        dataencoding is utf8, locale or the name of a codec
+        maxexamples is the number of offending record numbers reported for each problem
+        arrays indicates whether fixed format data are checked with NumPy or None to
+        use NumPy if it is installed"""
+        
+        self.reader = NativeReader(par, "", dataencoding, False)
+        self.recordformat = self.reader.recordformat
+        self.maxexamples = maxexamples
+        self.variables = par.variables
+        if arrays is None:
+            arrays = self.recordformat == "fixed" and numpyavailable()
+        self.arrays = arrays and self.recordformat == "fixed"
+        if par.selection is not None:
+            self.expected = par.extent
+        else:
+            self.expected = recordextent(par.variables, self.recordformat)
+        self.problems = {}
+        self.order = []
+        # (first record, check number) for each problem to order them as the records are read
+        self.first = {}
+        self.nrecords = 0
+    
+    def note(self, name, problem, recnum, rank):
+        """Record a problem for a variable in record recnum
+        
+        rank is the number of the check, with -1 for the record checks"""
+        
+        key = (name, problem)
+        entry = self.problems.get(key)
+        if entry is None:
+            entry = self.problems[key] = [0, []]
+            self.order.append(key)
+            self.first[key] = (recnum, rank)
+        entry[0] += 1
+        if len(entry[1]) < self.maxexamples:
+            entry[1].append(recnum)
+    
+    def getchecks(self, arrays):
+        """Return a list of (name, start, end or getter, check) for the variables that are checked
+        
+        arrays indicates that the checks take arrays, and end is the end of the
+        field.  Otherwise they take lists, and getter returns the field of a record."""
+        
+        checks = []
+        for var in self.variables:
+            check = var.getValidator(self.recordformat, arrays)
+            if check is not None:
+                start, end, check = check
+                if arrays:
+                    checks.append((var.name, start, end, check))
+                elif self.recordformat == "fixed":
+                    checks.append((var.name, start, operator.itemgetter(slice(start, end)), check))
+                else:
+                    checks.append((var.name, start, operator.itemgetter(start), check))
+        return checks
+    
+    def chunks(self, datafile):
+        """Generator for lists of the raw records of datafile"""
+        
+        if self.recordformat == "fixed":
+            with openinput(datafile) as f:
+                for lines in linechunks(f, VALIDATEBLOCK):
+                    yield lines
+        else:
+            records = self.reader.records(datafile)
+            while True:
+                chunk = list(itertools.islice(records, VALIDATECHUNK))
+                if not chunk:
+                    break
+                yield chunk
+    
+    def run(self, datafile):
+        """Check all the records of datafile
+        
+        Compressed files are not memory mapped and are checked without NumPy."""
+        
+        if self.arrays and compression(datafile) is None:
+            last = self.runarrays(datafile)
+        else:
+            last = self.runlists(datafile)
+        self.nrecords = last - self.reader.skip
+        # chunks are checked a variable at a time, but problems are listed as they occur in the file
+        self.order.sort(key=self.first.get)
+    
+    def runarrays(self, datafile):
+        """Check the records of a plain fixed format data file with NumPy and return the last record number"""
+        
+        checks = self.getchecks(True)
+        expected = self.expected
+        width = max([end for name, start, end, check in checks] + [0])
+        record = _("(record)")
+        short = _("Record is shorter than the variable positions")
+        first = self.reader.skip + 1
+        for block, starts, lengths in recordblocks(datafile, VALIDATEARRAYBLOCK):
+            for i in numpy.flatnonzero(lengths < expected):
+                self.note(record, short, first + int(i), -1)
+            rows = recordarray(block, starts, lengths, width)
+            for rank, (name, start, end, check) in enumerate(checks):
+                for i, problem in check(rows[:, start:end]):
+                    self.note(name, problem, first + i, rank)
+            first += len(starts)
+        return first - 1
+    
+    def runlists(self, datafile):
+        """Check the records of datafile as lists of records and return the last record number"""
+        
+        checks = self.getchecks(False)
+        fixed = self.recordformat == "fixed"
+        expected = self.expected
+        record = _("(record)")
+        short = _("Record is shorter than the variable positions")
+        toofew = _("Fewer fields than defined")
+        toomany = _("More fields than defined")
+        first = self.reader.skip + 1
+        for chunk in self.chunks(datafile):
+            lengths = list(map(len, chunk))
+            if fixed:
+                if min(lengths) < expected:
+                    for i, n in enumerate(lengths):
+                        if n < expected:
+                            self.note(record, short, first + i, -1)
+            elif min(lengths) != expected or max(lengths) != expected:
+                for i, n in enumerate(lengths):
+                    if n != expected:
+                        self.note(record, n < expected and toofew or toomany, first + i, -1)
+            shortest = min(lengths)
+            for rank, (name, start, getter, check) in enumerate(checks):
+                if fixed or shortest > start:
+                    column = list(map(getter, chunk))
+                else:
+                    column = [rec[start] if len(rec) > start else "" for rec in chunk]
+                for i, problem in check(column):
+                    self.note(name, problem, first + i, rank)
+            first += len(chunk)
+        return first - 1
+    
+    def display(self, datafile):
+        """Display the problems found as a pivot table"""
+        
+        StartProcedure(_("Get Triple-S"), "STATSGETTRIPLES")
+        try:
+            if self.order:
+                pt = spss.BasePivotTable(_("Data Validation Problems"), "STATSGETTRIPLESVALIDATION")
+                cells = []
+                for key in self.order:
+                    count, examples = self.problems[key]
+                    cells.extend([count, round(100. * count / self.nrecords, 2),
+                        ", ".join(str(r) for r in examples)])
+                pt.SimplePivotTable(rowdim=_("Variable: Problem"),
+                    rowlabels=["%s: %s" % key for key in self.order],
+                    coldim=_("Statistics"),
+                    collabels=[_("Count"), _("Percent of Records"), _("First Records")],
+                    cells=cells)
+            spss.TextBlock(_("Data Validation"), _("""%s records in %s were checked.  %s problems were found.""")\
+                % (self.nrecords, datafile, len(self.order)))
+        finally:
+            spss.EndProcedure()
+
+def linechunks(f, size):
+    """Generator for lists of the lines of binary file f without line ends, reading size bytes at a time"""
+    
+    tail = b""
+    while True:
+        block = f.read(size)
+        if not block:
+            break
+        lines = (tail + block).split(b"\n")
+        tail = lines.pop()
+        if b"\r" in block:
+            lines = [line.rstrip(b"\r") for line in lines]
+        if lines:
+            yield lines
+    if tail:
+        yield [tail.rstrip(b"\r")]
+
+def columncheck(test, fixed, valid=None):
+    """Return a check of a column of fields that tests each distinct field once
+    
+    test takes the text of a field and returns None or a problem.  Fixed
+    format fields are bytes and are decoded as latin_1 for the test.
+    valid is None or a function that returns True if all the fields of a
+    column are valid, which is much faster than testing them.  A column that
+    fails it is halved until the fields with problems are found.
+    The results are remembered across chunks for up to VALIDATECACHE fields."""
+    
+    known = {}
+    def testfields(column, offset):
+        distinct = set(column)
+        if len(known) + len(distinct) > VALIDATECACHE:
+            known.clear()
+        bad = {}
+        for field in distinct:
+            try:
+                problem = known[field]
+            except KeyError:
+                problem = known[field] = test(field.decode("latin_1") if fixed else field)
+            if problem is not None:
+                bad[field] = problem
+        if not bad:
+            return []
+        return [(offset + i, bad[field]) for i, field in enumerate(column) if field in bad]
+    def locate(column, offset):
+        if len(column) <= VALIDATELEAF:
+            return testfields(column, offset)
+        if valid(column):
+            return []
+        half = len(column) // 2
+        return locate(column[:half], offset) + locate(column[half:], offset + half)
+    def check(column):
+        if valid is None:
+            return testfields(column, 0)
+        return locate(column, 0)
+    return check
+
+def numbersvalid(bounds, fixed):
+    """Return a function that is True if the nonblank fields of a column are numbers within bounds
+    
+    bounds is (low, high) from getValueBounds"""
+    
+    low, high = bounds
+    strip = fixed and bytes.strip or str.strip
+    def valid(column):
+        try:
+            values = list(map(float, filter(strip, column)))
+        except ValueError:
+            return False
+        # a nan compares false, so it leaves the total a nan
+        total = sum(values)
+        return not values or (total == total and min(values) >= low and max(values) <= high)
+    return valid
+
+# characters other than those of a bitstring
+notbitchars = re.compile("[^01 ]")
+
+def bitstringtest(nmembers, fixed):
+    """Return a test of the text of a multiple dichotomy field"""
+    
+    notbits = _("Not a 0/1 bitstring")
+    badlength = _("Bitstring length is not %s") % nmembers
+    bits = frozenset("01 ")
+    def test(field):
+        if not field.strip():
+            return None
+        if not bits.issuperset(field):
+            return notbits
+        if not fixed and len(field) != nmembers:
+            return badlength
+        return None
+    return test
+
+def bitstringcheck(nmembers, fixed):
+    """Return a check of a column of multiple dichotomy fields"""
+    
+    test = bitstringtest(nmembers, fixed)
+    lengths = frozenset([0, nmembers])
+    def valid(column):
+        if fixed:
+            return not b"".join(column).translate(None, b"01 ")
+        return not notbitchars.search("".join(column)) and lengths.issuperset(map(len, column))
+    return columncheck(test, fixed, valid)
+
+def spreadcheck(test, fixed, width, nsubfields, valid=None):
+    """Return a check of a column of multiple category fields
+    
+    The fields are padded and split into subfields, which are checked
+    together as one column.  The first problem of a field is reported."""
+    
+    whole = columncheck(test, fixed, valid)
+    total = width * nsubfields
+    if fixed:
+        subfields, empty = re.compile(b".{%d}" % width, re.S), b""
+    else:
+        subfields, empty = re.compile(".{%d}" % width, re.S), ""
+    def check(column):
+        lengths = set(map(len, column))
+        if max(lengths) > total:
+            column = [field[:total] for field in column]
+        if lengths != set([total]):
+            column = [field.ljust(total) for field in column]
+        found = {}
+        for i, problem in whole(subfields.findall(empty.join(column))):
+            found.setdefault(i // nsubfields, problem)
+        return sorted(found.items())
+    return check
+
+def numpyavailable():
+    """Return True if NumPy can be imported"""
+    
+    try:
+        importlib.import_module("numpy")
+    except ImportError:
+        return False
+    return True
+
+def recordblocks(datafile, size):
+    """Generator for (block, starts, lengths) arrays for the records of a plain data file
+    
+    The file is memory mapped and split into blocks of bytes of about size
+    bytes that end at a line end.  starts and lengths give the records of
+    each block.  Line ends are not included in the lengths."""
+    
+    if os.path.getsize(datafile) == 0:
+        return
+    data = numpy.memmap(datafile, dtype=numpy.uint8, mode="r")
+    total = len(data)
+    pos = 0
+    while pos < total:
+        end = min(pos + size, total)
+        ends = numpy.flatnonzero(data[pos:end] == 10)
+        while not len(ends) and end < total:    # a record longer than a block
+            end = min(end + size, total)
+            ends = numpy.flatnonzero(data[pos:end] == 10)
+        if end < total:
+            end = pos + int(ends[-1]) + 1
+        elif not len(ends) or ends[-1] != end - pos - 1:    # no line end after the last record
+            ends = numpy.append(ends, end - pos)
+        block = data[pos:end]
+        starts = numpy.concatenate(([0], ends[:-1] + 1))
+        lengths = ends - starts
+        while True:     # carriage returns before the line end
+            cr = (lengths > 0) & (block[numpy.maximum(starts + lengths - 1, 0)] == 13)
+            if not cr.any():
+                break
+            lengths = lengths - cr
+        yield block, starts, lengths
+        pos = end
+
+def recordarray(block, starts, lengths, width):
+    """Return an array with a row of the first width bytes of each record, padded with blanks
+    
+    If the records are all long enough and equally spaced, the array is a view of block."""
+    
+    n = len(starts)
+    if n and lengths.min() >= width:
+        stride = int(starts[1] - starts[0]) if n > 1 else 0
+        if n == 1 or (numpy.diff(starts) == stride).all():
+            return numpy.lib.stride_tricks.as_strided(block[starts[0]:], (n, width), (stride, 1),
+                writeable=False)
+    if width > 256:
+        # long records are copied one at a time, which costs less than indexing each byte
+        rows = numpy.full((n, width), 32, numpy.uint8)
+        for i, (start, count) in enumerate(zip(starts.tolist(), numpy.minimum(lengths, width).tolist())):
+            rows[i, :count] = block[start:start + count]
+        return rows
+    positions = numpy.arange(width)
+    rows = block[numpy.minimum(starts[:, None] + positions, len(block) - 1)]
+    rows[positions >= lengths[:, None]] = 32
+    return rows
+
+def arraycheck(test, passed=None):
+    """Return a check of an array of fixed format fields that tests each distinct field once
+    
+    The array has a row of bytes for each record.  test is as for columncheck.
+    passed is None or a function that returns a boolean array that is True for
+    the rows that are certainly valid.  The other rows are grouped by NumPy,
+    and each distinct field is tested.  Fields of up to 8 bytes are grouped as
+    integers, which sort much faster than bytes, and fields of up to 2 bytes
+    are counted without sorting.  The results are remembered across chunks
+    for up to VALIDATECACHE fields."""
+    
+    known = {}
+    def check(rows):
+        n, width = rows.shape
+        if not width:
+            return []
+        index = None
+        if passed is not None:
+            index = numpy.flatnonzero(~passed(rows))
+            if not len(index):
+                return []
+            rows = rows[index]
+            n = len(index)
+        if width <= 8:
+            keytype = width <= 2 and numpy.uint16 or numpy.uint64
+            keys = numpy.zeros((n, keytype().itemsize), numpy.uint8)
+            keys[:, :width] = rows
+            keys = keys.view(keytype).ravel()
+        else:
+            keys = numpy.ascontiguousarray(rows).view("V%d" % width).ravel()
+        if width <= 2:
+            present = numpy.zeros(65536, bool)
+            present[keys] = True
+            distinct = numpy.flatnonzero(present).astype(numpy.uint16)
+            lookup = numpy.empty(65536, numpy.intp)
+            lookup[distinct] = numpy.arange(len(distinct))
+            inverse = lookup[keys]
+        else:
+            distinct, inverse = numpy.unique(keys, return_inverse=True)
+        if len(known) + len(distinct) > VALIDATECACHE:
+            known.clear()
+        problems = []
+        for key in distinct:
+            # the key holds the bytes of the field
+            field = key.tobytes()[:width]
+            try:
+                problem = known[field]
+            except KeyError:
+                problem = known[field] = test(field.decode("latin_1"))
+            problems.append(problem)
+        bad = numpy.array([problem is not None for problem in problems])
+        found = numpy.flatnonzero(bad[inverse])
+        if index is None:
+            index = found
+        else:
+            index = index[found]
+        return [(int(i), problems[inverse[k]]) for i, k in zip(index, found)]
+    return check
+
+def numberspassed(bounds):
+    """Return a function that is True for the rows of an array of fields that are blank or numbers within bounds
+    
+    bounds is (low, high) from getValueBounds.  A field that is a sign, up to
+    15 digits and a decimal point between blanks is converted for all the rows
+    at once.  The digits are summed exactly and divided by a power of ten, so
+    the value is the same as float gives.  Other fields, such as numbers with
+    an exponent, are left to be tested."""
+    
+    low, high = bounds
+    def passed(rows):
+        n, width = rows.shape
+        powers = 10. ** numpy.arange(width + 1)
+        digits = rows - numpy.uint8(48)
+        digit = digits <= 9
+        filled = rows != 32
+        nfilled = filled.sum(axis=1)
+        first = filled.argmax(axis=1)
+        # only blanks are outside the first and last filled bytes
+        ok = filled[:, ::-1].argmax(axis=1) == width - first - nfilled
+        ndigits = digit.sum(axis=1)
+        ok &= (ndigits > 0) & (ndigits <= 15)
+        # the number of digits after each byte gives its power of ten
+        after = digit[:, ::-1].cumsum(axis=1)[:, ::-1] - digit
+        value = (numpy.where(digit, digits, 0) * powers[after]).sum(axis=1)
+        others = nfilled - ndigits
+        if others.any():
+            # the other bytes can only be a decimal point and a sign that comes first
+            rownum = numpy.arange(n)
+            point = rows == 46
+            npoints = point.sum(axis=1)
+            signed = (rows[rownum, first] == 43) | (rows[rownum, first] == 45)
+            ok &= (others == npoints + signed) & (npoints <= 1)
+            value /= powers[(point * after).sum(axis=1)]
+            value = numpy.where(rows[rownum, first] == 45, -value, value)
+        return (nfilled == 0) | (ok & (value >= low) & (value <= high))
+    return passed
+
+def bitspassed(rows):
+    """Return True for the rows of an array of fields that hold only 0, 1 and blank"""
+    
+    return ((rows == 48) | (rows == 49) | (rows == 32)).all(axis=1)
+
+def arrayspreadcheck(test, nsubfields, passed=None):
+    """Return a check of an array of multiple category fields
+    
+    The rows are split into nsubfields subfields, which are checked together
+    as one array.  The first problem of a field is reported."""
+    
+    whole = arraycheck(test, passed)
+    def check(rows):
+        n, total = rows.shape
+        found = {}
+        for i, problem in whole(rows.reshape(n * nsubfields, total // nsubfields)):
+            found.setdefault(i // nsubfields, problem)
+        return sorted(found.items())
+    return check
+
+PROFILEMAXVALUES = 1000
+
+class Profile(object):
+    """Descriptive statistics accumulated while the cases are loaded
+    
+    Frequencies are counted for single and logical variables, the count,
+    minimum, maximum, sum and mean are kept for quantity variables, responses
+    are counted for multiple response sets, and the cases whose filter is
+    false are counted.  At most maxvalues distinct values of a variable or
+    spread set are counted, and later values are counted together as other,
+    so memory does not grow with the number of cases."""
+    
+    def __init__(self, par, reader, maxvalues=PROFILEMAXVALUES):
+        """par is the metadata handler
+        reader is the NativeReader decoding the cases
+        maxvalues is the number of distinct values counted for each variable"""
+        
+        self.maxvalues = maxvalues
+        self.ncases = 0
+        self.complete = False
+        self.frequencies = []   # [var, column, counts, other]
+        self.quantities = []    # [var, column, n, missing, minimum, maximum, sum]
+        self.mdsets = []        # [var, first column, last column + 1, member counts, responding]
+        self.mcsets = []        # [var, first column, last column + 1, code counts, responding, other]
+        self.filters = [[name, expr, test, 0] for name, expr, test in reader.filters]
+        offset = 0
+        for var in par.variables:
+            ncols = len(var.getNativeVars(reader.recordformat))
+            if var.multtype == "MD":
+                self.mdsets.append([var, offset, offset + ncols, [0] * ncols, 0])
+            elif var.multtype == "MC":
+                self.mcsets.append([var, offset, offset + ncols, collections.Counter(), 0, 0])
+            elif var.type in ["single", "logical"]:
+                self.frequencies.append([var, offset, collections.Counter(), 0])
+            elif var.type == "quantity":
+                self.quantities.append([var, offset, 0, 0, None, None, 0.])
+            offset += ncols
+    
+    def counted(self, batches):
+        """Generator passing batches of cases through after adding them to the profile"""
+        
+        for cases in batches:
+            self.add(cases)
+            yield cases
+        self.complete = True
+    
+    def run(self, reader, datafile, batchsize=NATIVEBATCHSIZE, workers=1, casesel=None):
+        """Profile the data file when the cases are not being loaded"""
+        
+        for cases in self.counted(reader.batches(datafile, batchsize, workers, casesel=casesel)):
+            pass
+    
+    def add(self, cases):
+        """Add a list of decoded cases to the profile"""
+        
+        if not cases:
+            return
+        self.ncases += len(cases)
+        # the statistics are gathered a column at a time
+        columns = list(zip(*cases))
+        for entry in self.frequencies:
+            counts = entry[2]
+            counts.update(columns[entry[1]])
+            entry[3] += self.limit(counts)
+        for entry in self.quantities:
+            values = [v for v in columns[entry[1]] if v is not None]
+            entry[3] += len(cases) - len(values)
+            if values:
+                entry[2] += len(values)
+                entry[4] = min(values) if entry[4] is None else min(entry[4], min(values))
+                entry[5] = max(values) if entry[5] is None else max(entry[5], max(values))
+                entry[6] += math.fsum(values)
+        for entry in self.mdsets:
+            first, last, counts = entry[1], entry[2], entry[3]
+            for i in range(last - first):
+                counts[i] += columns[first + i].count(1.)
+            entry[4] += len(cases) - [1. in case[first:last] for case in cases].count(False)
+        for entry in self.mcsets:
+            first, last, counts = entry[1], entry[2], entry[3]
+            entry[4] += len(cases) - [case[first:last] for case in cases].count([None] * (last - first))
+            counts.update([v for column in columns[first:last] for v in column if v is not None])
+            entry[5] += self.limit(counts)
+        for entry in self.filters:
+            test = entry[2]
+            entry[3] += sum(1 for case in cases if test(case) is False)
+    
+    def limit(self, counts):
+        """Remove the values beyond the first maxvalues from counts and return their total"""
+        
+        other = 0
+        if len(counts) > self.maxvalues:
+            for value in list(counts)[self.maxvalues:]:
+                if value is not None:
+                    other += counts.pop(value)
+        return other
+    
+    def todict(self, metadatafile, datafile):
+        """Return the profile as a dictionary that can be written as json"""
+        
+        variables = collections.OrderedDict()
+        for var, col, counts, other in self.frequencies:
+            labels = profilelabels(var)
+            values = sorted((v for v in counts if v is not None), key=profilesortkey)
+            variables[var.name] = collections.OrderedDict([("type", var.type), ("label", var.label),
+                ("missing", counts.get(None, 0)), ("other", other),
+                ("frequencies", [collections.OrderedDict([("value", profilevalue(v)),
+                    ("label", labels.get(v)), ("count", counts[v])]) for v in values])])
+        for var, col, n, missing, minimum, maximum, total in self.quantities:
+            variables[var.name] = collections.OrderedDict([("type", var.type), ("label", var.label),
+                ("n", n), ("missing", missing), ("minimum", minimum), ("maximum", maximum),
+                ("sum", total), ("mean", total / n if n else None)])
+        for var, first, last, counts, responding in self.mdsets:
+            labels = profilelabels(var)
+            variables[var.name] = collections.OrderedDict([("type", var.type), ("set", "MD"),
+                ("label", var.label), ("responding", responding),
+                ("responses", [collections.OrderedDict([("member", name),
+                    ("label", labels.get(float(i + 1))), ("count", count)])
+                    for i, (name, count) in enumerate(zip(var.vardeflist, counts))])])
+        for var, first, last, counts, responding, other in self.mcsets:
+            labels = profilelabels(var)
+            variables[var.name] = collections.OrderedDict([("type", var.type), ("set", "MC"),
+                ("label", var.label), ("responding", responding), ("other", other),
+                ("responses", [collections.OrderedDict([("value", profilevalue(v)),
+                    ("label", labels.get(v)), ("count", counts[v])])
+                    for v in sorted(counts, key=profilesortkey)])])
+        filters = collections.OrderedDict((name, collections.OrderedDict([("filter", expr),
+            ("missing", hits)])) for name, expr, test, hits in self.filters)
+        return collections.OrderedDict([("metadata", metadatafile), ("data", datafile),
+            ("cases", self.ncases), ("variables", variables), ("filters", filters)])
+    
+    def save(self, profilefile, metadatafile, datafile):
+        """Write the profile as a json file"""
+        
+        with open(profilefile, "w", encoding="utf_8") as f:
+            json.dump(self.todict(metadatafile, datafile), f, indent=1, ensure_ascii=False)
+    
+    def display(self, metadatafile, datafile):
+        """Display the profile as pivot tables"""
+        
+        profile = self.todict(metadatafile, datafile)
+        ncases = profile["cases"]
+        def percent(count):
+            return round(100. * count / ncases, 2) if ncases else None
+        freqlabels, freqcells = [], []
+        qlabels, qcells = [], []
+        setlabels, setcells = [], []
+        for name, entry in profile["variables"].items():
+            if "frequencies" in entry:
+                for item in entry["frequencies"]:
+                    freqlabels.append("%s: %s" % (name, profilecaption(item["value"], item["label"])))
+                    freqcells.extend([item["count"], percent(item["count"])])
+                for caption, count in [(_("Other"), entry["other"]), (_("Missing"), entry["missing"])]:
+                    if count:
+                        freqlabels.append("%s: %s" % (name, caption))
+                        freqcells.extend([count, percent(count)])
+            elif "responses" in entry:
+                for item in entry["responses"]:
+                    if entry["set"] == "MD":
+                        caption = profilecaption(item["member"], item["label"])
+                    else:
+                        caption = profilecaption(item["value"], item["label"])
+                    setlabels.append("$%s: %s" % (name, caption))
+                    setcells.extend([item["count"], percent(item["count"])])
+                if entry.get("other"):
+                    setlabels.append("$%s: %s" % (name, _("Other")))
+                    setcells.extend([entry["other"], percent(entry["other"])])
+                setlabels.append("$%s: %s" % (name, _("Cases Responding")))
+                setcells.extend([entry["responding"], percent(entry["responding"])])
+            else:
+                qlabels.append(name)
+                qcells.extend([entry["n"], entry["missing"], entry["minimum"], entry["maximum"],
+                    entry["sum"], entry["mean"]])
+        StartProcedure(_("Get Triple-S"), "STATSGETTRIPLES")
+        try:
+            if freqlabels:
+                pt = spss.BasePivotTable(_("Profile Frequencies"), "STATSGETTRIPLESPROFILEFREQ")
+                pt.SimplePivotTable(rowdim=_("Variable: Value"), rowlabels=freqlabels,
+                    coldim=_("Statistics"), collabels=[_("Count"), _("Percent of Cases")],
+                    cells=freqcells)
+            if qlabels:
+                pt = spss.BasePivotTable(_("Profile Quantities"), "STATSGETTRIPLESPROFILEQUANTITY")
+                pt.SimplePivotTable(rowdim=_("Variable"), rowlabels=qlabels,
+                    coldim=_("Statistics"), collabels=[_("N"), _("Missing"), _("Minimum"),
+                    _("Maximum"), _("Sum"), _("Mean")], cells=qcells)
+            if setlabels:
+                pt = spss.BasePivotTable(_("Profile Multiple Response Sets"), "STATSGETTRIPLESPROFILESETS")
+                pt.SimplePivotTable(rowdim=_("Set: Response"), rowlabels=setlabels,
+                    coldim=_("Statistics"), collabels=[_("Count"), _("Percent of Cases")],
+                    cells=setcells)
+            if profile["filters"]:
+                pt = spss.BasePivotTable(_("Profile Filters"), "STATSGETTRIPLESPROFILEFILTERS")
+                cells = []
+                for entry in profile["filters"].values():
+                    cells.extend([entry["filter"], entry["missing"], percent(entry["missing"])])
+                pt.SimplePivotTable(rowdim=_("Variable"), rowlabels=list(profile["filters"]),
+                    coldim=_("Statistics"), collabels=[_("Filter"), _("Cases Set Missing"),
+                    _("Percent of Cases")], cells=cells)
+            spss.TextBlock(_("Data Profile"), _("""%s cases from %s were profiled.""")\
+                % (ncases, datafile))
+        finally:
+            spss.EndProcedure()
+
+def profilelabels(var):
+    """Return a dictionary of value labels keyed by the values the native loader produces"""
+    
+    isnumeric = var.multtype is not None or var.format != "literal"
+    labels = {}
+    for code, label in var.values.items():
+        if isnumeric:
+            code = tonumber(code)
+            if code is None:
+                continue
+        labels[code] = "".join(label)
+    return labels
+
+def profilesortkey(value):
+    """Return a sort key ordering numbers before strings"""
+    
+    if isinstance(value, str):
+        return (1, 0, value)
+    return (0, value, "")
+
+def profilevalue(value):
+    """Return value with whole numbers as integers for the profile"""
+    
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def profilecaption(value, label):
+    """Return the row caption for a value and its label, which may be None"""
+    
+    if label:
+        return "%s %s" % (value, label)
+    return str(value)
+
+class HierarchyJoin(object):
+    """Merge the cases of ordered hierarchy levels into cases of the lowest level
+    
+    All the levels are read together in one pass, so only the current case
+    of each parent level is held in memory.  The lowest level variables come
+    first followed by the variables of each parent level that are not
+    propagated from a lower level."""
+    
+    def __init__(self, levels, pars, strmvcode, dataencoding, scorerecode):
+        """levels is the list of Level objects from the root to the lowest level
+        pars is the list of the corresponding metadata handler objects
+        The other parameters are as for NativeReader"""
+        
+        # everything is kept from the lowest level upward
+        self.levels = list(reversed(levels))
+        pars = list(reversed(pars))
+        self.datafiles = [leveldatafile(par, level.metadatafile) for par, level in zip(pars, self.levels)]
+        self.readers = [NativeReader(par, strmvcode,
+            resolveencoding(dataencoding, datafile, level.metadatafile), scorerecode)
+            for par, datafile, level in zip(pars, self.datafiles, self.levels)]
+        self.columns = []
+        self.selections = []
+        seen = set()
+        for reader in self.readers:
+            keep = [i for i, (name, vartype) in enumerate(reader.columns) if name.lower() not in seen]
+            seen.update(name.lower() for name, vartype in reader.columns)
+            self.selections.append(keep)
+            self.columns.extend(reader.columns[i] for i in keep)
+        # positions of each link variable in the child and in the parent cases
+        self.links = []
+        for k in range(1, len(self.levels)):
+            linkvar = self.levels[k-1].parents[0].linkvar
+            positions = []
+            for reader, level in [(self.readers[k-1], self.levels[k-1]), (self.readers[k], self.levels[k])]:
+                names = [name.lower() for name, vartype in reader.columns]
+                if linkvar is None or linkvar.lower() not in names:
+                    raise ValueError(_("""The link variable %s is not defined in level %s""") % (linkvar, level.ident))
+                positions.append(names.index(linkvar.lower()))
+            self.links.append((linkvar, positions[0], positions[1]))
+    
+    def cases(self):
+        """Generator for the merged cases"""
+        
+        iters = [reader.cases(datafile) for reader, datafile in zip(self.readers, self.datafiles)]
+        current = [None] * len(iters)
+        for case in iters[0]:
+            row = [case[i] for i in self.selections[0]]
+            child = case
+            for k in range(1, len(iters)):
+                linkvar, childpos, parentpos = self.links[k-1]
+                key = child[childpos]
+                parent = current[k]
+                while parent is None or parent[parentpos] != key:
+                    parent = next(iters[k], None)
+                    if parent is None:
+                        raise ValueError(_("""No record of level %s has %s = %s.  The levels are not in the same order.""")\
+                            % (self.levels[k].ident, linkvar, key))
+                current[k] = parent
+                row.extend(parent[i] for i in self.selections[k])
+                child = parent
+            yield row
+    
+    def batches(self, batchsize):
+        """Generator for lists of up to batchsize merged cases"""
+        
+        return batched(self.cases(), batchsize)
+
+# Statistics date formats exported as Triple-S dates and the origin of Statistics dates
+EXPORTDATEFORMATS = ("DATE", "ADATE", "EDATE", "SDATE", "JDATE")
+DATEORIGIN = (1582, 10, 14)
+
+def doexport(metadatafile, datafile, recordformat, variables, dataencoding, timer):
+    """Write the active dataset as a Triple-S metadata file and data file
+    
+    datafile is the data file or None for the metadata file with extension txt
+    recordformat is "fixed" or "csv"
+    variables is a list of variable names and ranges to export or None for all
+    dataencoding is utf8, locale or the name of a codec for the data file"""
+    
+    if datafile is None:
+        datafile = defaultdatafile(metadatafile)
+    if compression(metadatafile) is not None or compression(datafile) is not None:
+        raise ValueError(_("""Compressed files cannot be written by EXPORT"""))
+    if dataencoding.lower() in ["utf8", "auto"]:
+        encoding = "utf_8"
+    elif dataencoding.lower() == "locale":
+        encoding = localeencoding()
     else:
-        inputencoding = locale.getlocale()[1]
-        outputencoding = inputencoding
-        nl = "\n"
-    with codecs.EncodedFile(codecs.open(syntaxfile, "wb"), inputencoding, outputencoding) as f:
+        encoding = dataencoding
+    with timer.phase(_("Export dictionary")):
+        export = TriplesExport(recordformat, variables, encoding)
+    timer.count(_("Export dictionary"), _("Variables"), len(export.fields))
+    with timer.phase(_("Export data")):
+        export.writedata(datafile)
+    timer.count(_("Export data"), _("Cases"), export.ncases)
+    export.writemetadata(metadatafile, datafile)
+    print(_("""Triple-S metadata file created: %s""") % metadatafile)
+    print(_("""Triple-S data file created: %s""") % datafile)
+
+class TriplesExport(object):
+    """Export of the active dataset in Triple-S format
+    
+    The dictionary is mapped to the Variable, Record and Datafile model in
+    the reverse of the import.  Variables with value labels become single,
+    other numeric variables quantity, other strings character and date and
+    time formats date and time.  Multiple dichotomy and category sets become
+    multiple variables.  Full labels, scores and text come from the
+    FullLabelText, score and Text attributes the import creates.  The cases
+    are written from a cursor a batch at a time, and the metadata are written
+    last because the ranges of the quantity variables come from the data,
+    so memory does not depend on the number of cases."""
+    
+    def __init__(self, recordformat="fixed", selection=None, encoding="utf_8"):
+        """recordformat is "fixed" or "csv"
+        selection is a list of variable names and ranges to export or None for all
+        encoding is the codec for the data file"""
+        
+        self.recordformat = recordformat
+        self.encoding = encoding
+        self.par = metadataHandler(False)
+        self.par.record = Record("V", recordformat, None, None)
+        self.fields = []    # [Variable, cursor columns, encoder] in record order
+        self.indexes = []   # the dataset variables read by the cursor
+        self.quantities = []    # [Variable, cursor column, decimals, minimum, maximum]
+        self.nextstart = 1
+        self.ncases = 0
+        self.readdictionary(selection)
+    
+    def readdictionary(self, selection):
+        """Create the Variable objects for the active dataset"""
+        
+        count = spss.GetVariableCount()
+        names = [spss.GetVariableName(i) for i in range(count)]
+        formats = [spss.GetVariableFormat(i) for i in range(count)]
+        if selection is None:
+            selected = set(range(count))
+        else:
+            selected = set(expandvariables(selection, names))
+        weight = (spss.GetWeightVar() or "").lower()
+        mrsets = [(name, spss.GetMultiResponseSet(name)) for name in spss.GetMultiResponseSetNames()]
+        spss.StartDataStep()
         try:
-            for line in syntax:
-                f.write(line + nl)
-        except UnicodeEncodeError:
-            raise ValueError(_("""The metadata contains text invalid in the current character set.
-The syntax file cannot be written in that character set.
-Running Statistics in Unicode mode might resolve this problem."""))
+            ds = spss.Dataset()
+            dictionary = [(var.label, var.type, dict(var.valueLabels.data), dict(var.attributes.data))
+                for var in ds.varlist]
+        finally:
+            spss.EndDataStep()
+        
+        # a set is written where its first variable is
+        index = dict((name.lower(), i) for i, name in enumerate(names))
+        sets = {}
+        members = set()
+        for setname, (label, coding, counted, datatype, varnames) in mrsets:
+            setindexes = [index[name.lower()] for name in varnames]
+            numbers = None
+            if coding.lower() == "dichotomies":
+                setindexes, numbers = bitstringfields(setname, setindexes, names, index)
+            if not selected.intersection(setindexes):
+                continue
+            codes = set()
+            for i in setindexes:
+                codes.update(dictionary[i][2])
+            categories = coding.lower() != "dichotomies"
+            if datatype.lower() != "numeric" or not selected.issuperset(setindexes) \
+                    or members.intersection(setindexes) \
+                    or (categories and not codes) \
+                    or (categories and not all(float(code).is_integer() for code in codes)):
+                print(_("""The variables of multiple response set %s are exported separately because the set is not numeric, is not completely selected, overlaps another set, or has codes that are not labelled whole numbers""")\
+                    % setname)
+                continue
+            sets[setindexes[0]] = (setname, label, coding, counted, setindexes, sorted(codes), numbers)
+            members.update(setindexes)
+        for i in range(count):
+            if i in sets:
+                self.addset(sets[i], names, formats, dictionary)
+            elif i in selected and i not in members:
+                label, vartype, valuelabels, attributes = dictionary[i]
+                self.addvariable(i, names[i], formats[i], label, vartype, valuelabels, attributes,
+                    names[i].lower() == weight)
+    
+    def addfield(self, var, width, indexes, encoder):
+        """Add a variable written from the dataset variables in indexes to the record"""
+        
+        var.ident = str(len(self.fields) + 1)
+        if self.recordformat == "fixed":
+            var.position = (self.nextstart, self.nextstart + width - 1)
+            self.nextstart += width
+        else:
+            var.position = (len(self.fields) + 1, None)
+        self.fields.append([var, list(range(len(self.indexes), len(self.indexes) + len(indexes))), encoder])
+        self.indexes.extend(indexes)
+        self.par.variables.append(var)
+    
+    def addvariable(self, i, name, format, label, vartype, valuelabels, attributes, isweight):
+        """Add a variable that is not in a multiple response set"""
+        
+        fixed = self.recordformat == "fixed"
+        m = re.match(r"([A-Z]+)(\d+)(?:\.(\d+))?", format.upper())
+        formattype, width, decimals = m.group(1), int(m.group(2)), int(m.group(3) or 0)
+        var = Variable(None, "quantity", isweight and "weight" or "regular")
+        var.name = name
+        var.label = exportlabel(label, attributes)
+        var.text = tuple(exportattribute(attributes, "Text"))
+        scores = exportscores(attributes)
+        if vartype > 0:
+            width = vartype
+            if valuelabels:
+                var.type, var.format = "single", "literal"
+                var.values = dict((k.rstrip(), v) for k, v in sorted(valuelabels.items()))
+                var.scores = dict((k, scores[k]) for k in var.values if k in scores)
+            else:
+                var.type = "character"
+                var.size = str(width)
+            encoder = exportstring(width, fixed, self.encoding)
+        elif formattype in EXPORTDATEFORMATS:
+            var.type, width = "date", 8
+            encoder = exportdate(name, fixed)
+        elif formattype == "TIME":
+            var.type, width = "time", 6
+            encoder = exporttime(name, fixed)
+        elif valuelabels and decimals == 0 and all(float(k).is_integer() for k in valuelabels):
+            var.type = "single"
+            var.values = dict(("%d" % k, v) for k, v in sorted(valuelabels.items()))
+            var.scores = dict((k, scores[k]) for k in var.values if k in scores)
+            width = max([width] + [len(k) for k in var.values])
+            encoder = exportnumber(name, width, 0, fixed, True)
+        else:
+            var.values = dict(("%.*f" % (decimals, k), v) for k, v in sorted(valuelabels.items()))
+            self.quantities.append([var, len(self.indexes), decimals, None, None])
+            encoder = exportnumber(name, width, decimals, fixed, False)
+        self.addfield(var, width, [i], encoder)
+    
+    def addset(self, mrset, names, formats, dictionary):
+        """Add a multiple response set as a multiple variable"""
+        
+        setname, label, coding, counted, setindexes, codes, numbers = mrset
+        fixed = self.recordformat == "fixed"
+        var = Variable(None, "multiple")
+        var.name = setname.lstrip("$")
+        var.label = label or None
+        if coding.lower() == "dichotomies":
+            if numbers is None:
+                numbers = range(1, len(setindexes) + 1)
+            var.values = dict((str(k), exportlabel(dictionary[i][0], dictionary[i][3]) or names[i])
+                for k, i in sorted((k, setindexes[k - 1]) for k in numbers))
+            width = len(setindexes)
+            encoder = exportdichotomies(float(counted))
+        else:
+            labels = {}
+            for i in reversed(setindexes):
+                labels.update(dictionary[i][2])
+            var.values = dict(("%d" % code, labels[code]) for code in codes)
+            scores = exportscores(dictionary[setindexes[0]][3])
+            var.scores = dict((k, scores[k]) for k in var.values if k in scores)
+            spreadwidth = max([len(k) for k in var.values] +
+                [int(re.match(r"[A-Z]+(\d+)", formats[i].upper()).group(1)) for i in setindexes])
+            var.spreadsubfields = str(len(setindexes))
+            var.spreadwidth = str(spreadwidth)
+            width = len(setindexes) * spreadwidth
+            encoder = exportspread(var.name, spreadwidth, fixed)
+        self.addfield(var, width, setindexes, encoder)
+    
+    def writedata(self, datafile, batchsize=NATIVEBATCHSIZE):
+        """Write the cases to datafile from a cursor a batch at a time"""
+        
+        fixed = self.recordformat == "fixed"
+        temp = datafile + ".tmp"
+        cur = spss.Cursor(self.indexes, accessType="r")
+        try:
+            with open(temp, "w", encoding=self.encoding, errors="replace", newline="") as f:
+                writer = csv.writer(f, lineterminator="\n")
+                while True:
+                    cases = cur.fetchmany(batchsize)
+                    if not cases:
+                        break
+                    self.ncases += len(cases)
+                    columns = list(zip(*cases))
+                    fields = [list(map(encoder, *[columns[c] for c in cols]))
+                        for var, cols, encoder in self.fields]
+                    for entry in self.quantities:
+                        values = [v for v in columns[entry[1]] if v is not None]
+                        if values:
+                            entry[3] = min(values) if entry[3] is None else min(entry[3], min(values))
+                            entry[4] = max(values) if entry[4] is None else max(entry[4], max(values))
+                    if fixed:
+                        f.writelines("".join(record) + "\n" for record in zip(*fields))
+                    else:
+                        writer.writerows(zip(*fields))
+            os.replace(temp, datafile)
+        except:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        finally:
+            cur.close()
+        for var, col, decimals, minimum, maximum in self.quantities:
+            var.rangefrom = "%.*f" % (decimals, minimum or 0)
+            var.rangeto = "%.*f" % (decimals, maximum or 0)
+    
+    def writemetadata(self, metadatafile, datafile):
+        """Write the Triple-S metadata file after the data have been written"""
+        
+        name = os.path.splitext(os.path.basename(metadatafile))[0]
+        datafileinfo = Datafile("2.0", None, None)
+        datafileinfo.date = time.strftime("%d %B %Y")
+        datafileinfo.time = time.strftime("%H:%M")
+        datafileinfo.origin = "STATS GET TRIPLES"
+        datafileinfo.name = name
+        datafileinfo.title = name
+        self.par.datafile = datafileinfo
+        record = self.par.record
+        attrs = " ident=%s" % saxutils.quoteattr(record.ident)
+        if record.format == "csv":
+            attrs += ' format="csv"'
+        attrs += " href=%s" % saxutils.quoteattr(os.path.basename(datafile))
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>'] + datafileinfo.getXml()
+        lines.append("    <record%s>" % attrs)
+        for var in self.par.variables:
+            lines.extend("      " + line for line in var.getXml(record.format))
+        lines.extend(["    </record>", "  </survey>", "</sss>", ""])
+        temp = metadatafile + ".tmp"
+        with open(temp, "w", encoding="utf_8") as f:
+            f.write("\n".join(lines))
+        os.replace(temp, metadatafile)
+
+def bitstringfields(setname, setindexes, names, index):
+    """Return the dataset variables of the bitstring of a dichotomy set and the labelled positions
+    
+    The import names the fields of a bitstring NAME_1 to NAME_n but puts
+    only the labelled ones in the set.  If the set variables follow that
+    pattern and the complete run is in the dataset, the run is returned with
+    the field numbers of the set variables.  Otherwise the set variables are
+    returned with None."""
+    
+    base = setname.lstrip("$").lower()
+    numbers = []
+    for i in setindexes:
+        m = re.match(re.escape(base) + r"_(\d+)$", names[i].lower())
+        if m is None:
+            return setindexes, None
+        numbers.append(int(m.group(1)))
+    run = [index.get("%s_%d" % (base, k)) for k in range(1, max(numbers) + 1)]
+    if None in run or run != list(range(run[0], run[0] + len(run))):
+        return setindexes, None
+    return run, numbers
+
+def expandvariables(selection, names):
+    """Return the indexes in names of the variables in selection in dataset order
+    
+    selection is a list of names, ALL and first TO last ranges"""
+    
+    index = dict((name.lower(), i) for i, name in enumerate(names))
+    def find(token):
+        if token.lower() not in index:
+            raise ValueError(_("""Variable %s is not in the active dataset""") % token)
+        return index[token.lower()]
+    result = set()
+    pos = 0
+    while pos < len(selection):
+        token = selection[pos]
+        if token.lower() == "all":
+            result.update(range(len(names)))
+            pos += 1
+        elif pos + 2 < len(selection) and selection[pos + 1].lower() == "to":
+            first, last = find(token), find(selection[pos + 2])
+            if first > last:
+                raise ValueError(_("""The range %s TO %s is not in dataset order""") % (token, selection[pos + 2]))
+            result.update(range(first, last + 1))
+            pos += 3
+        else:
+            result.add(find(token))
+            pos += 1
+    return sorted(result)
+
+def exportattribute(attributes, name):
+    """Return the values of a custom attribute as a list, which is empty if it is not defined"""
+    
+    value = attributes.get(name)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+def exportlabel(label, attributes):
+    """Return the full label of a variable from its FullLabelText attribute or its label"""
+    
+    full = "".join(exportattribute(attributes, "FullLabelText")).strip()
+    return full or label or None
+
+def exportscores(attributes):
+    """Return the dictionary of codes and scores in a score attribute"""
+    
+    scores = {}
+    for item in exportattribute(attributes, "score"):
+        m = re.match(r"(.*?)(?<!\\) \| (.*)$", item, flags=re.S)
+        if m:
+            scores[m.group(1).replace("\\|", "|")] = m.group(2)
+    return scores
+
+def exportoverflow(name, value, width):
+    """Return the error for a value that does not fit its field"""
+    
+    return ValueError(_("""The value %s of variable %s does not fit in %s columns.  Widen its format and export again.""")\
+        % (value, name, width))
+
+def exportnumber(name, width, decimals, fixed, integer):
+    """Return a function formatting a number with decimals places in width columns
+    
+    integer indicates that only whole numbers are allowed"""
+    
+    blank = " " * width if fixed else ""
+    def encode(value):
+        if value is None:
+            return blank
+        if integer and not float(value).is_integer():
+            raise ValueError(_("""Variable %s has value labels but a value, %s, that is not a whole number""")\
+                % (name, value))
+        text = "%.*f" % (decimals, value)
+        if len(text) > width:
+            raise exportoverflow(name, value, width)
+        return text.rjust(width) if fixed else text
+    return encode
+
+def exportstring(width, fixed, encoding):
+    """Return a function padding a string to width bytes in encoding"""
+    
+    def encode(value):
+        value = value.rstrip()
+        if not fixed:
+            return value
+        if value.isascii():
+            return value.ljust(width)
+        data = value.encode(encoding, "replace")
+        if len(data) > width:
+            value = data[:width].decode(encoding, "ignore")
+            data = value.encode(encoding, "replace")
+        return value + " " * (width - len(data))
+    return encode
+
+def exportdate(name, fixed):
+    """Return a function formatting a Statistics date as YYYYMMDD"""
+    
+    origin = datetime.datetime(*DATEORIGIN)
+    def encode(value):
+        if value is None:
+            return "        " if fixed else ""
+        try:
+            return (origin + datetime.timedelta(seconds=value)).strftime("%Y%m%d")
+        except (OverflowError, ValueError):
+            raise exportoverflow(name, value, 8)
+    return encode
+
+def exporttime(name, fixed):
+    """Return a function formatting a Statistics time as HHMMSS"""
+    
+    def encode(value):
+        if value is None:
+            return "      " if fixed else ""
+        seconds = int(round(value))
+        if not 0 <= seconds < 100 * 3600:
+            raise exportoverflow(name, value, 6)
+        return "%02d%02d%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return encode
+
+def exportdichotomies(counted):
+    """Return a function writing the members of a dichotomy set as a bitstring"""
+    
+    def encode(*values):
+        return "".join(["1" if value == counted else "0" for value in values])
+    return encode
+
+def exportspread(name, width, fixed):
+    """Return a function writing the codes of a category set as subfields of width columns"""
+    
+    blank = " " * width
+    def encode(*values):
+        fields = []
+        for value in values:
+            if value is None:
+                fields.append(blank)
+                continue
+            if not float(value).is_integer() or value < 0:
+                raise ValueError(_("""Multiple response set %s has a value, %s, that is not a code""")\
+                    % (name, value))
+            code = "%0*d" % (width, value)
+            if len(code) > width:
+                raise exportoverflow(name, value, width)
+            fields.append(code)
+        return "".join(fields) if fixed else "".join(fields).rstrip()
+    return encode
+
+def filterstep(test, col, mvcode):
+    """Return a case function that sets col to mvcode where the filter is false"""
+    
+    def step(case):
+        if test(case) is False:
+            case[col] = mvcode
+    return step
+
+def recodestep(recodes, first, last):
+    """Return a case function that recodes columns first to last - 1 using the recodes dictionary"""
+    
+    def step(case):
+        for i in range(first, last):
+            case[i] = recodes.get(case[i], case[i])
+    return step
+
+def tonumber(text):
+    """Return text as a float or None if it is blank or not a number"""
+    
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def getfield(fields, i):
+    """Return csv field i or an empty string if the record is short"""
+    
+    try:
+        return fields[i]
+    except IndexError:
+        return ""
+
+def unquote(code):
+    """Return code with Statistics quoting removed"""
+    
+    if len(code) >= 2 and code[0] in "'\"" and code[-1] == code[0]:
+        return code[1:-1].replace(code[0] * 2, code[0])
+    return code
+
+# Filter expressions are Statistics logical expressions.  The common forms
+# (variables, literals, relational operators, AND, OR, NOT and parentheses)
+# are compiled into case functions for the native loader.
+filtertoken = re.compile(r"""\s*(?:(?P<num>-?(?:\d+\.?\d*|\.\d+))|(?P<str>"(?:[^"]|"")*"|'(?:[^']|'')*')"""
+    r"""|(?P<op><=|>=|<>|~=|=|<|>|\(|\)|&|\||~)|(?P<name>[A-Za-z@#$][\w.@#$]*))""")
+relops = {"=": "eq", "eq": "eq", "<>": "ne", "~=": "ne", "ne": "ne", "<": "lt", "lt": "lt",
+    ">": "gt", "gt": "gt", "<=": "le", "le": "le", ">=": "ge", "ge": "ge"}
+relfuncs = {"eq": lambda x, y: x == y, "ne": lambda x, y: x != y, "lt": lambda x, y: x < y,
+    "gt": lambda x, y: x > y, "le": lambda x, y: x <= y, "ge": lambda x, y: x >= y}
+
+def compilefilter(expr, index):
+    """Return a function evaluating filter expression expr for a case or None
+    
+    index maps lower case variable names to (case position, isstring)
+    The function returns True, False, or None if the result is missing.
+    None is returned if the expression cannot be handled here."""
+    
+    tokens = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = filtertoken.match(expr, pos)
+        if m is None or m.end() == pos:
+            return None
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == "name" and text.lower() in ["and", "or", "not"] + list(relops):
+            kind, text = "op", text.lower()
+        tokens.append((kind, text))
+        pos = m.end()
+    try:
+        fn, pos = parseor(tokens, 0, index)
+        if pos != len(tokens):
+            return None
+        return aslogical(fn)
+    except (ValueError, KeyError, IndexError):
+        return None
+
+# The parse functions return ((function, kind), next token position) where
+# kind is "logical", True for a string operand or False for a numeric operand
+
+def parseor(tokens, pos, index):
+    left, pos = parseand(tokens, pos, index)
+    while pos < len(tokens) and tokens[pos][1] in ["or", "|"]:
+        right, pos = parseand(tokens, pos + 1, index)
+        left = (orfunc(aslogical(left), aslogical(right)), "logical")
+    return left, pos
+
+def parseand(tokens, pos, index):
+    left, pos = parsenot(tokens, pos, index)
+    while pos < len(tokens) and tokens[pos][1] in ["and", "&"]:
+        right, pos = parsenot(tokens, pos + 1, index)
+        left = (andfunc(aslogical(left), aslogical(right)), "logical")
+    return left, pos
+
+def parsenot(tokens, pos, index):
+    if tokens[pos][1] in ["not", "~"]:
+        operand, pos = parsenot(tokens, pos + 1, index)
+        return (notfunc(aslogical(operand)), "logical"), pos
+    return parserel(tokens, pos, index)
+
+def parserel(tokens, pos, index):
+    left, pos = parseatom(tokens, pos, index)
+    if pos < len(tokens) and tokens[pos][0] == "op" and tokens[pos][1] in relops:
+        op = relfuncs[relops[tokens[pos][1]]]
+        right, pos = parseatom(tokens, pos + 1, index)
+        if left[1] == "logical" or right[1] == "logical" or left[1] != right[1]:
+            raise ValueError
+        return (relfunc(op, left[0], right[0]), "logical"), pos
+    return left, pos
+
+def parseatom(tokens, pos, index):
+    kind, text = tokens[pos]
+    if text == "(":
+        result, pos = parseor(tokens, pos + 1, index)
+        if tokens[pos][1] != ")":
+            raise ValueError
+        return result, pos + 1
+    if kind == "num":
+        value = float(text)
+        return (lambda case: value, False), pos + 1
+    if kind == "str":
+        value = unquote(text).rstrip()
+        return (lambda case: value, True), pos + 1
+    if kind == "name":
+        col, isstring = index[text.lower()]
+        return (lambda case: case[col], isstring), pos + 1
+    raise ValueError
+
+def aslogical(operand):
+    """Return a logical function for an operand of any kind"""
+    
+    fn, kind = operand
+    if kind == "logical":
+        return fn
+    if kind is True:   # strings have no truth value
+        raise ValueError
+    return truth(fn)
+
+def truth(fn):
+    def test(case):
+        value = fn(case)
+        return None if value is None else value != 0
+    return test
+
+def relfunc(op, left, right):
+    def test(case):
+        x, y = left(case), right(case)
+        if x is None or y is None:
+            return None
+        return op(x, y)
+    return test
+
+def notfunc(fn):
+    def test(case):
+        value = fn(case)
+        return None if value is None else not value
+    return test
+
+def andfunc(left, right):
+    def test(case):
+        x, y = left(case), right(case)
+        if x is False or y is False:
+            return False
+        if x is None or y is None:
+            return None
+        return True
+    return test
+
+def orfunc(left, right):
+    def test(case):
+        x, y = left(case), right(case)
+        if x is True or y is True:
+            return True
+        if x is None or y is None:
+            return None
+        return False
+    return test
 
 def attributesFromDict(d):
     """build self attributes from a dictionary d."""
@@ -884,22 +5899,50 @@ class FileHandles(object):
 def Run(args):
     """Execute the STATS TRIPLES extension command"""
 
+    from extension import Template, Syntax, processcmd
     args = args[list(args.keys())[0]]
 
     oobj = Syntax([
         Template("METADATA", subc="",  ktype="literal", var="metadatafile"),
         Template("DATA", subc="",  ktype="literal", var="data"),
         Template("SYNTAX", subc="",  ktype="literal", var="syntax"),
+        Template("SAVFILE", subc="",  ktype="literal", var="savfile"),
         Template("LANGUAGE", subc="", ktype="literal", var="language"),
         Template("EXECUTE", subc="", ktype="bool", var='execute'),
         Template("STRMVCODE", subc="", ktype="literal", var="strmvcode"),
         Template("DATAENCODING", subc="", ktype="str", var="dataencoding"),
-        Template("MAXDATALENGTH", subc="", ktype="int", var="maxdatalength"),
+        Template("MAXDATALENGTH", subc="", ktype="literal", var="maxdatalength", islist=True),
+        Template("LOADER", subc="", ktype="str", var="loader", vallist=["syntax", "native"]),
+        Template("CACHE", subc="", ktype="literal", var="cache"),
+        Template("CACHESIZE", subc="", ktype="int", var="cachesize", vallist=[1]),
+        Template("CACHEAGE", subc="", ktype="int", var="cacheage", vallist=[1]),
+        Template("COLUMNCACHE", subc="", ktype="literal", var="columncache"),
+        Template("CHECKPOINT", subc="", ktype="literal", var="checkpoint"),
+        Template("VARIABLES", subc="", ktype="literal", var="variables", islist=True),
+        Template("CASES", subc="", ktype="int", var="cases"),
+        Template("SAMPLE", subc="", ktype="float", var="sample"),
+        Template("SEED", subc="", ktype="int", var="seed"),
+        Template("HIERARCHY", subc="", ktype="str", var="hierarchy", vallist=["linked", "flat"]),
+        Template("WORKERS", subc="", ktype="int", var="workers", vallist=[1]),
         
         Template("REMOVEHTML", subc="OPTIONS", ktype="bool", var="removehtml"),
         Template("FULLLABELATTR", subc="OPTIONS", ktype="bool", var="fulllabelattr"),
         Template("MDVALLABELS", subc="OPTIONS", ktype="literal", var="mdvallabels", islist=True),
         Template("SCORERECODE", subc="OPTIONS", ktype="bool", var="scorerecode"),
+        Template("MREXPAND", subc="OPTIONS", ktype="str", var="mrexpand", vallist=["if", "loop"]),
+        Template("PARSER", subc="OPTIONS", ktype="str", var="parser", vallist=["sax", "expat"]),
+        Template("PARSECACHE", subc="OPTIONS", ktype="bool", var="parsecache"),
+        Template("PARSECACHESIZE", subc="OPTIONS", ktype="int", var="parsecachesize", vallist=[1]),
+        Template("COALESCE", subc="OPTIONS", ktype="bool", var="coalesce"),
+        Template("TIMING", subc="OPTIONS", ktype="bool", var="timing"),
+        Template("VALIDATE", subc="OPTIONS", ktype="bool", var="validate"),
+        Template("PROFILE", subc="OPTIONS", ktype="bool", var="profile"),
+        Template("PROFILEFILE", subc="OPTIONS", ktype="literal", var="profilefile"),
+        
+        Template("METADATA", subc="EXPORT", ktype="literal", var="exportmetadata"),
+        Template("DATA", subc="EXPORT", ktype="literal", var="exportdata"),
+        Template("FORMAT", subc="EXPORT", ktype="str", var="exportformat", vallist=["fixed", "csv"]),
+        Template("VARIABLES", subc="EXPORT", ktype="literal", var="exportvariables", islist=True),
         
         Template("HELP", subc="", ktype="bool")])
     
@@ -913,7 +5956,11 @@ def Run(args):
     # A HELP subcommand overrides all else
     if "HELP" in args:
         #print helptext
-        helper()
+        try:    #override
+            from extension import helper as showhelp
+        except ImportError:
+            showhelp = helper
+        showhelp()
     else:
         processcmd(oobj, args, dotriples)
 
@@ -932,7 +5979,123 @@ def helper():
     browser = webbrowser.get()
     if not browser.open_new(helpspec):
         print(("Help file not found:" + helpspec))
-try:    #override
-    from extension import helper
-except:
-    pass
\ No newline at end of file
+
+def main(argv=None):
+    """Generate syntax or a sav file from the command line without Statistics
+    
+    argv is the list of arguments or None to use sys.argv.  Run as
+        python -m STATS_GET_TRIPLES metadatafile --syntax syntaxfile [options]
+    The Statistics version and unicode mode that the syntax is written for
+    are given as arguments.  The return is the process exit status."""
+    
+    import argparse
+    installtranslation()
+    parser = argparse.ArgumentParser(prog="STATS_GET_TRIPLES",
+        description=_("Convert a Triple-S survey to SPSS Statistics syntax or a sav file"))
+    parser.add_argument("metadata", help=_("Triple-S metadata file"))
+    parser.add_argument("--data", help=_("data file.  The default is the metadata file with extension txt"))
+    parser.add_argument("--syntax", help=_("syntax file to write"))
+    parser.add_argument("--savfile", help=_("sav file to write"))
+    parser.add_argument("--spssver", default="25",
+        help=_("Statistics major version the syntax is for, e.g. 25.  The default is 25"))
+    parser.add_argument("--unicode", choices=["yes", "no"], default="yes",
+        help=_("whether Statistics runs in Unicode mode, which writes the syntax in UTF-8.  The default is yes"))
+    parser.add_argument("--language")
+    parser.add_argument("--dataencoding", default="locale",
+        help=_("locale, utf8, auto to detect it, or the name of an encoding such as cp1252"))
+    parser.add_argument("--strmvcode", default="", help=_("string missing value code"))
+    parser.add_argument("--maxdatalength", default="50000", help=_("number or auto"))
+    parser.add_argument("--mdvallabels", nargs=2, default=["No", "Yes"], metavar="LABEL",
+        help=_("labels for multiple dichotomy values 0 and 1"))
+    parser.add_argument("--nofulllabelattr", action="store_true", help=_("do not create full label attributes"))
+    parser.add_argument("--removehtml", action="store_true")
+    parser.add_argument("--scorerecode", action="store_true")
+    parser.add_argument("--mrexpand", choices=["if", "loop"], default="if")
+    parser.add_argument("--coalesce", action="store_true")
+    parser.add_argument("--parser", choices=["sax", "expat"], default="sax")
+    parser.add_argument("--parsecache", action="store_true")
+    parser.add_argument("--workers", type=int, help=_("processes decoding the data for --savfile"))
+    parser.add_argument("--variables", nargs="+", metavar="VARIABLE",
+        help=_("variables, idents and ranges such as Q1 TO Q5 to read.  The default is all"))
+    parser.add_argument("--cases", type=int, help=_("number of records to read from the start"))
+    parser.add_argument("--sample", type=float,
+        help=_("fraction of the records to keep or number of records to choose at random"))
+    parser.add_argument("--seed", type=int, help=_("random number seed for --sample"))
+    parser.add_argument("--checkpoint",
+        help=_("checkpoint file for adding only the records appended to the data file to --savfile"))
+    parser.add_argument("--profile",
+        help=_("json file for the frequencies and statistics computed as the data are read"))
+    args = parser.parse_args(argv)
+    if args.syntax is None and args.savfile is None:
+        parser.error(_("--syntax or --savfile must be specified"))
+    if args.checkpoint is not None and args.savfile is None:
+        parser.error(_("--checkpoint requires --savfile"))
+    if args.checkpoint is not None and (args.cases is not None or args.sample is not None):
+        parser.error(_("--checkpoint cannot be used with --cases or --sample"))
+    if args.checkpoint is not None and args.profile is not None:
+        parser.error(_("--checkpoint cannot be used with --profile"))
+    
+    # the syntax may be run from another directory
+    for name in ("metadata", "data", "syntax", "savfile", "checkpoint", "profile"):
+        if getattr(args, name) is not None:
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    spssver = args.spssver.lower()
+    if not spssver.startswith("spss"):
+        spssver = "spss%s0" % spssver.split(".")[0]
+    try:
+        maxdatalength = getmaxdatalength(args.maxdatalength)
+        casesel = None
+        if args.cases is not None or args.sample is not None:
+            casesel = CaseSelection(args.cases, args.sample, args.seed)
+        if args.parsecache:
+            pcache = ParseCache()
+        else:
+            pcache = None
+        args.metadata = zipinput(args.metadata, True)
+        if args.data is not None:
+            args.data = zipinput(args.data, False)
+        handler = parsemetadata(args.metadata, args.removehtml, args.language, pcache, args.parser)
+        if handler.hierarchy is not None:
+            raise ValueError(_("""Hierarchy files can only be read in Statistics"""))
+        if args.variables is not None:
+            selectvariables(handler, args.variables)
+        if args.dataencoding.lower() == "auto":
+            args.dataencoding = resolveencoding(args.dataencoding,
+                args.data or defaultdatafile(args.metadata), args.metadata)
+            print(_("""The data encoding was detected as %s""") % args.dataencoding)
+        elif args.dataencoding.lower() not in ["utf8", "locale"]:
+            codecs.lookup(args.dataencoding)
+        reader = None
+        profiler = None
+        if args.profile is not None:
+            reader = NativeReader(handler, sq(args.strmvcode), args.dataencoding, args.scorerecode)
+            profiler = Profile(handler, reader)
+        if args.checkpoint is not None:
+            checkpointload(handler, args.metadata, args.data, args.checkpoint, args.savfile, False,
+                sq(args.strmvcode), args.dataencoding, not args.nofulllabelattr, args.mdvallabels,
+                None, args.scorerecode)
+        elif args.savfile is not None:
+            writesav(handler, args.metadata, args.data, args.savfile, sq(args.strmvcode),
+                args.dataencoding, not args.nofulllabelattr, args.mdvallabels, args.scorerecode,
+                workers=args.workers, reader=reader, casesel=casesel, profile=profiler)
+            print(_("""Data file created: %s""") % args.savfile)
+        if profiler is not None:
+            datafile = args.data or defaultdatafile(args.metadata)
+            if not profiler.complete:
+                profiler.run(reader, datafile, workers=args.workers, casesel=casesel)
+            profiler.save(args.profile, args.metadata, datafile)
+            print(_("""Profile file created: %s""") % args.profile)
+        if args.syntax is not None:
+            processsyntax(gensyntax(handler, args.metadata, args.data, args.syntax,
+                sq(args.strmvcode), args.dataencoding, maxdatalength, not args.nofulllabelattr,
+                {0: sq(args.mdvallabels[0]), 1: sq(args.mdvallabels[1])}, args.scorerecode,
+                args.mrexpand, args.coalesce, spssver, casesel, args.unicode == "yes"), args.syntax,
+                unicodemode=args.unicode == "yes")
+            print(_("""Syntax file created: %s""") % args.syntax)
+    except (ValueError, LookupError, OSError, xml.sax.SAXException) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Shared helpers for the STATS GET TRIPLES tests
+
+The tests need only the standard library, not Statistics.  Run them from the
+repository root with
+    python -m unittest discover tests
+or with pytest.  Each test works in its own temporary directory."""
+
+import contextlib, io, os, re, shutil, sys, tempfile, unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, "..", "src"))
+if TESTS not in sys.path:
+    sys.path.insert(0, TESTS)
+import STATS_GET_TRIPLES as triples
+import triplesbench
+
+# the functions that report problems need the translation function Statistics supplies
+triples.installtranslation()
+
+EXAMPLE1 = os.path.join(TESTS, "example1.sss")
+EXAMPLE2 = os.path.join(TESTS, "example2.sss")
+DATA1 = os.path.join(TESTS, "example1.txt")
+DATA2 = os.path.join(TESTS, "example2.txt")
+EXPECTED = os.path.join(TESTS, "expected")
+
+def normalizesyntax(text):
+    """Return syntax text without the parts that differ from run to run
+
+    These are the creation time, the random file handle names and the directory of the tests."""
+
+    text = re.sub(r"(\* Syntax created by STATS GET TRIPLES on ).*", r"\1<time>.", text)
+    text = re.sub(r"\bD0\.\d+", "DATAFILE", text)
+    return text.replace(TESTS + os.path.sep, "<tests>/")
+
+def readsyntax(syntaxfile):
+    """Return the text of a syntax file written by the command"""
+
+    with open(syntaxfile, encoding="utf_8_sig") as f:
+        return f.read()
+
+def expectedsyntax(name):
+    """Return the text of a syntax file in the expected directory"""
+
+    with open(os.path.join(EXPECTED, name), encoding="utf_8") as f:
+        return f.read()
+
+def savbody(savfile):
+    """Return a sav file without the creation date and time in its header"""
+
+    with open(savfile, "rb") as f:
+        data = f.read()
+    return data[:92] + data[109:]
+
+def model(obj):
+    """Return obj with the objects it holds replaced by dictionaries of their attributes"""
+
+    if isinstance(obj, (list, tuple)):
+        return [model(item) for item in obj]
+    if isinstance(obj, dict):
+        return dict((key, model(value)) for key, value in obj.items())
+    if hasattr(obj, "__slots__"):
+        return (type(obj).__name__, dict((name, model(getattr(obj, name, None))) for name in obj.__slots__))
+    if hasattr(obj, "__dict__"):
+        return (type(obj).__name__, model(vars(obj)))
+    return obj
+
+class TriplesTestCase(unittest.TestCase):
+    """Test case with a temporary directory for the files written"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="triplestest")
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def runmain(self, *argv):
+        """Return the exit status and printed output of the command line entry point"""
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            status = triples.main([str(arg) for arg in argv])
+        return status, out.getvalue()
+
+    def runok(self, *argv):
+        """Return the printed output of a command line run that must succeed"""
+
+        status, output = self.runmain(*argv)
+        self.assertEqual(status, 0, output)
+        return output
+
+    def synthetic(self, name, cases, recordformat="fixed"):
+        """Write a small synthetic study and return its metadata file name"""
+
+        study = triplesbench.Study(3, cases, recordformat, mdwidth=5, spread=3, seed=cases)
+        return study.write(self.directory, name)
+
+    def copyexample(self, example, name):
+        """Copy an example study and its data to name.sss and name.txt and return the metadata file name"""
+
+        metadatafile = self.path(name + ".sss")
+        shutil.copy(example, metadatafile)
+        shutil.copy(os.path.splitext(example)[0] + ".txt", self.path(name + ".txt"))
+        return metadatafile
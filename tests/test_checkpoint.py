@@ -0,0 +1,79 @@
+"""Tests of incremental loading of appended records with a checkpoint"""
+
+import shutil, struct, unittest
+
+from support import triples, TriplesTestCase
+
+def savvalues(savfile):
+    """Return the compressed case data of a sav file without the padding codes
+
+    Each load ends its last block of codes with padding, so a file added to
+    in steps has the same values as one written at once but not the same bytes."""
+
+    with open(savfile, "rb") as f:
+        data = f.read()
+    pos = data.index(struct.pack("<ii", 999, 0)) + 8
+    values = []
+    while pos < len(data):
+        codes, pos = data[pos:pos + 8], pos + 8
+        for code in codes:
+            if code == 253:
+                values.append(data[pos:pos + 8])
+                pos += 8
+            elif code != 0:
+                values.append(code)
+    return values
+
+class CheckpointTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.full = self.synthetic("full", 300)
+        with open(self.path("full.txt"), "rb") as f:
+            self.lines = f.readlines()
+        self.metadatafile = self.path("growing.sss")
+        shutil.copy(self.full, self.metadatafile)
+        self.savfile = self.path("growing.sav")
+        self.checkpointfile = self.path("growing.ckp")
+
+    def load(self, count):
+        """Write the first count records of the data and load them, returning the output"""
+
+        with open(self.path("growing.txt"), "wb") as f:
+            f.writelines(self.lines[:count])
+        return self.runok(self.metadatafile, "--savfile", self.savfile, "--checkpoint", self.checkpointfile)
+
+    def test_append(self):
+        self.assertIn("starting at byte 0", self.load(150))
+        self.assertEqual(triples.savcases(self.savfile), 150)
+        output = self.load(300)
+        self.assertIn("starting at byte", output)
+        self.assertNotIn("starting at byte 0", output)
+        self.assertEqual(triples.savcases(self.savfile), 300)
+        self.assertIn("No records", self.load(300))
+        self.assertEqual(triples.savcases(self.savfile), 300)
+
+    def test_sameasfull(self):
+        # loading in steps gives the same cases as loading the whole file
+        for count in (100, 200, 300):
+            self.load(count)
+        fullsav = self.path("full.sav")
+        self.runok(self.full, "--savfile", fullsav)
+        self.assertEqual(triples.savcases(self.savfile), triples.savcases(fullsav))
+        self.assertEqual(savvalues(self.savfile), savvalues(fullsav))
+
+    def test_rewritten(self):
+        self.load(200)
+        self.assertIn("rewritten", self.load(100))
+        self.assertEqual(triples.savcases(self.savfile), 100)
+
+    def test_options(self):
+        # the checkpoint needs a sav file and all the records
+        for options in (("--savfile", self.savfile, "--cases", "5"),
+                ("--savfile", self.savfile, "--profile", self.path("growing.json")),
+                ("--syntax", self.path("growing.sps"))):
+            with self.assertRaises(SystemExit):
+                self.runmain(self.metadatafile, "--checkpoint", self.checkpointfile, *options)
+
+if __name__ == "__main__":
+    unittest.main()
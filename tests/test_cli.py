@@ -0,0 +1,33 @@
+"""Tests of the command line entry point on the example studies"""
+
+import os, unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, EXAMPLE2, readsyntax
+
+class CommandLineTest(TriplesTestCase):
+
+    def test_syntax(self):
+        for metadatafile, command in ((EXAMPLE1, "DATA LIST FIXED"), (EXAMPLE2, "GET DATA")):
+            syntaxfile = self.path(os.path.basename(metadatafile) + ".sps")
+            self.runok(metadatafile, "--syntax", syntaxfile)
+            text = readsyntax(syntaxfile)
+            self.assertIn(command, text)
+            for var in triples.parsemetadata(metadatafile, False).variables:
+                self.assertIn(var.name, text)
+
+    def test_missingmetadata(self):
+        status, output = self.runmain(self.path("nosuchfile.sss"), "--syntax", self.path("x.sps"))
+        self.assertEqual(status, 1)
+        self.assertFalse(os.path.exists(self.path("x.sps")))
+
+    def test_nooutput(self):
+        # one of SYNTAX and SAVFILE is required
+        with self.assertRaises(SystemExit):
+            self.runmain(EXAMPLE1)
+
+    def test_helper(self):
+        # importing the module does not replace its help with the one from extension
+        self.assertEqual(triples.helper.__module__, triples.__name__)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+"""Tests of the COALESCE option"""
+
+import re, unittest
+
+from support import TriplesTestCase, EXAMPLE1, EXAMPLE2, readsyntax, normalizesyntax, expectedsyntax
+
+class CoalesceTest(TriplesTestCase):
+
+    def syntax(self, metadatafile, *options):
+        syntaxfile = self.path("coalesce.sps")
+        self.runok(metadatafile, "--syntax", syntaxfile, *options)
+        return normalizesyntax(readsyntax(syntaxfile))
+
+    def test_expected(self):
+        for metadatafile, expected in ((EXAMPLE1, "example1_coalesce.sps"),
+                (EXAMPLE2, "example2_coalesce.sps")):
+            self.assertEqual(self.syntax(metadatafile, "--coalesce"), expectedsyntax(expected))
+
+    def test_labels(self):
+        # the merged command sets the same labels as the separate ones
+        separate = re.findall(r'^VARIABLE LABELS (\S+) (".*")\.$', self.syntax(EXAMPLE1), re.M)
+        merged = re.search(r"^VARIABLE LABELS\n(.*?)\.\n", self.syntax(EXAMPLE1, "--coalesce"),
+            re.M | re.S).group(1)
+        self.assertTrue(separate)
+        self.assertEqual([tuple(item.split(" ", 1)) for item in merged.split("\n/")], separate)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Tests of the column store and the column cache"""
+
+import json, os, unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, DATA1
+
+class ExampleTestCase(TriplesTestCase):
+    """Test case with the decoded cases of example 1"""
+
+    def setUp(self):
+        super().setUp()
+        self.par = triples.parsemetadata(EXAMPLE1, False)
+        self.reader = triples.NativeReader(self.par, '""', "utf8", False)
+        self.cases = [case for batch in self.reader.batches(DATA1, 1000) for case in batch]
+
+class ColumnStoreTest(ExampleTestCase):
+
+    def write(self, batchsize):
+        directory = self.path("store")
+        os.mkdir(directory)
+        writer = triples.ColumnWriter(directory, self.reader.columns, self.par.variables,
+            self.reader.recordformat)
+        for start in range(0, len(self.cases), batchsize):
+            writer.append(self.cases[start:start + batchsize])
+        writer.close()
+        return directory
+
+    def test_roundtrip(self):
+        store = triples.ColumnStore(self.write(2))
+        self.assertEqual(store.ncases, len(self.cases))
+        self.assertEqual(store.columns, self.reader.columns)
+        batches = []
+        for batch in store.batches(2):
+            # the batch holds views of the column files until its cases are taken
+            self.assertTrue(all(isinstance(view, memoryview) for width, view in batch.columns))
+            batches.append(list(batch))
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual([case for batch in batches for case in batch], self.cases)
+
+    def test_selection(self):
+        store = triples.ColumnStore(self.write(10))
+        names = [self.reader.columns[i][0] for i in (3, 0)]
+        cases = [case for batch in store.batches(10, names=[name.upper() for name in names])
+            for case in batch]
+        self.assertEqual(cases, [[case[3], case[0]] for case in self.cases])
+
+    def test_released(self):
+        # a batch cannot be used once the next one is requested
+        store = triples.ColumnStore(self.write(10))
+        batches = store.batches(2)
+        first = next(batches)
+        next(batches)
+        self.assertRaises(ValueError, list, first)
+        batches.close()
+
+    def test_manifest(self):
+        directory = self.write(10)
+        with open(os.path.join(directory, "manifest.json"), encoding="utf_8") as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["version"], triples.ColumnCache.formatversion)
+        self.assertEqual(manifest["ncases"], len(self.cases))
+        self.assertEqual([(col["name"], col["width"]) for col in manifest["columns"]], self.reader.columns)
+        for col in manifest["columns"]:
+            self.assertTrue(os.path.exists(os.path.join(directory, col["file"])))
+        self.assertEqual([var["name"] for var in manifest["variables"]],
+            [var.name for var in self.par.variables])
+        columns = [col for var in manifest["variables"] for col in var["columns"]]
+        self.assertEqual(columns, [name for name, vartype in self.reader.columns])
+
+    def test_empty(self):
+        self.cases = []
+        store = triples.ColumnStore(self.write(10))
+        self.assertEqual(list(store.batches(10)), [])
+
+class ColumnCacheTest(ExampleTestCase):
+
+    def test_cache(self):
+        cache = triples.ColumnCache(self.path("cache"), 1024 * 1024)
+        cases = [case for batch in cache.batches(self.reader, self.par, EXAMPLE1, DATA1, 2)
+            for case in batch]
+        self.assertEqual(cases, self.cases)
+        key = cache.makekey(EXAMPLE1, DATA1, self.reader.encoding)
+        self.assertTrue(os.path.isdir(cache.entry(key)))
+        batches = list(cache.batches(self.reader, self.par, EXAMPLE1, DATA1, 2))
+        self.assertTrue(all(isinstance(batch, triples.ColumnBatch) for batch in batches))
+        cases = [case for batch in cache.batches(self.reader, self.par, EXAMPLE1, DATA1, 2)
+            for case in batch]
+        self.assertEqual(cases, self.cases)
+
+if __name__ == "__main__":
+    unittest.main()
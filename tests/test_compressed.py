@@ -0,0 +1,72 @@
+"""Tests that compressed and zipped input gives the same results as plain files"""
+
+import bz2, gzip, lzma, os, re, unittest, zipfile
+
+from support import triples, TriplesTestCase, EXAMPLE1, DATA1, readsyntax, normalizesyntax, savbody
+
+COMPRESSORS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+class CompressedInputTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with open(DATA1, "rb") as f:
+            self.data = f.read()
+        self.expected = self.run_example(EXAMPLE1)
+
+    def run_example(self, metadatafile, *options):
+        """Return the syntax with the input file names taken out, the data file it reads and the sav file"""
+
+        syntaxfile = self.path("example1.sps")
+        savfile = self.path("example1.sav")
+        self.runok(metadatafile, "--syntax", syntaxfile, "--savfile", savfile, "--dataencoding", "utf8",
+            *options)
+        syntax = readsyntax(syntaxfile)
+        datafile = re.search(r'/NAME ="(.*)"', syntax).group(1)
+        with open(datafile, "rb") as f:
+            data = f.read()
+        syntax = re.sub(r"(\* Metadata file: ).*", r"\1<metadata>.", normalizesyntax(syntax))
+        syntax = re.sub(r'/NAME =".*"', '/NAME ="<data>"', syntax)
+        return syntax, data, savbody(savfile)
+
+    def compress(self, example, ext):
+        """Write example compressed with ext and return its name"""
+
+        name = self.path(os.path.basename(example) + ext)
+        with open(example, "rb") as f, COMPRESSORS[ext](name, "wb") as out:
+            out.write(f.read())
+        return name
+
+    def test_expected(self):
+        syntax, data, sav = self.expected
+        self.assertEqual(data, self.data)
+        self.assertIn("ENCODING=utf8", syntax)
+
+    def test_compressed(self):
+        for ext in COMPRESSORS:
+            # a compressed metadata file finds the data compressed the same way
+            metadatafile = self.compress(EXAMPLE1, ext)
+            datafile = self.compress(DATA1, ext)
+            self.assertEqual(self.run_example(metadatafile), self.expected, ext)
+            self.assertEqual(self.run_example(EXAMPLE1, "--data", datafile),
+                self.expected, ext)
+
+    def test_zip(self):
+        archive = self.path("example1.zip")
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+            z.write(EXAMPLE1, "example1.sss")
+            z.write(DATA1, "example1.txt")
+        self.assertEqual(self.run_example(archive), self.expected)
+        self.assertEqual(self.run_example(archive + "/example1.sss"), self.expected)
+        self.assertEqual(self.run_example(EXAMPLE1, "--data", archive + "/example1.txt"), self.expected)
+
+    def test_invalid(self):
+        # a corrupt compressed file is reported without a traceback
+        with open(self.path("example1.txt.gz"), "wb") as f:
+            f.write(b"not compressed")
+        status, output = self.runmain(EXAMPLE1, "--syntax", self.path("example1.sps"),
+            "--data", self.path("example1.txt.gz"))
+        self.assertEqual(status, 1, output)
+
+if __name__ == "__main__":
+    unittest.main()
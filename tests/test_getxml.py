@@ -0,0 +1,58 @@
+"""Tests that the XML written for the metadata model parses back to the same model"""
+
+import os, unittest
+from xml.sax import saxutils
+
+from support import triples, TriplesTestCase, EXAMPLE1, EXAMPLE2, TESTS, model
+
+class GetXmlTest(TriplesTestCase):
+
+    def roundtrip(self, metadatafile):
+        """Write the parsed model of metadatafile as XML and return both models"""
+
+        par = triples.parsemetadata(metadatafile, False)
+        record = par.record
+        attrs = " ident=%s" % saxutils.quoteattr(record.ident)
+        for name in ("format", "skip", "href"):
+            if getattr(record, name) is not None:
+                attrs += " %s=%s" % (name, saxutils.quoteattr(getattr(record, name)))
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>'] + par.datafile.getXml()
+        lines.append("<record%s>" % attrs)
+        for var in par.variables:
+            lines.extend(var.getXml(record.format))
+        lines.extend(["</record>", "</survey>", "</sss>"])
+        written = self.path("written.sss")
+        with open(written, "w", encoding="utf_8") as f:
+            f.write("\n".join(lines))
+        reparsed = triples.parsemetadata(written, False)
+        return [model([p.datafile, p.record, p.variables]) for p in (par, reparsed)]
+
+    def check(self, metadatafile):
+        original, reparsed = self.roundtrip(metadatafile)
+        self.assertEqual(reparsed[0], original[0], metadatafile)
+        self.assertEqual(reparsed[1], original[1], metadatafile)
+        self.assertEqual(len(reparsed[2]), len(original[2]), metadatafile)
+        for var, expected in zip(reparsed[2], original[2]):
+            self.assertEqual(var, expected, metadatafile)
+
+    def test_examples(self):
+        for metadatafile in (EXAMPLE1, EXAMPLE2):
+            self.check(metadatafile)
+
+    def test_levels(self):
+        for name in ("household.sss", "person.sss"):
+            self.check(os.path.join(TESTS, "hierarchy", name))
+
+    def test_synthetic(self):
+        for recordformat in ("fixed", "csv"):
+            self.check(self.synthetic("study_" + recordformat, 10, recordformat))
+
+    def test_optional(self):
+        # elements and attributes the examples leave out are not written
+        variables = dict((var.name, var) for var in triples.parsemetadata(EXAMPLE1, False).variables)
+        self.assertIn('<position start="21"/>', "".join(variables["Q2"].getXml("fixed")))
+        self.assertIn('<spread subfields="2"/>', "".join(variables["Q5"].getXml("fixed")))
+        self.assertIn("<filter>Q7</filter>", "".join(variables["Q8"].getXml("fixed")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Tests of hierarchy files using the two level survey in the hierarchy directory"""
+
+import os, unittest
+
+from support import triples, TriplesTestCase, TESTS
+
+SURVEY = os.path.join(TESTS, "hierarchy", "survey.sss")
+
+class HierarchyTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.hier = triples.parsemetadata(SURVEY, False).hierarchy
+
+    def join(self, levels):
+        pars = [triples.parsemetadata(level.metadatafile, False) for level in levels]
+        return triples.HierarchyJoin(levels, pars, '""', "utf8", False)
+
+    def test_parse(self):
+        self.assertEqual([(level.ident, level.href) for level in self.hier.levels],
+            [("HHOLD", "household.sss"), ("PERSON", "person.sss")])
+        self.assertEqual(self.hier.levels[0].parents, [])
+        parent = self.hier.levels[1].parents[0]
+        self.assertEqual((parent.parlev, parent.linkvar, parent.ordered), ("HHOLD", "HHID", True))
+
+    def test_chain(self):
+        self.hier.levels.reverse()
+        levels = self.hier.chain(SURVEY)
+        self.assertEqual([level.ident for level in levels], ["HHOLD", "PERSON"])
+        self.assertEqual(levels[1].metadatafile, os.path.join(TESTS, "hierarchy", "person.sss"))
+
+    def test_badchains(self):
+        self.hier.levels[0].parents.append(triples.Parent("PERSON", "HHID", True))
+        self.assertRaises(ValueError, self.hier.ordered, SURVEY)
+        self.hier.levels[0].parents[0] = triples.Parent("NOSUCHLEVEL", "HHID", True)
+        self.assertRaises(ValueError, self.hier.ordered, SURVEY)
+        # two children cannot be flattened
+        del self.hier.levels[0].parents[:]
+        child = triples.Level("CAR", "person.sss")
+        child.parents.append(triples.Parent("HHOLD", "HHID", True))
+        self.hier.levels.append(child)
+        self.assertEqual(len(self.hier.ordered(SURVEY)), 3)
+        self.assertRaises(ValueError, self.hier.chain, SURVEY)
+
+    def test_join(self):
+        join = self.join(self.hier.chain(SURVEY))
+        # the lowest level comes first and the link variable is not repeated
+        self.assertEqual([name for name, vartype in join.columns], ["HHID", "PERSON", "AGE", "REGION"])
+        self.assertEqual(list(join.cases()), [[1, 1, 45, 1], [1, 2, 43, 1], [2, 1, 30, 2],
+            [3, 1, 71, 1], [3, 2, 68, 1], [3, 3, 12, 1]])
+        self.assertEqual([len(batch) for batch in join.batches(4)], [4, 2])
+
+    def test_unordered(self):
+        levels = self.hier.chain(SURVEY)
+        datafile = self.path("person.txt")
+        with open(os.path.join(TESTS, "hierarchy", "person.txt"), "rb") as f:
+            lines = f.readlines()
+        with open(datafile, "wb") as f:
+            f.writelines(lines[2:] + lines[:2])
+        join = self.join(levels)
+        join.datafiles[0] = datafile
+        with self.assertRaises(ValueError):
+            list(join.cases())
+
+    def test_flattensyntax(self):
+        self.assertEqual(list(triples.flattensyntax(self.hier.chain(SURVEY))),
+            [["DATASET ACTIVATE HHOLD.", "SORT CASES BY HHID.", "DATASET ACTIVATE PERSON.",
+            "SORT CASES BY HHID.", "MATCH FILES /FILE=* /TABLE=HHOLD /BY HHID.",
+            "DATASET NAME PERSON_flat."]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+"""Tests of MREXPAND=LOOP for csv multiple response sets"""
+
+import re, unittest
+
+from support import TriplesTestCase, EXAMPLE2, readsyntax, normalizesyntax, expectedsyntax
+
+class LoopExpansionTest(TriplesTestCase):
+
+    def syntax(self, mrexpand):
+        syntaxfile = self.path(mrexpand + ".sps")
+        self.runok(EXAMPLE2, "--syntax", syntaxfile, "--mrexpand", mrexpand)
+        return normalizesyntax(readsyntax(syntaxfile))
+
+    def test_expected(self):
+        self.assertEqual(self.syntax("loop"), expectedsyntax("example2_loop.sps"))
+
+    def test_members(self):
+        # each loop pass takes the same substring as the IF command for that member
+        members = re.findall(r"IF \(CHAR.LENGTH\(CHAR.SUBSTR\((\w+), (\d+), (\d+)\)\) > 0\) (\w+) =",
+            self.syntax("if"))
+        self.assertTrue(members)
+        expanded = []
+        for count, setname, start, width in re.findall(
+                r"VECTOR \w+\((\d+), F\d+\.0\)\.\nLOOP #i = 1 TO \d+\.\n"
+                r"IF \(CHAR.LENGTH\(CHAR.SUBSTR\((\w+), ([^,]+), (\d+)\)\) > 0\)", self.syntax("loop")):
+            for i in range(1, int(count) + 1):
+                expanded.append((setname, str(eval(start.replace("#i", str(i)))), width,
+                    "%s_%d" % (setname, i)))
+        self.assertEqual(expanded, members)
+
+if __name__ == "__main__":
+    unittest.main()
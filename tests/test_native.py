@@ -0,0 +1,61 @@
+"""Tests of the native loader, its filters and the missing value codes"""
+
+import unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, DATA1, readsyntax
+
+INDEX = {"q7": (0, False), "q2": (1, False), "q8": (2, True)}
+CASES = [[1, 1, "A"], [0, 2, "B"], [None, None, ""], [1, None, "A"]]
+
+class FilterTest(unittest.TestCase):
+
+    def test_compilefilter(self):
+        for expr, expected in (("Q7", [True, False, None, True]),
+                ('Q2 = 1 and Q8 = "A"', [True, False, False, None]),
+                ("not Q2 > 1", [True, False, None, None]),
+                ("Q2 = 1 or Q7", [True, False, None, True]),
+                ("Q2 ~= 1", [False, True, None, None])):
+            test = triples.compilefilter(expr, INDEX)
+            self.assertIsNotNone(test, expr)
+            self.assertEqual([test(case) for case in CASES], expected, expr)
+
+    def test_uncompiled(self):
+        # these are left to syntax
+        for expr in ("Q2 = 1 &", "Q9 = 1"):
+            self.assertIsNone(triples.compilefilter(expr, INDEX), expr)
+
+class MissingValuesTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.variables = {var.name: var for var in triples.parsemetadata(EXAMPLE1, False).variables}
+
+    def test_numericcode(self):
+        # the code after the largest one stays an integer
+        q2 = self.variables["Q2"]
+        q2.filter = "Q7"
+        self.assertEqual(q2.getMissing('""', transform=False), ["MISSING VALUES Q2 (21)."])
+        self.assertEqual(q2.getMissing('""'), ["IF (NOT Q7) Q2 = 21.\nMISSING VALUES Q2 (21)."])
+
+    def test_literalcode(self):
+        self.assertEqual(self.variables["Q8"].makemvcode('""'), '"D"')
+        syntaxfile = self.path("example1.sps")
+        self.runok(EXAMPLE1, "--syntax", syntaxfile)
+        self.assertIn('MISSING VALUES Q8 ("D").',readsyntax(syntaxfile))
+
+    def test_nativereader(self):
+        # Q8 is filtered by Q7 in the example
+        par = triples.parsemetadata(EXAMPLE1, False)
+        reader = triples.NativeReader(par, '""', "utf8", False)
+        names = [name.lower() for name, vartype in reader.columns]
+        q7, q8 = names.index("q7"), names.index("q8")
+        cases = list(reader.cases(DATA1))
+        self.assertTrue(any(case[q7] == 0 for case in cases))
+        for case in cases:
+            if case[q7] == 0:
+                self.assertEqual(case[q8], "D")
+            else:
+                self.assertNotEqual(case[q8], "D")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Tests of the persistent parse cache"""
+
+import os, shutil, time, unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1
+
+class ParseCacheTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.metadatafile = self.path("example1.sss")
+        shutil.copy(EXAMPLE1, self.metadatafile)
+        self.cache = triples.ParseCache(self.path("cache"))
+
+    def test_hit(self):
+        key = self.cache.makekey(self.metadatafile, False, None)
+        par = triples.parsemetadata(self.metadatafile, False, cache=self.cache)
+        self.assertTrue(os.path.exists(self.cache.entry(key)))
+        cached = triples.parsemetadata(self.metadatafile, False, cache=self.cache)
+        self.assertEqual([var.name for var in cached.variables], [var.name for var in par.variables])
+        # a hit returns what is stored without parsing the file
+        self.cache.put(key, (par.datafile, par.record, par.variables[:2], par.hierarchy))
+        cached = triples.parsemetadata(self.metadatafile, False, cache=self.cache)
+        self.assertEqual(len(cached.variables), 2)
+
+    def test_options(self):
+        key = self.cache.makekey(self.metadatafile, False, None)
+        self.assertNotEqual(self.cache.makekey(self.metadatafile, True, None), key)
+        self.assertNotEqual(self.cache.makekey(self.metadatafile, False, "en"), key)
+
+    def test_changedmetadata(self):
+        key = self.cache.makekey(self.metadatafile, False, None)
+        triples.parsemetadata(self.metadatafile, False, cache=self.cache)
+        with open(self.metadatafile, encoding="utf_8") as f:
+            text = f.read()
+        self.assertIn("Respondent ID", text)
+        with open(self.metadatafile, "w", encoding="utf_8") as f:
+            f.write(text.replace("Respondent ID", "Respondent Number"))
+        self.assertNotEqual(self.cache.makekey(self.metadatafile, False, None), key)
+        par = triples.parsemetadata(self.metadatafile, False, cache=self.cache)
+        self.assertEqual(par.variables[0].label, "Respondent Number")
+
+    def test_samesizechange(self):
+        # the content hash catches an edit that keeps the size and modification time
+        st = os.stat(self.metadatafile)
+        key = self.cache.makekey(self.metadatafile, False, None)
+        with open(self.metadatafile, "rb") as f:
+            data = f.read()
+        with open(self.metadatafile, "wb") as f:
+            f.write(data.replace(b"Respondent ID", b"Respondent Id"))
+        os.utime(self.metadatafile, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertNotEqual(self.cache.makekey(self.metadatafile, False, None), key)
+
+class EvictionTest(TriplesTestCase):
+
+    def fill(self, cache, keys):
+        """Add an entry of 100 bytes for each key, each used a minute after the one before"""
+
+        start = time.time() - 3600
+        for i, key in enumerate(keys):
+            with open(cache.entry(key), "wb") as f:
+                f.write(b"x" * 100)
+            os.utime(cache.entry(key), (start + i * 60, start + i * 60))
+
+    def cached(self, cache):
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(cache.cachedir))
+
+    def test_leastrecentlyused(self):
+        cache = triples.ParseCache(self.path("cache"), maxbytes=250)
+        self.fill(cache, ["a", "b", "c"])
+        cache.touch("a")
+        cache.evict()
+        self.assertEqual(self.cached(cache), ["a", "c"])
+        self.assertIsNone(cache.get("b"))
+
+    def test_age(self):
+        cache = triples.DiskCache(self.path("cache"), maxbytes=10000, maxage=30 * 60)
+        self.fill(cache, ["a", "b", "c"])
+        cache.touch("a")
+        cache.evict()
+        self.assertEqual(self.cached(cache), ["a"])
+
+    def test_put(self):
+        # adding an entry evicts the least recently used ones beyond the limit
+        cache = triples.ParseCache(self.path("cache"), maxbytes=300)
+        self.fill(cache, ["a", "b"])
+        cache.put("c", "x" * 150)
+        self.assertEqual(self.cached(cache), ["b", "c"])
+        self.assertEqual(cache.get("c"), "x" * 150)
+
+if __name__ == "__main__":
+    unittest.main()
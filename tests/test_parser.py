@@ -0,0 +1,38 @@
+"""Tests that the SAX and expat metadata parsers produce the same model"""
+
+import os, unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, EXAMPLE2, TESTS, readsyntax, normalizesyntax, model
+
+EXAMPLES = [EXAMPLE1, EXAMPLE2] + [os.path.join(TESTS, "hierarchy", name)
+    for name in ("survey.sss", "household.sss", "person.sss")]
+
+class ParserTest(TriplesTestCase):
+
+    def test_model(self):
+        for metadatafile in EXAMPLES:
+            for removehtml in (False, True):
+                models = []
+                for parser in ("sax", "expat"):
+                    par = triples.parsemetadata(metadatafile, removehtml, parser=parser)
+                    models.append(model([getattr(par, name, None)
+                        for name in ("datafile", "record", "variables", "hierarchy")]))
+                self.assertEqual(models[0], models[1], metadatafile)
+
+    def test_syntax(self):
+        for metadatafile in (EXAMPLE1, EXAMPLE2):
+            syntax = []
+            for parser in ("sax", "expat"):
+                syntaxfile = self.path(parser + ".sps")
+                self.runok(metadatafile, "--syntax", syntaxfile, "--parser", parser)
+                syntax.append(normalizesyntax(readsyntax(syntaxfile)))
+            self.assertEqual(syntax[0], syntax[1], metadatafile)
+
+    def test_invalid(self):
+        metadatafile = self.path("bad.sss")
+        with open(metadatafile, "w", encoding="utf_8") as f:
+            f.write("<sss><survey>")
+        self.assertRaises(ValueError, triples.parsemetadata, metadatafile, False, parser="expat")
+
+if __name__ == "__main__":
+    unittest.main()
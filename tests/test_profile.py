@@ -0,0 +1,82 @@
+"""Tests of the profile computed as the data are read"""
+
+import collections, json, unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1
+
+class ProfileTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metadatafile = self.synthetic("profile", 500)
+        self.datafile = triples.defaultdatafile(metadatafile)
+        self.par = triples.parsemetadata(metadatafile, False)
+        self.reader = triples.NativeReader(self.par, '""', "utf8", False)
+        self.cases = list(self.reader.cases(self.datafile))
+
+    def profile(self, batchsize=triples.NATIVEBATCHSIZE, maxvalues=triples.PROFILEMAXVALUES):
+        profile = triples.Profile(self.par, self.reader, maxvalues)
+        profile.run(self.reader, self.datafile, batchsize)
+        self.assertTrue(profile.complete)
+        return profile.todict("profile.sss", self.datafile)
+
+    def test_counts(self):
+        # the profile agrees with counts made from all the cases
+        profile = self.profile()
+        self.assertEqual(profile["cases"], 500)
+        columns = list(zip(*self.cases))
+        offset = 0
+        kinds = set()
+        for var in self.par.variables:
+            ncols = len(var.getNativeVars(self.reader.recordformat))
+            entry = profile["variables"].get(var.name)
+            values = columns[offset:offset + ncols]
+            offset += ncols
+            if var.multtype == "MD":
+                self.assertEqual([item["count"] for item in entry["responses"]],
+                    [column.count(1.) for column in values])
+                self.assertEqual(entry["responding"], sum(1 for case in zip(*values) if 1. in case))
+            elif var.multtype == "MC":
+                counts = collections.Counter(v for column in values for v in column if v is not None)
+                self.assertEqual(sum(item["count"] for item in entry["responses"]) + entry["other"],
+                    sum(counts.values()))
+            elif var.type in ["single", "logical"]:
+                counts = collections.Counter(values[0])
+                self.assertEqual(entry["missing"], counts.pop(None, 0))
+                self.assertEqual(sum(item["count"] for item in entry["frequencies"]) + entry["other"],
+                    sum(counts.values()))
+            elif var.type == "quantity":
+                present = [v for v in values[0] if v is not None]
+                self.assertEqual((entry["n"], entry["missing"]), (len(present), 500 - len(present)))
+                self.assertEqual((entry["minimum"], entry["maximum"]), (min(present), max(present)))
+                self.assertAlmostEqual(entry["mean"], sum(present) / len(present))
+            else:
+                continue
+            kinds.add(var.multtype or var.type)
+        self.assertGreaterEqual(kinds, {"MD", "MC", "single", "quantity"})
+
+    def test_batches(self):
+        # the batch size does not change the result
+        self.assertEqual(self.profile(7), self.profile())
+
+    def test_maxvalues(self):
+        profile = self.profile(maxvalues=2)
+        for entry in profile["variables"].values():
+            if "frequencies" in entry:
+                self.assertLessEqual(len(entry["frequencies"]), 2)
+                full = sum(item["count"] for item in entry["frequencies"]) + entry["other"] + entry["missing"]
+                self.assertEqual(full, 500)
+
+    def test_example(self):
+        profilefile = self.path("example1.json")
+        self.runok(EXAMPLE1, "--savfile", self.path("profile.sav"), "--profile", profilefile)
+        with open(profilefile, encoding="utf_8") as f:
+            profile = json.load(f)
+        self.assertEqual(profile["cases"], 3)
+        q2 = profile["variables"]["Q2"]
+        self.assertEqual(sum(freq["count"] for freq in q2["frequencies"]) + q2["missing"] + q2["other"], 3)
+        # Q8 is filtered by Q7, which is 0 in one case
+        self.assertEqual(profile["filters"]["Q8"]["missing"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
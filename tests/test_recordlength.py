@@ -0,0 +1,51 @@
+"""Tests of MAXDATALENGTH=AUTO record length measurement"""
+
+import contextlib, io, unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, DATA1
+
+class RecordLengthTest(TriplesTestCase):
+
+    def lengths(self, data, limit=None):
+        datafile = self.path("data.txt")
+        with open(datafile, "wb") as f:
+            f.write(data)
+        return triples.recordlengths(datafile, limit)
+
+    def test_lf(self):
+        self.assertEqual(self.lengths(b"abc\nabcdef\nab\n"), (6, 3, 0))
+        self.assertEqual(self.lengths(b"abc\nabcdef\nab\n", 4), (6, 3, 1))
+
+    def test_crlf(self):
+        # the carriage return is part of the line end
+        self.assertEqual(self.lengths(b"abc\r\nabcdef\r\nab\r\n", 5), (6, 3, 1))
+        self.assertEqual(self.lengths(b"abcdef\r\n\r\nab\r\n", 6), (6, 3, 0))
+
+    def test_nofinalnewline(self):
+        self.assertEqual(self.lengths(b"abc\nabcdefg"), (7, 2, 0))
+        self.assertEqual(self.lengths(b"abc\r\nabcdefg", 6), (7, 2, 1))
+        self.assertEqual(self.lengths(b"abcdefgh"), (8, 1, 0))
+
+    def test_blanklines(self):
+        self.assertEqual(self.lengths(b"a\n\nabc\n\n"), (3, 4, 0))
+
+    def test_empty(self):
+        self.assertEqual(self.lengths(b""), (0, 0, 0))
+
+    def test_autorecordlength(self):
+        par = triples.parsemetadata(EXAMPLE1, False)
+        limit = max(var.getFinish() for var in par.variables)
+        with open(DATA1, "rb") as f:
+            lines = f.read().splitlines(True)
+        self.assertEqual(triples.autorecordlength(par, DATA1), limit)
+        datafile = self.path("long.txt")
+        with open(datafile, "wb") as f:
+            f.writelines(lines[:1] + [lines[1].rstrip(b"\r\n") + b"x" * 10 + b"\r\n"] + lines[2:])
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            length = triples.autorecordlength(par, datafile)
+        self.assertEqual(length, max(limit, len(lines[1].rstrip(b"\r\n")) + 10))
+        self.assertIn("1 of 3 records", out.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
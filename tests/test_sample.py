@@ -0,0 +1,74 @@
+"""Tests of case limits and random samples taken as the data are read"""
+
+import unittest
+
+from support import triples, TriplesTestCase, savbody
+
+class CaseSelectionTest(unittest.TestCase):
+
+    def select(self, n, **kwds):
+        return list(triples.CaseSelection(**kwds).records(iter(range(n))))
+
+    def test_cases(self):
+        self.assertEqual(self.select(100, cases=5), [0, 1, 2, 3, 4])
+        self.assertEqual(self.select(3, cases=5), [0, 1, 2])
+
+    def test_reservoir(self):
+        chosen = self.select(1000, sample=10, seed=1)
+        self.assertEqual(len(set(chosen)), 10)
+        self.assertEqual(chosen, sorted(chosen))
+        self.assertEqual(self.select(1000, sample=10, seed=1), chosen)
+        self.assertNotEqual(self.select(1000, sample=10, seed=2), chosen)
+        self.assertEqual(self.select(5, sample=10), [0, 1, 2, 3, 4])
+        # a sample of the first records
+        self.assertTrue(all(i < 50 for i in self.select(1000, cases=50, sample=10)))
+
+    def test_uniform(self):
+        # each of 20 records is chosen for a sample of 5 about a quarter of the time
+        counts = [0] * 20
+        for seed in range(400):
+            for i in self.select(20, sample=5, seed=seed):
+                counts[i] += 1
+        self.assertTrue(all(60 <= count <= 140 for count in counts), counts)
+
+    def test_bernoulli(self):
+        chosen = self.select(10000, sample=0.25, seed=3)
+        self.assertTrue(2250 <= len(chosen) <= 2750, len(chosen))
+        self.assertEqual(chosen, sorted(set(chosen)))
+        self.assertEqual(self.select(10000, sample=0.25, seed=3), chosen)
+
+    def test_invalid(self):
+        for kwds in ({"cases": 0}, {"sample": 0}, {"sample": -0.5}, {"sample": 1.5}):
+            self.assertRaises(ValueError, triples.CaseSelection, **kwds)
+
+class SampleTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.metadatafile = self.synthetic("sample", 400)
+        self.savfile = self.path("sample.sav")
+
+    def cases(self, *options):
+        self.runok(self.metadatafile, "--savfile", self.savfile, *options)
+        return triples.savcases(self.savfile)
+
+    def test_cases(self):
+        self.assertEqual(self.cases("--cases", 25), 25)
+
+    def test_number(self):
+        self.assertEqual(self.cases("--sample", 40, "--seed", 7), 40)
+        first = savbody(self.savfile)
+        self.cases("--sample", 40, "--seed", 7)
+        self.assertEqual(savbody(self.savfile), first)
+        self.cases("--sample", 40, "--seed", 8)
+        self.assertNotEqual(savbody(self.savfile), first)
+
+    def test_fraction(self):
+        self.assertTrue(0 < self.cases("--sample", 0.5, "--seed", 7) < 400)
+
+    def test_csv(self):
+        self.metadatafile = self.synthetic("sample_csv", 400, "csv")
+        self.assertEqual(self.cases("--cases", 10, "--sample", 5), 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""Tests of the sav file written without Statistics"""
+
+import unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, EXAMPLE2, savbody
+
+class SavFileTest(TriplesTestCase):
+
+    def test_example(self):
+        savfile = self.path("example1.sav")
+        self.runok(EXAMPLE1, "--savfile", savfile)
+        with open(savfile, "rb") as f:
+            self.assertIn(f.read(4), (b"$FL2", b"$FL3"))
+        self.assertEqual(triples.savcases(savfile), 3)
+        self.runok(EXAMPLE2, "--savfile", savfile)
+        self.assertGreater(triples.savcases(savfile), 0)
+
+    def test_rerun(self):
+        # only the creation date and time differ when the file is written again
+        savfile = self.path("example1.sav")
+        self.runok(EXAMPLE1, "--savfile", savfile)
+        first = savbody(savfile)
+        self.runok(EXAMPLE1, "--savfile", savfile)
+        self.assertEqual(savbody(savfile), first)
+
+    def test_synthetic(self):
+        for recordformat in ("fixed", "csv"):
+            metadatafile = self.synthetic("savfile_" + recordformat, 500, recordformat)
+            savfile = self.path("savfile_%s.sav" % recordformat)
+            self.runok(metadatafile, "--savfile", savfile)
+            self.assertEqual(triples.savcases(savfile), 500, recordformat)
+
+    def test_nosyntax(self):
+        # the sav file is written without a syntax file or Statistics
+        savfile = self.path("example1.sav")
+        output = self.runok(EXAMPLE1, "--savfile", savfile)
+        self.assertIn(savfile, output)
+        self.assertNotIn("Syntax file created", output)
+
+if __name__ == "__main__":
+    unittest.main()
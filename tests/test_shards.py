@@ -0,0 +1,64 @@
+"""Tests of decoding large data files in parallel shards"""
+
+import concurrent.futures, functools, multiprocessing, unittest
+from unittest import mock
+
+from support import triples, TriplesTestCase, savbody
+
+class ShardTest(TriplesTestCase):
+
+    def reader(self, recordformat):
+        metadatafile = self.synthetic("shards_" + recordformat, 400, recordformat)
+        par = triples.parsemetadata(metadatafile, False)
+        return triples.NativeReader(par, '""', "utf8", False), triples.defaultdatafile(metadatafile)
+
+    def test_boundaries(self):
+        for recordformat in ("fixed", "csv"):
+            reader, datafile = self.reader(recordformat)
+            shards = reader.shards(datafile, 4096)
+            self.assertGreater(len(shards), 2, recordformat)
+            with open(datafile, "rb") as f:
+                data = f.read()
+            self.assertEqual(shards[0][0], 0)
+            self.assertEqual(shards[-1][1], len(data))
+            for (start, end), (nextstart, nextend) in zip(shards, shards[1:]):
+                self.assertEqual(end, nextstart)
+                self.assertEqual(data[end - 1:end], b"\n")
+            # the shards together hold every record once
+            cases = [case for start, end in shards for case in reader.rangecases(datafile, start, end)]
+            self.assertEqual(cases, list(reader.cases(datafile)), recordformat)
+
+    def parallel(self, context):
+        """Return the cases decoded by two worker processes started by context"""
+
+        reader, datafile = self.reader("fixed")
+        shards = reader.shards(datafile, 4096)
+        pool = functools.partial(concurrent.futures.ProcessPoolExecutor,
+            mp_context=multiprocessing.get_context(context))
+        # the file is not decoded here unless the processes cannot be started
+        with mock.patch.object(concurrent.futures, "ProcessPoolExecutor", pool), \
+                mock.patch.object(reader, "cases", side_effect=AssertionError("decoded in this process")):
+            batches = list(reader.parallelbatches(datafile, 50, 2, shards))
+        self.assertTrue(all(len(batch) <= 50 for batch in batches))
+        self.assertEqual([case for batch in batches for case in batch], list(reader.cases(datafile)))
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "fork is not available")
+    def test_fork(self):
+        self.parallel("fork")
+
+    def test_spawn(self):
+        # a spawned worker only imports the module, so it must set up what it needs itself
+        self.parallel("spawn")
+
+    def test_workers(self):
+        metadatafile = self.synthetic("workers", 500)
+        savfile = self.path("workers.sav")
+        bodies = []
+        for workers in ("1", "2"):
+            self.runok(metadatafile, "--savfile", savfile, "--workers", workers)
+            self.assertEqual(triples.savcases(savfile), 500)
+            bodies.append(savbody(savfile))
+        self.assertEqual(bodies[0], bodies[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Tests of syntax submission and the dataset cache with a stand-in for Statistics"""
+
+import os, re, unittest
+from unittest import mock
+
+from support import triples, TriplesTestCase, EXAMPLE1, DATA1, readsyntax
+
+class Submitter(object):
+    """Record the syntax submitted in place of the spss module"""
+
+    def __init__(self):
+        self.batches = []
+
+    def Submit(self, cmds):
+        if isinstance(cmds, str):
+            cmds = [cmds]
+        self.batches.append(list(cmds))
+        # SAVE writes the file it names
+        for cmd in cmds:
+            m = re.match(r'SAVE OUTFILE="(.*)"', cmd)
+            if m:
+                with open(m.group(1), "wb") as f:
+                    f.write(b"$FL2")
+
+class ProcessSyntaxTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.syntaxfile = self.path("example1.sps")
+        par = triples.parsemetadata(EXAMPLE1, False)
+        self.blocks = list(triples.gensyntax(par, EXAMPLE1, None, self.syntaxfile, '""', "utf8", 50000,
+            True, {0: "'0'", 1: "'1'"}, False, spssver="spss250", unicodemode=True))
+        self.submitter = Submitter()
+        patcher = mock.patch.object(triples, "spss", self.submitter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process(self, batchsize):
+        triples.processsyntax(iter(self.blocks), self.syntaxfile, execute=True, batchsize=batchsize,
+            unicodemode=True)
+        return self.submitter.batches
+
+    def test_commandboundaries(self):
+        batches = self.process(20)
+        self.assertGreater(len(batches), 2)
+        ends = set()
+        total = 0
+        for block in self.blocks:
+            total += len(block)
+            ends.add(total)
+        total = 0
+        for batch in batches[:-1]:
+            self.assertGreaterEqual(len(batch), 20)
+            total += len(batch)
+            # a batch ends where a command ends
+            self.assertIn(total, ends)
+
+    def test_sameoutput(self):
+        lines = [line for block in self.blocks for line in block]
+        for batchsize in (1, 20, triples.SUBMITBATCHSIZE):
+            del self.submitter.batches[:]
+            batches = self.process(batchsize)
+            self.assertEqual([line for batch in batches for line in batch], lines)
+            self.assertEqual(readsyntax(self.syntaxfile), "".join(line + "\n" for line in lines))
+        self.assertEqual(len(batches), 1)
+
+class DatasetCacheTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = triples.DatasetCache(self.path("cache"), 1024 * 1024)
+        self.datafile = self.path("example1.txt")
+        with open(DATA1, "rb") as f:
+            self.data = f.read()
+        with open(self.datafile, "wb") as f:
+            f.write(self.data)
+
+    def test_key(self):
+        key = self.cache.makekey(EXAMPLE1, self.datafile, ("utf8", True))
+        self.assertEqual(self.cache.makekey(EXAMPLE1, self.datafile, ("utf8", True)), key)
+        self.assertNotEqual(self.cache.makekey(EXAMPLE1, self.datafile, ("locale", True)), key)
+        with open(self.datafile, "ab") as f:
+            f.write(self.data.splitlines(True)[-1])
+        self.assertNotEqual(self.cache.makekey(EXAMPLE1, self.datafile, ("utf8", True)), key)
+
+    def test_saveandopen(self):
+        key = self.cache.makekey(EXAMPLE1, self.datafile, ())
+        self.assertIsNone(self.cache.get(key))
+        submitter = Submitter()
+        with mock.patch.object(triples, "spss", submitter):
+            self.cache.save(key)
+            entry = self.cache.get(key)
+            self.assertEqual(entry, self.cache.entry(key))
+            self.cache.open(entry)
+        self.assertEqual(submitter.batches[-1], ['GET FILE="%s".' % entry])
+        self.assertEqual(os.listdir(self.cache.cachedir), [os.path.basename(entry)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Tests of the TIMING phases and report"""
+
+import gzip, time, unittest
+from unittest import mock
+
+from support import triples, TriplesTestCase, EXAMPLE1, DATA1
+
+class Table(object):
+    """Record the pivot table in place of spss.BasePivotTable"""
+
+    tables = []
+
+    def __init__(self, title, omsid):
+        self.title = title
+        Table.tables.append(self)
+
+    def SimplePivotTable(self, **kwds):
+        self.kwds = kwds
+
+class TimingTest(TriplesTestCase):
+
+    def run_syntax(self, metadatafile, dataencoding, data=None):
+        timer = triples.PhaseTimer()
+        self.addCleanup(timer.stop)
+        syntaxfile = self.path("timing.sps")
+        triples.processsyntax(triples.gensyntax(triples.parsemetadata(metadatafile, False),
+            metadatafile, data, syntaxfile, '""', dataencoding, "auto", True, {0: "'0'", 1: "'1'"},
+            False, spssver="spss250", unicodemode=True, timer=timer), syntaxfile, unicodemode=True,
+            timer=timer)
+        return timer
+
+    def test_nested(self):
+        timer = triples.PhaseTimer()
+        self.addCleanup(timer.stop)
+        with timer.phase("outer"):
+            with timer.phase("inner"):
+                time.sleep(0.1)
+        self.assertEqual(timer.order, ["outer", "inner"])
+        self.assertGreaterEqual(timer.phases["inner"][0], 0.1)
+        self.assertLess(timer.phases["outer"][0], 0.05)
+
+    def test_extract(self):
+        with open(DATA1, "rb") as f, gzip.open(self.path("example1.txt.gz"), "wb") as out:
+            out.write(f.read())
+        timer = self.run_syntax(EXAMPLE1, "utf8", self.path("example1.txt.gz"))
+        # the data file is prepared when the first syntax is generated
+        self.assertEqual(timer.order, ["Generate syntax", "Extract data file", "Measure record length",
+            "Write syntax file"])
+
+    def test_convert(self):
+        metadatafile = self.copyexample(EXAMPLE1, "latin")
+        with open(self.path("latin.txt"), "rb") as f:
+            data = f.read()
+        with open(self.path("latin.txt"), "wb") as f:
+            f.write(data.replace(b"Nottingham Goose Fair", b"Nottingham F\xeate  Fair"))
+        timer = self.run_syntax(metadatafile, "auto")
+        self.assertEqual(timer.order, ["Generate syntax", "Detect data encoding", "Convert data encoding",
+            "Measure record length", "Write syntax file"])
+
+    def test_display(self):
+        timer = self.run_syntax(EXAMPLE1, "utf8")
+        del Table.tables[:]
+        spss = mock.MagicMock(BasePivotTable=Table)
+        with mock.patch.object(triples, "spss", spss):
+            timer.display()
+        self.assertEqual(len(Table.tables), 1)
+        kwds = Table.tables[0].kwds
+        self.assertEqual(kwds["rowlabels"], ["Generate syntax", "Measure record length", "Write syntax file"])
+        self.assertEqual(len(kwds["cells"]), len(kwds["rowlabels"]) * len(kwds["collabels"]))
+        spss.EndProcedure.assert_called_once_with()
+
+    def test_disabled(self):
+        timer = triples.PhaseTimer(False)
+        with timer.phase("phase"):
+            timer.count("phase", "Cases")
+        self.assertEqual(timer.order, [])
+        spss = mock.MagicMock()
+        with mock.patch.object(triples, "spss", spss):
+            timer.display()
+        self.assertFalse(spss.method_calls)
+
+if __name__ == "__main__":
+    unittest.main()
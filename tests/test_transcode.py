@@ -0,0 +1,84 @@
+"""Tests of detecting the data encoding and converting the data for syntax"""
+
+import io, re, unittest
+from unittest import mock
+
+from support import triples, TriplesTestCase, EXAMPLE1, EXAMPLE2, DATA1, DATA2, readsyntax
+
+FETE = "Nottingham F\xeate  Fair"
+
+class TranscodeTest(TriplesTestCase):
+
+    def latin(self, example, data):
+        """Copy an example with a Latin-1 character in its data and return the metadata file name"""
+
+        metadatafile = self.copyexample(example, "latin")
+        with open(data, "rb") as f:
+            text = f.read()
+        self.assertIn(b"Nottingham Goose Fair", text)
+        with open(self.path("latin.txt"), "wb") as f:
+            f.write(text.replace(b"Nottingham Goose Fair", FETE.encode("latin_1")))
+        return metadatafile
+
+    def test_detect(self):
+        self.assertEqual(triples.detectencoding(DATA1, EXAMPLE1), "utf_8")
+        metadatafile = self.latin(EXAMPLE1, DATA1)
+        # the example declares ISO-8859-1
+        self.assertEqual(triples.detectencoding(self.path("latin.txt"), metadatafile), "iso8859-1")
+        with open(metadatafile, "rb") as f:
+            text = f.read()
+        with open(metadatafile, "wb") as f:
+            f.write(re.sub(rb"<\?xml.*?\?>", b"", text))
+        self.assertEqual(triples.detectencoding(self.path("latin.txt"), metadatafile), "cp1252")
+
+    def test_sampleboundary(self):
+        # a character cut off by the end of the sample does not make UTF-8 data invalid
+        datafile = self.path("utf8.txt")
+        with open(datafile, "wb") as f:
+            f.write(FETE.encode("utf_8"))
+        with mock.patch.object(triples, "ENCODINGSAMPLESIZE", FETE.index("\xea") + 1):
+            self.assertEqual(triples.detectencoding(datafile, EXAMPLE1), "utf_8")
+
+    def test_fixed(self):
+        # the converted file decodes with the new positions to the same cases
+        metadatafile = self.latin(EXAMPLE1, DATA1)
+        par = triples.parsemetadata(metadatafile, False)
+        transcoder = triples.Transcoder(par, "latin_1", "utf_8")
+        converted = io.BytesIO()
+        with open(self.path("latin.txt"), "rb") as f:
+            transcoder.convert(f, converted)
+        self.assertIn(FETE.encode("utf_8"), converted.getvalue())
+        with open(self.path("utf8.txt"), "wb") as f:
+            f.write(converted.getvalue())
+        cases = list(triples.NativeReader(par, '""', "latin_1", False).cases(self.path("latin.txt")))
+        moved = transcoder.relocate(par)
+        self.assertEqual(list(triples.NativeReader(moved, '""', "utf_8", False).cases(self.path("utf8.txt"))),
+            cases)
+        self.assertIn(FETE, [value for case in cases for value in case])
+
+    def test_csv(self):
+        # characters split between blocks are converted whole
+        metadatafile = self.latin(EXAMPLE2, DATA2)
+        transcoder = triples.Transcoder(triples.parsemetadata(metadatafile, False), "utf_8", "utf_16_le")
+        with open(DATA2, "rb") as f:
+            data = f.read().replace(b"Nottingham Goose Fair", FETE.encode("utf_8"))
+        converted = io.BytesIO()
+        with mock.patch.object(triples, "TRANSCODECHUNKSIZE", 7):
+            transcoder.convert(io.BytesIO(data), converted)
+        self.assertEqual(converted.getvalue(), data.decode("utf_8").encode("utf_16_le"))
+
+    def test_syntax(self):
+        metadatafile = self.latin(EXAMPLE1, DATA1)
+        syntaxfile = self.path("latin.sps")
+        output = self.runok(metadatafile, "--syntax", syntaxfile, "--dataencoding", "auto")
+        self.assertIn("iso8859-1", output)
+        text = readsyntax(syntaxfile)
+        self.assertIn("ENCODING=UTF8", text)
+        converted = re.search(r'/NAME ="(.*)"', text).group(1)
+        with open(converted, "rb") as f:
+            self.assertIn(FETE.encode("utf_8"), f.read())
+        status, output = self.runmain(EXAMPLE1, "--syntax", syntaxfile, "--dataencoding", "nosuchcodec")
+        self.assertEqual(status, 1, output)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Tests of VALIDATE with and without NumPy"""
+
+import gzip, unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, DATA1
+
+def put(line, pos, text):
+    """Return line with text replacing the bytes from pos"""
+
+    return line[:pos] + text + line[pos + len(text):]
+
+class ValidatorTest(TriplesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with open(DATA1, "rb") as f:
+            good = f.read().splitlines()[0]
+        self.records = [good, put(good, 20, b"7"), put(put(good, 63, b"600"), 22, b"x"),
+            put(put(good, 0, b"abc   "), 62, b"8"), good[:40], put(good, 68, b"1.5e-1 "),
+            put(good, 66, b"2")]
+        self.expected = [
+            (("Q2", "Undefined code"), [1, [2]]),
+            (("Q3", "Not a 0/1 bitstring"), [1, [3]]),
+            (("Q6", "Out of range"), [1, [3]]),
+            (("RESPONDENT_ID", "Not a number"), [1, [4]]),
+            (("Q5", "Undefined code"), [1, [4]]),
+            (("(record)", "Record is shorter than the variable positions"), [1, [5]]),
+            (("Q7", "Undefined code"), [1, [7]])]
+
+    def validate(self, data, arrays):
+        datafile = self.path("data.txt")
+        with open(datafile, "wb") as f:
+            f.write(data)
+        validator = triples.DataValidator(triples.parsemetadata(EXAMPLE1, False), "utf8", arrays=arrays)
+        validator.run(datafile)
+        return validator.nrecords, [(key, validator.problems[key]) for key in validator.order]
+
+    def check(self, arrays):
+        for end, last in ((b"\n", b"\n"), (b"\r\n", b"\r\n"), (b"\n", b"")):
+            data = end.join(self.records) + last
+            self.assertEqual(self.validate(data, arrays), (len(self.records), self.expected))
+        self.assertEqual(self.validate(b"", arrays), (0, []))
+
+    def test_lists(self):
+        self.check(False)
+
+    @unittest.skipUnless(triples.numpyavailable(), "NumPy is not installed")
+    def test_arrays(self):
+        self.check(True)
+
+    def test_compressed(self):
+        # compressed data are read as lists whether NumPy is installed or not
+        datafile = self.path("data.txt.gz")
+        with gzip.open(datafile, "wb") as f:
+            f.write(b"\n".join(self.records) + b"\n")
+        validator = triples.DataValidator(triples.parsemetadata(EXAMPLE1, False), "utf8")
+        validator.run(datafile)
+        self.assertEqual([(key, validator.problems[key]) for key in validator.order], self.expected)
+
+    @unittest.skipUnless(triples.numpyavailable(), "NumPy is not installed")
+    def test_numbers(self):
+        # fields converted by NumPy must agree with float
+        fields = [b"   12", b"12   ", b"-12  ", b" +1.5", b"  .5 ", b"  5. ", b"    .", b"1 2  ", b"- 1  ",
+            b"1e2  ", b"\x001   ", b"\t1   ", b"1.2.3", b"--1  ", b" 0.3 ", b"99999", b"     ", b"nan  "]
+        rows = triples.numpy.array([list(field) for field in fields], dtype=triples.numpy.uint8)
+        for bounds in ((-triples.math.inf, triples.math.inf), (0., 12.), (0.3, 0.5)):
+            passed = triples.numberspassed(bounds)(rows)
+            for field, ok in zip(fields, passed):
+                value = triples.tonumber(field.decode("latin_1").strip())
+                valid = not field.strip(b" ") or (value is not None and bounds[0] <= value <= bounds[1])
+                # a field may be left to be tested but never passed wrongly
+                if ok:
+                    self.assertTrue(valid, field)
+                elif b"e" not in field and b"\x00" not in field and b"\t" not in field \
+                        and b"nan" not in field:
+                    self.assertFalse(valid, field)
+
+if __name__ == "__main__":
+    unittest.main()
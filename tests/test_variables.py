@@ -0,0 +1,95 @@
+"""Tests of reading only selected variables"""
+
+import unittest
+
+from support import triples, TriplesTestCase, EXAMPLE1, EXAMPLE2, DATA1, readsyntax
+
+class SelectionTest(TriplesTestCase):
+
+    def select(self, *selection):
+        par = triples.parsemetadata(EXAMPLE1, False)
+        triples.selectvariables(par, selection)
+        return [var.name for var in par.variables]
+
+    def test_range(self):
+        self.assertEqual(self.select("Q2", "Q4", "TO", "Q5"), ["Q2", "Q4", "Q5"])
+        # a range may be written either way round and by ident
+        self.assertEqual(self.select("Q5", "to", "Q4"), ["Q4", "Q5"])
+        idents = dict((var.name, var.ident) for var in triples.parsemetadata(EXAMPLE1, False).variables)
+        self.assertEqual(self.select(idents["Q4"], "TO", idents["Q5"]), ["Q4", "Q5"])
+
+    def test_member(self):
+        # a member name selects the whole multiple response set
+        self.assertEqual(self.select("Q5_2"), ["Q5"])
+
+    def test_filter(self):
+        # Q8 is filtered by Q7
+        self.assertEqual(self.select("Q8"), ["Q7", "Q8"])
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError) as cm:
+            self.select("Q2", "NOSUCHVARIABLE", "Q4", "TO", "NOSUCHEND")
+        self.assertIn("NOSUCHVARIABLE", str(cm.exception))
+        self.assertIn("Q4 TO NOSUCHEND", str(cm.exception))
+        self.assertRaises(ValueError, self.select, "Q2", "TO")
+
+    def test_syntax(self):
+        syntaxfile = self.path("selected.sps")
+        self.runok(EXAMPLE1, "--syntax", syntaxfile, "--variables", "Q2", "Q4", "TO", "Q5")
+        text = readsyntax(syntaxfile)
+        for name in ("Q2", "Q4", "Q5_1", "Q5_2"):
+            self.assertIn(name, text)
+        for name in ("RESPONDENT_ID", "Q6", "WT"):
+            self.assertNotIn(name, text)
+        status, output = self.runmain(EXAMPLE1, "--syntax", syntaxfile, "--variables", "NOSUCHVARIABLE")
+        self.assertEqual(status, 1)
+        self.assertIn("NOSUCHVARIABLE", output)
+
+    def test_native(self):
+        # the selected columns hold the same values as when everything is read
+        full = triples.parsemetadata(EXAMPLE1, False)
+        reader = triples.NativeReader(full, '""', "utf8", False)
+        names = [name for name, vartype in reader.columns]
+        cases = list(reader.cases(DATA1))
+        for selection in (["Q2", "Q5", "WT"], ["Q8"]):
+            par = triples.parsemetadata(EXAMPLE1, False)
+            triples.selectvariables(par, selection)
+            selected = triples.NativeReader(par, '""', "utf8", False)
+            positions = [names.index(name) for name, vartype in selected.columns]
+            self.assertEqual(list(selected.cases(DATA1)),
+                [[case[i] for i in positions] for case in cases])
+        savfile = self.path("selected.sav")
+        self.runok(EXAMPLE2, "--savfile", savfile, "--variables", "Q2", "TO", "Q4")
+        self.assertGreater(triples.savcases(savfile), 0)
+
+class ValidateSelectionTest(TriplesTestCase):
+
+    def validate(self, arrays):
+        with open(DATA1, "rb") as f:
+            good = f.read().splitlines()[0]
+        # Q2 is undefined in record 2, Q6 out of range in record 3 and record 4 is short
+        records = [good, good[:20] + b"7" + good[21:], good[:63] + b"600" + good[66:], good[:40]]
+        datafile = self.path("data.txt")
+        with open(datafile, "wb") as f:
+            f.write(b"\n".join(records) + b"\n")
+        par = triples.parsemetadata(EXAMPLE1, False)
+        triples.selectvariables(par, ["Q2"])
+        validator = triples.DataValidator(par, "utf8", arrays=arrays)
+        validator.run(datafile)
+        return [(key, validator.problems[key]) for key in validator.order]
+
+    def check(self, arrays):
+        # the records are still checked against the positions of all the variables
+        self.assertEqual(self.validate(arrays), [
+            (("Q2", "Undefined code"), [1, [2]]),
+            (("(record)", "Record is shorter than the variable positions"), [1, [4]])])
+
+    def test_lists(self):
+        self.check(False)
+
+    @unittest.skipUnless(triples.numpyavailable(), "NumPy is not installed")
+    def test_arrays(self):
+        self.check(True)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+"""Benchmark for STATS GET TRIPLES parsing and syntax generation
+
+Synthetic Triple-S studies of any size are generated and the phases
+of the conversion are timed separately:
+    parse       - reading the metadata with metadataHandler
+    parseexpat  - reading the metadata with the expat parser
+    gensyntax   - generating the syntax
+    writesyntax - writing the generated syntax to a file
+
+Each run is appended to a csv results file, and any phase slower than the
+previous run of the same configuration by more than the tolerance is
+reported so that regressions are visible.
+
+Statistics is not needed, e.g.
+    python triplesbench.py --variables 2000 --cases 1000 --results bench.csv
+It can also be run from a BEGIN PROGRAM block by calling main with a list of arguments."""
+
+import argparse, builtins, csv, os, random, shutil, sys, tempfile, time, xml.sax
+from xml.sax.saxutils import escape, quoteattr
+
+# the module is normally run by Statistics, which supplies the translation function
+if not hasattr(builtins, "_"):
+    builtins._ = lambda msg: msg
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import STATS_GET_TRIPLES as triples
+
+WORDS = """survey response visit attraction castle forest museum restaurant cafe
+heritage zone house exit wave frequency other total never sometimes often always
+rating quality value service staff price""".split()
+
+def makelabel(rng, length):
+    """Return a label of about length characters"""
+
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(rng.choice(WORDS))
+    return " ".join(words).capitalize()
+
+class Study(object):
+    """Generator for a synthetic Triple-S study
+
+    pervariable is the number of variables of each type
+    cases is the number of cases
+    recordformat is "fixed" or "csv"
+    mdwidth is the number of categories of each multiple dichotomy variable
+    spread is the number of subfields of each multiple spread variable
+    labellength is the approximate length of labels
+    textlength is the width of the character variables
+    seed is the random number seed"""
+
+    def __init__(self, pervariable=100, cases=1000, recordformat="fixed", mdwidth=20,
+            spread=10, labellength=60, textlength=40, seed=20140131):
+        self.pervariable = pervariable
+        self.cases = cases
+        self.recordformat = recordformat
+        self.mdwidth = mdwidth
+        self.spread = spread
+        self.labellength = labellength
+        self.textlength = textlength
+        self.rng = random.Random(seed)
+        self.variables = self.makevariables()
+
+    def makevariables(self):
+        """Return a list of (type, name, width, codes, subfields) for the study"""
+
+        variables = [("quantity", "RESPID", 8, None, None)]
+        for i in range(self.pervariable):
+            variables.append(("single", "S%d" % i, 2, list(range(1, 13)), None))
+            variables.append(("multiple", "MD%d" % i, self.mdwidth, list(range(1, self.mdwidth + 1)), None))
+            variables.append(("multiple", "SP%d" % i, 2 * self.spread, list(range(1, 51)), self.spread))
+            variables.append(("quantity", "N%d" % i, 6, None, None))
+            variables.append(("character", "C%d" % i, self.textlength, None, None))
+            variables.append(("logical", "L%d" % i, 1, None, None))
+        return variables
+
+    def write(self, directory, name):
+        """Write the metadata and data files and return the metadata file name"""
+
+        metadatafile = os.path.join(directory, name + ".sss")
+        with open(metadatafile, "w", encoding="utf-8") as f:
+            self.writemetadata(f)
+        with open(os.path.join(directory, name + ".txt"), "w", encoding="utf-8", newline="") as f:
+            self.writedata(f)
+        return metadatafile
+
+    def writemetadata(self, f):
+        rng = self.rng
+        csvformat = self.recordformat == "csv"
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<sss version="2.0">\n<survey>\n')
+        f.write('<name>Synthetic</name>\n<title>%s</title>\n' % escape(makelabel(rng, self.labellength)))
+        if csvformat:
+            f.write('<record ident="V" format="csv">\n')
+        else:
+            f.write('<record ident="V">\n')
+        start = 1
+        for ident, (vartype, name, width, codes, subfields) in enumerate(self.variables):
+            f.write('<variable ident="%d" type="%s">\n<name>%s</name>\n<label>%s</label>\n'\
+                % (ident + 1, vartype, name, escape(makelabel(rng, self.labellength))))
+            if csvformat:
+                f.write('<position start="%d"/>\n' % (ident + 1))
+            else:
+                f.write('<position start="%d" finish="%d"/>\n' % (start, start + width - 1))
+            start += width
+            if subfields:
+                f.write('<spread subfields="%d" width="%d"/>\n' % (subfields, width // subfields))
+            if vartype == "quantity":
+                f.write('<values><range from="0" to="%s"/></values>\n' % ("9" * width))
+            elif codes:
+                f.write("<values>\n")
+                for code in codes:
+                    f.write('<value code=%s>%s</value>\n'\
+                        % (quoteattr(str(code)), escape(makelabel(rng, self.labellength))))
+                f.write("</values>\n")
+            elif vartype == "character":
+                f.write('<size>%d</size>\n' % width)
+            f.write("</variable>\n")
+        f.write("</record>\n</survey>\n</sss>\n")
+
+    def writedata(self, f):
+        writer = csv.writer(f, lineterminator="\n")
+        for case in range(self.cases):
+            fields = [self.makefield(case, var) for var in self.variables]
+            if self.recordformat == "csv":
+                writer.writerow([field.strip() for field in fields])
+            else:
+                f.write("".join(fields) + "\n")
+
+    def makefield(self, case, var):
+        """Return the fixed width text for one variable"""
+
+        rng = self.rng
+        vartype, name, width, codes, subfields = var
+        if name == "RESPID":
+            return str(case + 1).rjust(width, "0")
+        if vartype == "single":
+            return str(rng.choice(codes)).rjust(width)
+        if vartype == "multiple" and subfields:
+            chosen = sorted(rng.sample(codes, rng.randint(0, subfields)))
+            cw = width // subfields
+            return "".join(str(code).zfill(cw) for code in chosen).ljust(width)
+        if vartype == "multiple":
+            return "".join(rng.choice("01") for i in range(width))
+        if vartype == "quantity":
+            return str(rng.randint(0, 10 ** width - 1)).rjust(width)
+        if vartype == "logical":
+            return rng.choice("01")
+        return makelabel(rng, rng.randint(0, width))[:width].ljust(width)
+
+# Statistics version the syntax is generated for
+SPSSVER = "spss250"
+
+def timestudy(metadatafile, repeat):
+    """Return a dictionary of the best time in seconds for each phase"""
+
+    times = {"parse": [], "parseexpat": [], "gensyntax": [], "writesyntax": []}
+    mdsetvallabels = {0: "'No'", 1: "'Yes'"}
+    syntaxfile = os.path.splitext(metadatafile)[0] + ".sps"
+    for i in range(repeat):
+        start = time.perf_counter()
+        handler = triples.metadataHandler(removehtml=False)
+        xml.sax.parse(metadatafile, handler)
+        times["parse"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        triples.parsemetadata(metadatafile, False, parser="expat")
+        times["parseexpat"].append(time.perf_counter() - start)
+
+        args = (handler, metadatafile, None, None, "", "locale", 50000, True,
+            mdsetvallabels, False, "if", False, SPSSVER)
+        start = time.perf_counter()
+        for block in triples.gensyntax(*args):
+            pass
+        times["gensyntax"].append(time.perf_counter() - start)
+
+        # the blocks are generated first so that only the writing is timed
+        blocks = list(triples.gensyntax(*args))
+        start = time.perf_counter()
+        triples.processsyntax(blocks, syntaxfile, unicodemode=True)
+        times["writesyntax"].append(time.perf_counter() - start)
+    return dict((phase, min(values)) for phase, values in times.items())
+
+FIELDS = ["timestamp", "version", "python", "format", "variables", "cases", "phase", "seconds"]
+
+def record(resultsfile, rows, tolerance):
+    """Append rows to the results file and report regressions against the previous run"""
+
+    previous = {}
+    if os.path.exists(resultsfile):
+        with open(resultsfile, newline="") as f:
+            for row in csv.DictReader(f):
+                previous[(row["format"], row["variables"], row["cases"], row["phase"])] = float(row["seconds"])
+    regressions = []
+    for row in rows:
+        key = (row["format"], str(row["variables"]), str(row["cases"]), row["phase"])
+        if key in previous and row["seconds"] > previous[key] * (1 + tolerance):
+            regressions.append("%s %s: %.3fs, previously %.3fs" % (row["format"], row["phase"],
+                row["seconds"], previous[key]))
+    newfile = not os.path.exists(resultsfile)
+    with open(resultsfile, "a", newline="") as f:
+        writer = csv.DictWriter(f, FIELDS)
+        if newfile:
+            writer.writeheader()
+        writer.writerows(rows)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark STATS GET TRIPLES")
+    parser.add_argument("--variables", type=int, default=100, help="variables of each type")
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--formats", default="fixed,csv")
+    parser.add_argument("--mdwidth", type=int, default=20, help="multiple dichotomy categories")
+    parser.add_argument("--spread", type=int, default=10, help="multiple spread subfields")
+    parser.add_argument("--labellength", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=20140131)
+    parser.add_argument("--results", default="triplesbench.csv")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+        help="fractional slowdown reported as a regression")
+    parser.add_argument("--keep", help="directory to keep the generated studies in")
+    args = parser.parse_args(argv)
+
+    directory = args.keep or tempfile.mkdtemp(prefix="triplesbench")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    rows = []
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        for recordformat in args.formats.split(","):
+            study = Study(args.variables, args.cases, recordformat, args.mdwidth, args.spread,
+                args.labellength, seed=args.seed)
+            metadatafile = study.write(directory, "synthetic_" + recordformat)
+            for phase, seconds in sorted(timestudy(metadatafile, args.repeat).items()):
+                print("%-6s %-12s %8.3fs" % (recordformat, phase, seconds))
+                rows.append(dict(timestamp=stamp, version=triples.__version__,
+                    python=sys.version.split()[0], format=recordformat, variables=args.variables,
+                    cases=args.cases, phase=phase, seconds=seconds))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    regressions = record(args.results, rows, args.tolerance)
+    for line in regressions:
+        print("REGRESSION " + line)
+    return len(regressions)
+
+if __name__ == "__main__":
+    sys.exit(main())